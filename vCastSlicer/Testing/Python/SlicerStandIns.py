@@ -0,0 +1,328 @@
+import os
+import sys
+import tempfile
+import types
+import unittest
+import xml.etree.ElementTree as ElementTree
+
+#
+# Lightweight stand-ins for the slicer, qt, ctk and vtk modules.
+# They implement just what vCastSlicer.py uses, without a display, so that the module
+# can be imported, set up and timed on a plain Python installation. Widgets are created
+# from the real .ui file, so loading the UI still parses it and connects every widget.
+#
+
+
+class StandInObject:
+    """
+    Object accepting any attribute, call or signal connection.
+    """
+
+    def __init__(self, name='object', **attributes):
+        self.__dict__['_name'] = name
+        self.__dict__.update(attributes)
+
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        value = StandInObject(f'{self._name}.{name}')
+        self.__dict__[name] = value
+        return value
+
+    def __call__(self, *args, **kwargs):
+        return StandInObject(f'{self._name}()')
+
+    def __bool__(self):
+        return True
+
+    def __repr__(self):
+        return f'<stand-in {self._name}>'
+
+
+class StandInWidget(StandInObject):
+    """
+    Widget of a .ui file: keeps its properties and the slots connected to its signals.
+    """
+
+    def __init__(self, className, name, properties=None):
+        super().__init__(name, className=className, connections={}, children=[], currentPath='', checked=False,
+                         enabled=True, toolTip='', text='', value=0)
+        self.__dict__.update(properties or {})
+
+    def connect(self, signal, slot):
+        self.connections.setdefault(signal, []).append(slot)
+        return True
+
+    def disconnect(self, signal, slot):
+        if slot in self.connections.get(signal, []):
+            self.connections[signal].remove(slot)
+
+    def emit(self, signal, *args):
+        for slot in list(self.connections.get(signal, [])):
+            slot(*args)
+
+    def setCurrentPath(self, path):
+        self.currentPath = path
+        self.emit('currentPathChanged(QString)', path)
+
+    def setMRMLScene(self, scene):
+        self.mrmlScene = scene
+
+    def addWidget(self, widget):
+        self.children.append(widget)
+
+
+def _propertyValue(element):
+    """
+    Function to convert a <property> of a .ui file to a Python value.
+    """
+    for child in element:
+        if child.tag in ('string', 'enum', 'set'):
+            return child.text or ''
+        if child.tag == 'number':
+            return int(child.text)
+        if child.tag == 'double':
+            return float(child.text)
+        if child.tag == 'bool':
+            return child.text == 'true'
+    return None
+
+
+def loadUI(path):
+    """
+    Stand-in of slicer.util.loadUI: returns the top-level widget of the .ui file, with all
+    the named widgets as its children.
+    """
+    root = ElementTree.parse(path).getroot()
+    widgets = []
+    for element in root.iter('widget'):
+        properties = {child.get('name'): _propertyValue(child) for child in element if child.tag == 'property'}
+        widgets.append(StandInWidget(element.get('class'), element.get('name'), properties))
+    top = widgets[0]
+    top.children.extend(widgets[1:])
+    return top
+
+
+def childWidgetVariables(widget):
+    return types.SimpleNamespace(**{child._name: child for child in widget.children})
+
+
+class VTKObservationMixin:
+    """
+    Same bookkeeping as slicer.util.VTKObservationMixin, without VTK.
+    """
+
+    def __init__(self):
+        self.Observations = []
+
+    def addObserver(self, obj, event, method, group='none', priority=0.0):
+        self.Observations.append((obj, event, method, group))
+
+    def removeObserver(self, obj, event, method):
+        self.Observations = [o for o in self.Observations if o[:3] != (obj, event, method)]
+
+    def removeObservers(self, method=None):
+        self.Observations = [o for o in self.Observations if method is not None and o[2] != method]
+
+
+class StandInMRMLNode(StandInObject):
+    """
+    Node of the stand-in scene, with the camera properties synced by vCastSlicer.py.
+    """
+
+    def __init__(self, className, nodeID):
+        super().__init__(className, className=className, nodeID=nodeID, position=(0.0, -500.0, 0.0),
+                         focalPoint=(0.0, 0.0, 0.0), viewUp=(0.0, 0.0, 1.0), viewAngle=30.0)
+
+    def IsA(self, className):
+        return className == self.className
+
+    def GetID(self):
+        return self.nodeID
+
+    def GetPosition(self):
+        return self.position
+
+    def SetPosition(self, *position):
+        self.position = tuple(float(value) for value in position)
+
+    def GetFocalPoint(self):
+        return self.focalPoint
+
+    def GetViewUp(self):
+        return self.viewUp
+
+    def GetViewAngle(self):
+        return self.viewAngle
+
+
+class StandInMRMLScene(StandInObject):
+    """
+    Scene holding the nodes added with AddNewNodeByClass. Observers are not invoked.
+    """
+
+    def __init__(self):
+        super().__init__('mrmlScene', StartCloseEvent='StartCloseEvent', EndCloseEvent='EndCloseEvent',
+                         NodeAddedEvent='NodeAddedEvent', NodeRemovedEvent='NodeRemovedEvent', nodes=[])
+
+    def AddNewNodeByClass(self, className):
+        count = sum(node.className == className for node in self.nodes)
+        node = StandInMRMLNode(className, f'{className}{count + 1}')
+        self.nodes.append(node)
+        return node
+
+    def RemoveNode(self, node):
+        self.nodes.remove(node)
+
+    def getNodesByClass(self, className):
+        return [node for node in self.nodes if node.IsA(className)]
+
+
+class ScriptedLoadableModule:
+
+    def __init__(self, parent):
+        self.parent = parent
+
+
+class ScriptedLoadableModuleWidget:
+
+    def __init__(self, parent=None):
+        self.parent = parent if parent is not None else StandInObject('parent', isEntered=False)
+        self.moduleName = type(self).__name__[:-len('Widget')]
+
+    def setup(self):
+        self.layout = StandInWidget('QVBoxLayout', 'layout')
+
+    def resourcePath(self, filename):
+        moduleDir = os.path.dirname(sys.modules[type(self).__module__].__file__)
+        return os.path.join(moduleDir, 'Resources', filename)
+
+
+class ScriptedLoadableModuleLogic:
+
+    def __init__(self, parent=None):
+        self._parameterNode = None
+
+    def getParameterNode(self):
+        if self._parameterNode is None:
+            self._parameterNode = StandInObject('parameterNode')
+        return self._parameterNode
+
+
+class ScriptedLoadableModuleTest(unittest.TestCase):
+
+    def delayDisplay(self, message, msec=0):
+        print(message)
+
+    def runTest(self):
+        pass
+
+
+class QTimer(StandInObject):
+    """
+    Timer that never fires by itself; singleShot callbacks are run by processEvents(), and
+    timeout() emits the signal of a timer instance.
+    """
+    pending = []
+
+    def __init__(self):
+        super().__init__('QTimer')
+        self.active = False
+        self.isSingleShot = False
+        self.slots = []
+
+    def connect(self, signal, slot):
+        if signal == 'timeout()':
+            self.slots.append(slot)
+        return True
+
+    def setSingleShot(self, singleShot):
+        self.isSingleShot = singleShot
+
+    def timeout(self):
+        if self.isSingleShot:
+            self.active = False
+        for slot in list(self.slots):
+            slot()
+
+    def setInterval(self, interval):
+        self.interval = interval
+
+    def start(self, *args):
+        self.active = True
+
+    def stop(self):
+        self.active = False
+
+    @staticmethod
+    def singleShot(msec, callback):
+        QTimer.pending.append(callback)
+
+
+def processEvents():
+    """
+    Function to run the pending singleShot callbacks.
+    """
+    while QTimer.pending:
+        QTimer.pending.pop(0)()
+
+
+def install(settingsDir=None):
+    """
+    Function to register the stand-in modules in sys.modules. Returns the slicer module.
+    settingsDir is where the module settings file is written (a new temporary directory by default).
+    """
+    settingsDir = settingsDir or tempfile.mkdtemp(prefix='vCastSlicerStandIns')
+
+    qt = types.ModuleType('qt')
+    qt.QTimer = QTimer
+    qt.QProgressBar = lambda *args: StandInWidget('QProgressBar', 'progressBar')
+    qt.QIcon = lambda *args: StandInObject('QIcon')
+    qt.QPoint = lambda x=0, y=0: StandInObject('QPoint', x=lambda: x, y=lambda: y)
+    qt.QMessageBox = type('QMessageBox', (StandInObject,), {
+        'Ok': 0x400, 'Cancel': 0x400000,
+        '__init__': lambda self, *args: StandInObject.__init__(self, 'QMessageBox'),
+        'exec': lambda self: 0x400,
+    })
+
+    ctk = types.ModuleType('ctk')
+
+    vtk = types.ModuleType('vtk')
+    vtk.VTK_OBJECT = 'vtkObject'
+    vtk.vtkCommand = types.SimpleNamespace(ModifiedEvent='ModifiedEvent', EndEvent='EndEvent')
+
+    def calldata_type(calldataType):
+        def decorator(method):
+            method.CallDataType = calldataType
+            return method
+        return decorator
+    vtk.calldata_type = calldata_type
+
+    slicer = types.ModuleType('slicer')
+    slicer.mrmlScene = StandInMRMLScene()
+    mainToolBar = StandInObject('ModuleToolBar', actions=lambda: [])
+    slicer.app = StandInObject(
+        'app', slicerUserSettingsFilePath=os.path.join(settingsDir, 'Slicer.ini'),
+        extensionsInstallPath=os.path.join(settingsDir, 'Extensions-1'),
+        commandOptions=lambda: types.SimpleNamespace(noMainWindow=True),
+        processEvents=processEvents)
+    util = types.ModuleType('slicer.util')
+    util.VTKObservationMixin = VTKObservationMixin
+    util.loadUI = loadUI
+    util.childWidgetVariables = childWidgetVariables
+    util.mainWindow = lambda: StandInObject('mainWindow')
+    util.findChild = lambda widget, name: mainToolBar
+    util.getNodesByClass = slicer.mrmlScene.getNodesByClass
+    util.errorDisplay = lambda message, *args, **kwargs: print(f'Error: {message}')
+    util.showStatusMessage = lambda message, *args: None
+    slicer.util = util
+    scripted = types.ModuleType('slicer.ScriptedLoadableModule')
+    for cls in (ScriptedLoadableModule, ScriptedLoadableModuleWidget, ScriptedLoadableModuleLogic,
+                ScriptedLoadableModuleTest):
+        setattr(scripted, cls.__name__, cls)
+    scripted.__all__ = [cls for cls in dir(scripted) if cls.startswith('Scripted')]
+    slicer.ScriptedLoadableModule = scripted
+
+    sys.modules.update({'qt': qt, 'ctk': ctk, 'vtk': vtk, 'slicer': slicer, 'slicer.util': util,
+                        'slicer.ScriptedLoadableModule': scripted})
+    return slicer
@@ -0,0 +1,256 @@
+import argparse
+import compileall
+import importlib
+import json
+import os
+import platform
+import stat
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+#
+# Headless benchmark and regression suite of the vCastSlicer module.
+# Runs on plain Python (no Slicer, no display) with the stand-ins of SlicerStandIns.py and
+# times the paths users wait on: importing the module (also in a new interpreter, as at
+# Slicer startup), creating it, adding its toolbar icon, setting up the widget, saving the
+# vCastSender path and launching vCastSender. Results are written as JSON and compared with
+# a baseline; the run fails if a timing regressed beyond the tolerance, if importing the
+# module loads more than vCastSlicerLib.startup (the rest must be imported on first use), or
+# if the module directory has other scripts than vCastSlicer.py (Slicer would load them too).
+#
+#   python vCastSlicerBenchmark.py                     # compare with Baseline/vCastSlicerBenchmark.json
+#   python vCastSlicerBenchmark.py --update-baseline   # store the current timings as the baseline
+#   python vCastSlicerBenchmark.py --tests             # also run vCastSlicerTest headless
+#
+
+TESTING_DIR = os.path.dirname(os.path.abspath(__file__))
+MODULE_DIR = os.path.dirname(os.path.dirname(TESTING_DIR))
+DEFAULT_BASELINE = os.path.join(TESTING_DIR, 'Baseline', 'vCastSlicerBenchmark.json')
+# vCastSlicerLib modules that may be loaded by the import of vCastSlicer
+STARTUP_MODULES = {'vCastSlicerLib', 'vCastSlicerLib.startup'}
+# Run in a new interpreter: prints the seconds spent importing vCastSlicer
+COLD_IMPORT_SCRIPT = '''
+import sys, time
+sys.path[:0] = [{testingDir!r}, {moduleDir!r}]
+import SlicerStandIns
+SlicerStandIns.install({settingsDir!r})
+start = time.perf_counter()
+import vCastSlicer
+print(time.perf_counter() - start)
+'''
+
+sys.path.insert(0, TESTING_DIR)
+sys.path.insert(0, MODULE_DIR)
+import SlicerStandIns
+
+
+def timeit(function, repeat, setup=None):
+    """
+    Function to run function() repeat times (after setup(), not timed). Returns the timings.
+    """
+    timings = []
+    for _ in range(repeat):
+        arguments = setup() if setup is not None else ()
+        start = time.perf_counter()
+        function(*arguments)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def importModule():
+    """
+    Function to import vCastSlicer and vCastSlicerLib from scratch (numpy and the standard
+    library stay loaded, as they are in Slicer).
+    """
+    for name in [name for name in sys.modules if name == 'vCastSlicer' or name.startswith('vCastSlicerLib')]:
+        del sys.modules[name]
+    return importlib.import_module('vCastSlicer')
+
+
+def coldImport(settingsDir):
+    """
+    Function to import vCastSlicer in a new interpreter, where nothing but the stand-ins is
+    loaded (as at Slicer startup, numpy included). Returns the seconds spent in the import.
+    """
+    script = COLD_IMPORT_SCRIPT.format(testingDir=TESTING_DIR, moduleDir=MODULE_DIR, settingsDir=settingsDir)
+    output = subprocess.run([sys.executable, '-c', script], check=True, capture_output=True, text=True).stdout
+    return float(output.split()[-1])
+
+
+def eagerImports():
+    """
+    Function to list the vCastSlicerLib modules loaded by the import of vCastSlicer that
+    should only be loaded on first use.
+    """
+    importModule()
+    return sorted(name for name in sys.modules if name.startswith('vCastSlicerLib') and name not in STARTUP_MODULES)
+
+
+def extraScripts():
+    """
+    Function to list the scripts of the module directory other than vCastSlicer.py. Slicer
+    imports every script of the scripted modules directory at startup, as a module.
+    """
+    return sorted(name for name in os.listdir(MODULE_DIR) if name.endswith('.py') and name != 'vCastSlicer.py')
+
+
+def fakeSender(directory):
+    """
+    Function to write an executable that stays open like vCastSender does.
+    """
+    path = os.path.join(directory, 'vCastSender')
+    with open(path, 'w') as f:
+        f.write('#!/bin/sh\nexec sleep 60\n')
+    os.chmod(path, os.stat(path).st_mode | stat.S_IXUSR)
+    return path
+
+
+def runBenchmarks(workDir, repeat=20):
+    """
+    Times the module paths (the stand-ins must be installed). Returns {name: [seconds, ...]}.
+    """
+    timings = {}
+
+    timings['moduleImport'] = timeit(importModule, repeat)
+    # New interpreters are slow to start, a few of them are enough
+    timings['coldImport'] = [coldImport(workDir) for _ in range(max(repeat//4, 1))]
+    module = importModule()
+    from vCastSlicerLib.process import READY
+
+    logic = module.vCastSlicerLogic()
+    paths = iter(range(repeat))
+    timings['settingsSave'] = timeit(lambda: logic.setVCastSenderPath(f'C:/ViewSonic/{next(paths)}/vCastSender.exe'),
+                                     repeat)
+
+    # Module creation at Slicer startup, including the first read of the settings file
+    def resetSettings():
+        module._settings = None
+        return (SlicerStandIns.StandInObject('parent'),)
+    timings['moduleCreation'] = timeit(module.vCastSlicer, repeat, resetSettings)
+
+    # Work done once Slicer has started: toolbar icon, then the SlicerVR check (cached result)
+    vCastSlicerModule = module.vCastSlicer(SlicerStandIns.StandInObject('parent'))
+    module.vCastSlicerSettings().set('SlicerVirtualReality', {'installed': True, 'checkedAt': time.time()})
+
+    def startupCompleted():
+        vCastSlicerModule.onStartupCompleted()
+        vCastSlicerModule.checkSlicerVR()
+    def resetToolbarIcon():
+        module._toolbarAction = None
+        return ()
+    timings['startupCompleted'] = timeit(startupCompleted, repeat, resetToolbarIcon)
+    SlicerStandIns.QTimer.pending.clear()
+
+    def setupWidget():
+        widget = module.vCastSlicerWidget()
+        widget.setup()
+    timings['widgetSetup'] = timeit(setupWidget, repeat)
+
+    def newWidget():
+        widget = module.vCastSlicerWidget()
+        widget.layout = SlicerStandIns.StandInWidget('QVBoxLayout', 'layout')
+        return (widget,)
+    timings['loadUI'] = timeit(lambda widget: widget._loadUI(), repeat, newWidget)
+
+    # Launch until the supervisor reports the sender ready, polled like the Qt timer does
+    senderPath = fakeSender(workDir)
+
+    def launch():
+        module.launchVCastSender(senderPath)
+        while module.vCastSenderSupervisor().state != READY:
+            module._pollVCastSender()
+    timings['senderLaunch'] = timeit(launch, repeat, lambda: module.vCastSenderSupervisor().stop() or ())
+    module.vCastSenderSupervisor().stop()
+    return timings
+
+
+def summarize(timings):
+    return {name: {'median': statistics.median(values), 'min': min(values), 'max': max(values)}
+            for name, values in timings.items()}
+
+
+def compareWithBaseline(results, baseline, tolerance, slack):
+    """
+    Function to list the benchmarks whose median is above tolerance times the baseline median
+    (plus slack seconds, so that sub-millisecond timings don't fail on noise).
+    """
+    regressions = []
+    for name, reference in baseline['results'].items():
+        if name not in results:
+            regressions.append(f"{name}: missing from the results")
+            continue
+        limit = reference['median']*tolerance + slack
+        if results[name]['median'] > limit:
+            regressions.append(f"{name}: {1000*results[name]['median']:.2f} ms > {1000*limit:.2f} ms"
+                               f" (baseline {1000*reference['median']:.2f} ms)")
+    return regressions
+
+
+def runTests():
+    """
+    Function to run the tests of the module (vCastSlicerTest) with the stand-ins.
+    """
+    module = importModule()
+    test = module.vCastSlicerTest()
+    test.setUp()
+    test.runTest()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Headless benchmark of the vCastSlicer module.")
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--output', default=None, help="Where to write the results (JSON)")
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--update-baseline', action='store_true')
+    parser.add_argument('--tolerance', type=float, default=2.0, help="Allowed ratio to the baseline medians")
+    parser.add_argument('--slack', type=float, default=0.002, help="Allowed extra seconds")
+    parser.add_argument('--tests', action='store_true', help="Also run vCastSlicerTest")
+    args = parser.parse_args(argv)
+
+    # Time the loading of the module, not its compilation (bytecode may not be written on import,
+    # e.g. with PYTHONDONTWRITEBYTECODE)
+    compileall.compile_dir(MODULE_DIR, quiet=1)
+    workDir = tempfile.mkdtemp(prefix='vCastSlicerBenchmark')
+    SlicerStandIns.install(workDir)
+    if args.tests:
+        runTests()
+    eager = eagerImports()
+    extra = extraScripts()
+    results = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'repeat': args.repeat,
+        'results': summarize(runBenchmarks(workDir, args.repeat)),
+    }
+    for name, result in results['results'].items():
+        print(f"{name:>16}: median {1000*result['median']:8.2f} ms (min {1000*result['min']:.2f}, max {1000*result['max']:.2f})")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    if eager:
+        print(f"EAGER IMPORT of {', '.join(eager)} by vCastSlicer (import them where they are used)")
+        return 1
+    if extra:
+        print(f"EXTRA SCRIPT {', '.join(extra)} in the module directory (move it to vCastSlicerLib)")
+        return 1
+    if args.update_baseline:
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Baseline written to {args.baseline}")
+        return 0
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}, run with --update-baseline to create it")
+        return 0
+    with open(args.baseline) as f:
+        regressions = compareWithBaseline(results['results'], json.load(f), args.tolerance, args.slack)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
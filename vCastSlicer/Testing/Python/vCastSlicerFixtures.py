@@ -0,0 +1,326 @@
+import bisect
+import heapq
+import math
+import os
+import random
+import sys
+import numpy
+from vCastSlicerLib.prerender import readPoses, renderChunk
+from vCastSlicerLib.ratecontrol import qualityFactor
+from vCastSlicerLib.zones import UNKNOWN
+
+#
+# Synthetic data and simulations of the tests (vCastSlicerTest) and of the benchmarks of
+# vCastSlicerLib (vCastSlicerLibBenchmark.py): Slicer window frames, review sessions,
+# network links, parcellations, volumes, meshes and a CPU renderer standing for Slicer.
+# They are not installed with the module.
+#
+
+TESTING_DIR = os.path.dirname(os.path.abspath(__file__))
+MODULE_DIR = os.path.dirname(os.path.dirname(TESTING_DIR))
+
+
+#
+# Frames of the Slicer window (vCastSlicerLib.deltacodec)
+#
+
+# Typical layouts, as (name, list of changing regions). Regions are (x, y, width, height)
+# fractions of the screen; everything else (toolbars, module panel, other views) is static.
+LAYOUTS = {
+    # Four-up layout with only the 3D view being rotated
+    'FourUp': [(0.25, 0.08, 0.375, 0.46)],
+    # Conventional layout while scrolling through one slice view
+    'Conventional': [(0.25, 0.6, 0.25, 0.4)],
+    # 3D only layout with the view being rotated
+    'OneUp3D': [(0.25, 0.08, 0.75, 0.92)],
+    # Nothing but the mouse cursor moves
+    'Static': [(0.5, 0.5, 0.01, 0.02)],
+}
+
+
+def syntheticFrames(layout, width, height, count, seed=0):
+    """
+    Generator of frames emulating a Slicer window where only the regions of the layout change.
+    """
+    rng = numpy.random.default_rng(seed)
+    # Smooth static background (panels, toolbars) with some texture so it isn't trivial to compress
+    y, x = numpy.mgrid[0:height, 0:width]
+    base = numpy.stack([(x//7) % 256, (y//5) % 256, ((x + y)//11) % 256], axis=-1).astype(numpy.uint8)
+    for i in range(count):
+        frame = base.copy()
+        for fx, fy, fw, fh in LAYOUTS[layout]:
+            x0, y0 = int(fx*width), int(fy*height)
+            w, h = max(int(fw*width), 1), max(int(fh*height), 1)
+            # Moving gradient plus a bit of noise, like a rotating rendering
+            gradient = ((x[y0:y0 + h, x0:x0 + w] + 3*i) % 256).astype(numpy.uint8)
+            noise = rng.integers(0, 8, size=gradient.shape, dtype=numpy.uint8)
+            frame[y0:y0 + h, x0:x0 + w] = (gradient + noise)[..., None]
+        yield frame
+
+
+#
+# Scene changes of a review session (vCastSlicerLib.statesync, vCastSlicerLib.recorder)
+#
+
+def simulateReviewSession(encoder, step, frameRate):
+    """
+    Function to apply the changes of one display frame of a typical SEEG review session:
+    the 3D view orbits continuously, one slice view is scrolled in bursts, electrode
+    visibility is toggled every 2 s and the electrode transform is nudged every second.
+    """
+    t = step/frameRate
+    angle = 0.5*t
+    encoder.setCamera('vtkMRMLCameraNode1', (300*math.cos(angle), 300*math.sin(angle), 50), (0, 0, 0), (0, 0, 1), 30)
+    if int(t) % 4 < 2:
+        encoder.setSliceOffset('vtkMRMLSliceNodeRed', -40 + 10*t % 80)
+    encoder.setDisplay('vtkMRMLMarkupsDisplayNode1', int(t/2) % 2 == 0, 1.0)
+    encoder.setDisplay('vtkMRMLModelDisplayNode4', True, 0.3 + 0.1*(int(t) % 3))
+    encoder.setTransform('vtkMRMLLinearTransformNode1', (1, 0, 0, int(t), 0, 1, 0, 0, 0, 0, 1, 0, 0, 0, 0, 1))
+
+
+#
+# Simulated link (vCastSlicerLib.ratecontrol)
+#
+
+def stepTrace(steps):
+    """
+    Function to make a bandwidth trace from [(time, bytesPerSecond), ...] steps.
+    """
+    times = [t for t, _ in steps]
+
+    def bandwidth(t):
+        return steps[max(bisect.bisect_right(times, t) - 1, 0)][1]
+    bandwidth.steps = steps
+    return bandwidth
+
+
+def wifiTrace(duration=60.0, mean=4e6/8, seed=0):
+    """
+    Function to make a hospital Wi-Fi like trace: bandwidth drifting around mean, with deep
+    fades of a few seconds.
+    """
+    rng = random.Random(seed)
+    steps = []
+    bandwidth = mean
+    t = 0.0
+    while t < duration:
+        bandwidth = min(max(bandwidth*math.exp(rng.gauss(0, 0.25)), mean/8), mean*3)
+        fade = rng.random() < 0.1
+        steps.append((t, bandwidth/6 if fade else bandwidth))
+        t += rng.uniform(1.0, 4.0)
+    return stepTrace(steps)
+
+
+# Bytes of a 1080p four-up layout frame as JPEG quality 100
+FULL_FRAME_BYTES = 250000
+
+
+def simulateLink(bandwidth, duration=60.0, controller=None, level=None, captureRate=60, fullFrameBytes=None,
+                 baseRtt=0.02, latencyBudget=0.25, maxQueue=2, seed=0):
+    """
+    Replays a bandwidth trace (function of time, bytes per second) through a bottleneck link.
+    Frames are captured at captureRate, filtered by the frame rate of the level, sized like
+    JPEG frames (fullFrameBytes at full resolution and quality 100), queued in the link (and
+    dropped beyond maxQueue frames in flight) and acknowledged baseRtt/2 after delivery.
+    A fixed level can be given instead of a controller. Returns the statistics of the run.
+    """
+    rng = random.Random(seed)
+    fullFrameBytes = fullFrameBytes or FULL_FRAME_BYTES
+    linkFree = 0.0
+    inFlight = []
+    acks = []
+    frames = []
+    drops = 0
+    lastSent = -math.inf
+    for step in range(int(duration*captureRate)):
+        now = step/captureRate
+        while acks and acks[0][0] <= now:
+            ackTime, size, rtt = heapq.heappop(acks)
+            controller.onAck(size, rtt, ackTime)
+        inFlight = [departure for departure in inFlight if departure > now]
+        if controller is not None:
+            if not controller.wantsFrame(now):
+                continue
+            current = controller.level
+        else:
+            if now - lastSent < 0.9/level.frameRate:
+                continue
+            lastSent = now
+            current = level
+        if len(inFlight) >= maxQueue:
+            drops += 1
+            if controller is not None:
+                controller.onDrop(now)
+            continue
+        size = fullFrameBytes*current.scale**2*qualityFactor(current.quality)*rng.uniform(0.85, 1.15)
+        departure = max(now, linkFree) + size/bandwidth(max(now, linkFree))
+        linkFree = departure
+        inFlight.append(departure)
+        displayLatency = departure + baseRtt/2 - now
+        frames.append((now, size, displayLatency, current))
+        if controller is not None:
+            controller.onFrameSent(size, now)
+            heapq.heappush(acks, (departure + baseRtt, size, departure + baseRtt - now))
+    missed = sum(1 for _, _, latency, _ in frames if latency > latencyBudget)
+    return {
+        'frames': frames,
+        'sent': len(frames),
+        'dropped': drops,
+        'missedDeadline': missed,
+        'meanLatencyMs': 1000*sum(latency for _, _, latency, _ in frames)/len(frames) if frames else None,
+        'meanScale': sum(level.scale for *_, level in frames)/len(frames) if frames else None,
+        'meanQuality': sum(level.quality for *_, level in frames)/len(frames) if frames else None,
+        'meanFrameRate': len(frames)/duration,
+    }
+
+
+#
+# Label volumes (vCastSlicerLib.zones)
+#
+
+def classifyLoop(labels, rasToIjk, table, points):
+    """
+    Naive reference: one matrix-vector product and one dictionary lookup per point.
+    """
+    rasToIjk = numpy.asarray(rasToIjk, dtype=numpy.float64).reshape(4, 4)
+    shortNames, fullNames = [], []
+    for point in points:
+        i, j, k = (int(round(c)) for c in rasToIjk.dot([point[0], point[1], point[2], 1.0])[:3])
+        value = -1
+        if 0 <= i < labels.shape[2] and 0 <= j < labels.shape[1] and 0 <= k < labels.shape[0]:
+            value = int(labels[k, j, i])
+        names = table.get(value, UNKNOWN)
+        shortNames.append(names[0])
+        fullNames.append(names[1])
+    return shortNames, fullNames
+
+
+def syntheticParcellation(zoneNames, shape=(256, 256, 256), blockSize=16, seed=0):
+    """
+    Function to make a FreeSurfer-like label volume (1 mm voxels, blocks of random labels)
+    with its color names. Returns (labels, rasToIjk, colorNames).
+    """
+    colorNames = {0: 'Unknown', 2: 'Left-Cerebral-White-Matter', 41: 'Right-Cerebral-White-Matter',
+                  17: 'Left-Hippocampus', 53: 'Right-Hippocampus', 18: 'Left-Amygdala', 54: 'Right-Amygdala'}
+    for i, (shortName, fullName) in enumerate(zoneNames['parc2009']):
+        colorNames[11101 + i] = 'ctx_lh_' + fullName
+        colorNames[12101 + i] = 'ctx_rh_' + fullName
+    for i, (shortName, fullName) in enumerate(zoneNames['parc68']):
+        colorNames[1001 + i] = 'ctx-lh-' + fullName
+        colorNames[2001 + i] = 'ctx-rh-' + fullName
+    rng = numpy.random.default_rng(seed)
+    values = numpy.array(sorted(colorNames), dtype=numpy.int16)
+    blocks = rng.choice(values, size=tuple(-(-n//blockSize) for n in shape))
+    labels = numpy.repeat(numpy.repeat(numpy.repeat(blocks, blockSize, 0), blockSize, 1), blockSize, 2)
+    labels = numpy.ascontiguousarray(labels[:shape[0], :shape[1], :shape[2]])
+    # LPS-like orientation centered on the volume, as for a FreeSurfer conformed volume
+    rasToIjk = numpy.array([[-1, 0, 0, shape[2]/2], [0, 0, -1, shape[1]/2], [0, 1, 0, shape[0]/2], [0, 0, 0, 1]],
+                           dtype=numpy.float64)
+    return labels, rasToIjk, colorNames
+
+
+#
+# Volumes (vCastSlicerLib.pyramid)
+#
+
+def syntheticVolume(shape=(256, 512, 512), seed=0):
+    """
+    Function to make a CT-like int16 volume: smooth structures plus noise.
+    """
+    rng = numpy.random.default_rng(seed)
+    k, j, i = numpy.ogrid[:shape[0], :shape[1], :shape[2]]
+    body = ((k - shape[0]/2)**2/(shape[0]/2.2)**2 + (j - shape[1]/2)**2/(shape[1]/2.5)**2
+            + (i - shape[2]/2)**2/(shape[2]/2.2)**2) < 1
+    volume = numpy.where(body, 40, -1000).astype(numpy.int16)
+    volume += rng.integers(-20, 20, size=shape, dtype=numpy.int16)
+    return volume
+
+
+#
+# Meshes (vCastSlicerLib.meshlod)
+#
+
+def sphereMesh(rows=400, columns=410, folds=12, seed=0):
+    """
+    Function to make a cortex-like closed surface: a sphere with folds (2*rows*columns triangles).
+    """
+    rng = numpy.random.default_rng(seed)
+    theta = numpy.linspace(0, numpy.pi, rows + 1)[1:-1]
+    phi = numpy.linspace(0, 2*numpy.pi, columns, endpoint=False)
+    theta, phi = numpy.meshgrid(theta, phi, indexing='ij')
+    radius = 70*(1 + 0.06*numpy.sin(folds*theta + rng.uniform(0, 6))*numpy.sin(folds*phi))
+    ring = numpy.stack([radius*numpy.sin(theta)*numpy.cos(phi), radius*numpy.sin(theta)*numpy.sin(phi),
+                        radius*numpy.cos(theta)], axis=-1).reshape(-1, 3)
+    points = numpy.vstack([ring, [[0, 0, 70], [0, 0, -70]]])
+    north, south = len(ring), len(ring) + 1
+    r, c = numpy.meshgrid(numpy.arange(rows - 2), numpy.arange(columns), indexing='ij')
+    a = r*columns + c
+    b = r*columns + (c + 1) % columns
+    quads = numpy.concatenate([numpy.stack([a, b, a + columns], -1).reshape(-1, 3),
+                               numpy.stack([b, b + columns, a + columns], -1).reshape(-1, 3)])
+    c = numpy.arange(columns)
+    caps = numpy.concatenate([numpy.stack([numpy.full(columns, north), (c + 1) % columns, c], -1),
+                              numpy.stack([numpy.full(columns, south), (rows - 2)*columns + c,
+                                           (rows - 2)*columns + (c + 1) % columns], -1)])
+    return points.astype(numpy.float32), numpy.concatenate([quads, caps]).astype(numpy.int32)
+
+
+#
+# Rendering (vCastSlicerLib.prerender)
+#
+
+class SyntheticRenderer:
+    """
+    CPU renderer of a point cloud (a folded surface with electrodes) standing for Slicer in
+    the benchmark and the tests: each frame is a z-buffered perspective projection.
+    """
+
+    def __init__(self, width=640, height=360, pointCount=200000, seed=0):
+        self.width = width
+        self.height = height
+        rng = numpy.random.default_rng(seed)
+        directions = rng.normal(size=(pointCount, 3))
+        directions /= numpy.linalg.norm(directions, axis=1)[:, None]
+        folds = 1 + 0.08*numpy.sin(9*directions[:, 0])*numpy.cos(11*directions[:, 1])
+        self.points = directions*folds[:, None]*numpy.array([70.0, 85.0, 60.0])
+        shade = (130 + 100*directions[:, 2]).clip(0, 255)
+        self.colors = numpy.stack([shade, 0.7*shade, 0.6*shade], axis=1).astype(numpy.uint8)
+
+    def __call__(self, pose):
+        position = numpy.asarray(pose['position'])
+        forward = numpy.asarray(pose['focalPoint']) - position
+        forward /= numpy.linalg.norm(forward)
+        right = numpy.cross(forward, pose['viewUp'])
+        right /= numpy.linalg.norm(right)
+        up = numpy.cross(right, forward)
+        relative = self.points - position
+        depth = relative @ forward
+        visible = depth > 1e-3
+        focal = 0.5*self.height/math.tan(math.radians(15))
+        x = (focal*(relative[visible] @ right)/depth[visible] + self.width/2).astype(numpy.int64)
+        y = (self.height/2 - focal*(relative[visible] @ up)/depth[visible]).astype(numpy.int64)
+        inside = (x >= 0) & (x < self.width) & (y >= 0) & (y < self.height)
+        pixels = (y*self.width + x)[inside]
+        # Farthest first: the nearest point of each pixel is written last
+        order = numpy.argsort(-depth[visible][inside], kind='stable')
+        frame = numpy.full((self.height*self.width, 3), 20, dtype=numpy.uint8)
+        frame[pixels[order]] = self.colors[visible][inside][order]
+        return frame.reshape(self.height, self.width, 3)
+
+
+def syntheticWorker(argv):
+    """
+    Function run by the benchmark workers: posesFile outputDir start stop width height.
+    """
+    posesFile, outputDir, start, stop, width, height = argv
+    renderChunk(SyntheticRenderer(int(width), int(height)), readPoses(posesFile), int(start), int(stop), outputDir)
+
+
+def syntheticCommand(posesFile, outputDir, width, height):
+    """
+    Function to get the command of a benchmark worker for a range of frames.
+    """
+    code = ('import sys; sys.path[:0] = sys.argv[1:3]; from vCastSlicerFixtures import syntheticWorker;'
+            ' syntheticWorker(sys.argv[3:])')
+    return lambda start, stop: [sys.executable, '-c', code, TESTING_DIR, MODULE_DIR, posesFile, outputDir,
+                                str(start), str(stop), str(width), str(height)]
@@ -0,0 +1,729 @@
+import argparse
+import concurrent.futures
+import multiprocessing
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import numpy
+
+#
+# Benchmarks of the vCastSlicerLib modules, on synthetic data (see vCastSlicerFixtures.py).
+# Each one prints what its module was written for: bytes and encode time of the delta codec,
+# frames delivered to many viewers, latency of the shared-memory ring, bandwidth of the
+# state sync, cost of the telemetry, adaptation to the link, speed of the zone labeling,
+# pyramid and mesh level builds, pre-rendering and session recording.
+#
+#   python vCastSlicerLibBenchmark.py                        # all the modules
+#   python vCastSlicerLibBenchmark.py deltacodec recorder    # some of them
+#
+
+TESTING_DIR = os.path.dirname(os.path.abspath(__file__))
+MODULE_DIR = os.path.dirname(os.path.dirname(TESTING_DIR))
+
+sys.path.insert(0, TESTING_DIR)
+sys.path.insert(0, MODULE_DIR)
+from vCastSlicerFixtures import (FULL_FRAME_BYTES, LAYOUTS, classifyLoop, simulateLink, simulateReviewSession,
+                                 sphereMesh, stepTrace, syntheticCommand, syntheticFrames, syntheticParcellation,
+                                 syntheticVolume, wifiTrace)
+from vCastSlicerLib.deltacodec import TileDeltaDecoder, TileDeltaEncoder
+from vCastSlicerLib.framering import FrameRingReader, FrameRingWriter
+from vCastSlicerLib.meshlod import DISPLAY_TRIANGLE_BUDGETS, MeshLODCache, chooseLevels
+from vCastSlicerLib.prerender import (FrameSequenceReader, chunkRanges, mergeIndex, runChunks, turntablePoses,
+                                      writePoses)
+from vCastSlicerLib.pyramid import DISPLAY_VOXEL_BUDGETS, PyramidCache, contentHash
+from vCastSlicerLib.ratecontrol import RateController, RateLimits
+from vCastSlicerLib.recorder import INDEX_SUFFIX, SessionReader, SessionRecorder
+from vCastSlicerLib.statesync import StateSyncReceiver, StateSyncServer, iterPackets
+from vCastSlicerLib.streaming import JPEGEncoder, StreamServer, iterStream
+from vCastSlicerLib.telemetry import Telemetry
+from vCastSlicerLib.zones import ZoneLabeler, labelTable, loadZoneNames
+
+
+#
+# vCastSlicerLib.deltacodec
+#
+
+RESOLUTIONS = {'1080p': (1920, 1080), '4K': (3840, 2160)}
+
+
+def benchmarkCodec(frameCount=30, layouts=None, resolutions=None, baselineEncoder=None, tileSize=64):
+    """
+    Compares the delta codec with full-frame encoding (JPEG by default) for typical layouts.
+    Returns a list of dicts with the bytes per frame and encode time per frame (ms) of both.
+    """
+    if baselineEncoder is None:
+        baselineEncoder = JPEGEncoder(75)
+    results = []
+    for resolutionName in (resolutions or RESOLUTIONS):
+        width, height = RESOLUTIONS[resolutionName]
+        for layout in (layouts or LAYOUTS):
+            frames = list(syntheticFrames(layout, width, height, frameCount))
+            encoder = TileDeltaEncoder(tileSize, keyframeInterval=0)
+            row = {'layout': layout, 'resolution': resolutionName}
+            for name, encode in (('delta', encoder), ('baseline', baselineEncoder)):
+                totalBytes = 0
+                start = time.perf_counter()
+                for frame in frames:
+                    totalBytes += len(encode(frame))
+                elapsed = time.perf_counter() - start
+                row[f'{name}BytesPerFrame'] = totalBytes/frameCount
+                row[f'{name}MsPerFrame'] = 1000*elapsed/frameCount
+            results.append(row)
+    return results
+
+
+def reportCodec():
+    for row in benchmarkCodec():
+        print(f"{row['resolution']:>6} {row['layout']:<13}"
+              f" delta: {row['deltaBytesPerFrame']/1024:9.1f} KiB {row['deltaMsPerFrame']:7.2f} ms |"
+              f" baseline: {row['baselineBytesPerFrame']/1024:9.1f} KiB {row['baselineMsPerFrame']:7.2f} ms")
+
+
+#
+# vCastSlicerLib.fanout
+#
+
+def benchmarkFanout(clientCounts=(1, 2, 4, 8, 16), seconds=2.0, width=1920, height=1080, frameRate=30,
+                    encoder=None, slowClients=0, slowDelay=0.2):
+    """
+    Serves synthetic frames over HTTP to N local clients (slowClients of them sleeping slowDelay
+    seconds per frame, like a board on Wi-Fi) and reports aggregate throughput and per-client latency.
+    """
+    results = []
+    frames = [numpy.full((height, width, 3), i*40, dtype=numpy.uint8) for i in range(4)]
+    for clientCount in clientCounts:
+        server = StreamServer(port=0, frameRate=frameRate, encoder=encoder or (lambda frame: frame[::8, ::8].tobytes()))
+        server.start()
+        stop = threading.Event()
+        received = [[] for _ in range(clientCount)]
+
+        def consume(i):
+            delay = slowDelay if i < slowClients else 0.0
+            for index, timestamp, data in iterStream(server.url, timeout=seconds + 5):
+                received[i].append((time.time() - timestamp, len(data)))
+                if stop.is_set():
+                    return
+                if delay:
+                    time.sleep(delay)
+
+        threads = [threading.Thread(target=consume, args=(i,), daemon=True) for i in range(clientCount)]
+        for thread in threads:
+            thread.start()
+        while server.clientCount < clientCount:
+            time.sleep(0.01)
+        start = time.monotonic()
+        published = 0
+        while time.monotonic() - start < seconds:
+            server.publish(frames[published % len(frames)])
+            published += 1
+            time.sleep(max(0.0, start + published/frameRate - time.monotonic()))
+        stop.set()
+        elapsed = time.monotonic() - start
+        # One more frame so that the clients waiting on the socket notice the stop
+        server.publish(frames[0])
+        for thread in threads:
+            thread.join(timeout=5)
+        hubStats = server.hub.stats()
+        server.stop()
+        perClient = []
+        for i, clientFrames in enumerate(received):
+            latencies = [latency for latency, size in clientFrames]
+            perClient.append({
+                'slow': i < slowClients,
+                'frames': len(clientFrames),
+                'latencyMs': 1000*float(numpy.median(latencies)) if latencies else None,
+            })
+        results.append({
+            'clients': clientCount,
+            'publishedFps': published/elapsed,
+            'deliveredFps': sum(len(clientFrames) for clientFrames in received)/elapsed,
+            'deliveredMBps': sum(size for clientFrames in received for _, size in clientFrames)/elapsed/1e6,
+            'dropped': sum(stats['dropped'] for stats in hubStats),
+            'perClient': perClient,
+        })
+    return results
+
+
+def reportFanout():
+    for result in benchmarkFanout(slowClients=1):
+        fastLatencies = [c['latencyMs'] for c in result['perClient'] if not c['slow'] and c['latencyMs'] is not None]
+        print(f"{result['clients']:2d} clients: published {result['publishedFps']:.1f} fps,"
+              f" delivered {result['deliveredFps']:.1f} frames/s ({result['deliveredMBps']:.1f} MB/s),"
+              f" dropped {result['dropped']},"
+              f" fast clients median latency {numpy.median(fastLatencies) if fastLatencies else float('nan'):.2f} ms")
+
+
+#
+# vCastSlicerLib.framering
+#
+
+def _benchmarkReader(path, seconds, results):
+    """
+    Reader process of the benchmark: reads every new frame it sees and measures latency.
+    """
+    reader = FrameRingReader(path)
+    latencies = []
+    torn = 0
+    lastIndex = -1
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        view = reader.waitForFrame(lastIndex, timeout=0.1)
+        if view is None:
+            continue
+        # Touch the pixels like a consumer would (checksum of one row)
+        int(view.pixels[view.height//2].sum())
+        now = time.time()
+        if view.isValid():
+            latencies.append(now - view.timestamp)
+        else:
+            torn += 1
+        lastIndex = view.frameIndex
+    # Views keep the mapping alive: release them before closing the reader
+    view = None
+    reader.close()
+    results.put({'frames': len(latencies), 'torn': torn,
+                 'latencyMs': 1000*numpy.median(latencies) if latencies else None,
+                 'latencyP95Ms': 1000*numpy.percentile(latencies, 95) if latencies else None})
+
+
+def benchmarkRing(readerCounts=(1, 4), seconds=2.0, width=3840, height=2160, path=None):
+    """
+    Publishes frames as fast as possible while 1..N reader processes consume them.
+    Returns, for each reader count, the publishing frame rate and per-reader latency.
+    """
+    path = path or os.path.join(tempfile.mkdtemp(), 'benchmark.ring')
+    frames = [numpy.full((height, width, 3), i, dtype=numpy.uint8) for i in range(4)]
+    results = []
+    for readerCount in readerCounts:
+        writer = FrameRingWriter(path, slotCount=3, maxWidth=width, maxHeight=height, announcementPath=None)
+        queue = multiprocessing.Queue()
+        readers = [multiprocessing.Process(target=_benchmarkReader, args=(path, seconds, queue))
+                   for _ in range(readerCount)]
+        for process in readers:
+            process.start()
+        published = 0
+        start = time.monotonic()
+        while time.monotonic() - start < seconds:
+            writer.publish(frames[published % len(frames)])
+            published += 1
+        elapsed = time.monotonic() - start
+        readerResults = [queue.get(timeout=seconds + 30) for _ in readers]
+        for process in readers:
+            process.join()
+        writer.close()
+        results.append({'readers': readerCount, 'publishedFps': published/elapsed, 'perReader': readerResults})
+    os.remove(path)
+    return results
+
+
+def reportRing():
+    for result in benchmarkRing():
+        print(f"{result['readers']} reader(s): writer {result['publishedFps']:.1f} fps")
+        for i, reader in enumerate(result['perReader']):
+            print(f"  reader {i}: {reader['frames']} frames, {reader['torn']} overwritten while read,"
+                  f" latency median {reader['latencyMs']:.2f} ms, p95 {reader['latencyP95Ms']:.2f} ms")
+
+
+#
+# vCastSlicerLib.statesync
+#
+
+def benchmarkStateSync(seconds=5.0, frameRate=60, width=1920, height=1080, frameEncoder=None):
+    """
+    Compares scene-state sync with frame streaming for the same simulated session, both over
+    local TCP. Returns bandwidth (bytes/s) and median end-to-end latency (ms) of each.
+    """
+    results = {}
+
+    # State sync
+    server = StateSyncServer(port=0)
+    server.start()
+    receiver = StateSyncReceiver()
+    stop = threading.Event()
+
+    def receiveState():
+        for packet in iterPackets(server.host, server.port, timeout=seconds + 5):
+            receiver.apply(packet)
+            if stop.is_set():
+                return
+
+    thread = threading.Thread(target=receiveState, daemon=True)
+    thread.start()
+    while server.clientCount == 0:
+        time.sleep(0.01)
+    start = time.monotonic()
+    step = 0
+    while time.monotonic() - start < seconds:
+        simulateReviewSession(server.encoder, step, frameRate)
+        server.flush()
+        step += 1
+        time.sleep(max(0.0, start + step/frameRate - time.monotonic()))
+    elapsed = time.monotonic() - start
+    stop.set()
+    server.encoder.setCamera('vtkMRMLCameraNode1', (0, 0, 1), (0, 0, 0), (0, 1, 0), 30)
+    server.flush()
+    thread.join(timeout=5)
+    server.stop()
+    results['stateSync'] = {'bytesPerSecond': server.bytesSent/elapsed,
+                            'latencyMs': 1000*float(numpy.median(receiver.latencies[1:]))}
+
+    # Frame streaming of the same session (3D view changing in a four-up layout)
+    frameCount = int(seconds*frameRate)
+    frames = list(syntheticFrames('FourUp', width, height, min(frameCount, 60)))
+    streamServer = StreamServer(port=0, encoder=frameEncoder or TileDeltaEncoder())
+    streamServer.start()
+    received = []
+
+    def receiveFrames():
+        for index, timestamp, data in iterStream(streamServer.url, timeout=seconds + 5):
+            received.append((time.time() - timestamp, len(data)))
+            if stop.is_set():
+                return
+
+    stop.clear()
+    thread = threading.Thread(target=receiveFrames, daemon=True)
+    thread.start()
+    while streamServer.clientCount == 0:
+        time.sleep(0.01)
+    start = time.monotonic()
+    for step in range(frameCount):
+        streamServer.publish(frames[step % len(frames)])
+        time.sleep(max(0.0, start + (step + 1)/frameRate - time.monotonic()))
+    elapsed = time.monotonic() - start
+    stop.set()
+    streamServer.publish(frames[0])
+    thread.join(timeout=5)
+    streamServer.stop()
+    results['frameStreaming'] = {'bytesPerSecond': sum(size for _, size in received)/elapsed,
+                                 'latencyMs': 1000*float(numpy.median([latency for latency, _ in received])),
+                                 'framesDelivered': len(received), 'framesPublished': frameCount}
+    return results
+
+
+def reportStateSync():
+    for name, result in benchmarkStateSync().items():
+        print(f"{name:>15}: {result['bytesPerSecond']/1024:10.1f} KiB/s, median latency {result['latencyMs']:.2f} ms")
+
+
+#
+# vCastSlicerLib.telemetry
+#
+
+def benchmarkTelemetry(count=200000):
+    """
+    Measures the cost of recording values, to check that telemetry can stay enabled.
+    Returns nanoseconds per call.
+    """
+    telemetry = Telemetry()
+    results = {}
+    start = time.perf_counter()
+    for i in range(count):
+        telemetry.observe('send', 0.001 + (i % 100)*0.0001, 'board1')
+    results['observe'] = 1e9*(time.perf_counter() - start)/count
+    start = time.perf_counter()
+    for i in range(count):
+        telemetry.increment('framesSent', 'board1')
+    results['increment'] = 1e9*(time.perf_counter() - start)/count
+    start = time.perf_counter()
+    for i in range(count):
+        telemetry.addBytes('board1', 50000)
+    results['addBytes'] = 1e9*(time.perf_counter() - start)/count
+    start = time.perf_counter()
+    for i in range(100):
+        telemetry.snapshot()
+    results['snapshot'] = 1e9*(time.perf_counter() - start)/100
+    return results
+
+
+def reportTelemetry():
+    for name, nanoseconds in benchmarkTelemetry().items():
+        print(f"{name:>10}: {nanoseconds/1000:.2f} us per call")
+
+
+#
+# vCastSlicerLib.ratecontrol
+#
+
+TRACES = {
+    'steps': lambda: stepTrace([(0, 20e6/8), (15, 3e6/8), (30, 0.8e6/8), (45, 8e6/8)]),
+    'wifi': wifiTrace,
+}
+
+
+def convergenceTimes(result, bandwidth, latencyBudget=0.25, utilization=0.5, ceilingRate=None):
+    """
+    Function to measure, after every bandwidth step, the time until a whole second has no
+    frame missing its deadline and uses at least `utilization` of the link (or is at the
+    ceiling rate, when the link is faster than needed).
+    """
+    frames = result['frames']
+    times = []
+    steps = bandwidth.steps
+    for i, (stepTime, capacity) in enumerate(steps):
+        end = steps[i + 1][0] if i + 1 < len(steps) else frames[-1][0]
+        converged = None
+        t = stepTime
+        while t + 1.0 <= end:
+            window = [frame for frame in frames if t <= frame[0] < t + 1.0]
+            rate = sum(size for _, size, _, _ in window)
+            clean = all(latency <= latencyBudget for _, _, latency, _ in window)
+            if window and clean and (rate >= utilization*capacity or (ceilingRate and rate >= 0.8*ceilingRate)):
+                converged = t - stepTime
+                break
+            t += 0.1
+        times.append({'time': stepTime, 'bytesPerSecond': capacity, 'convergenceS': converged})
+    return times
+
+
+def benchmarkRateControl(duration=60.0, limits=None):
+    """
+    Runs every trace with the adaptive controller and with the fixed best level.
+    """
+    limits = limits or RateLimits()
+    results = {}
+    for name, makeTrace in TRACES.items():
+        bandwidth = makeTrace()
+        controller = RateController(limits, clock=lambda: 0.0)
+        adaptive = simulateLink(bandwidth, duration, controller)
+        fixed = simulateLink(bandwidth, duration, level=controller.ladder[0])
+        # Bytes per second of the best level: faster links can't be used more
+        ceiling = FULL_FRAME_BYTES*controller.ladder[0].cost
+        results[name] = {
+            'adaptive': adaptive,
+            'fixed': fixed,
+            'levelChanges': len(controller.changes),
+            'convergence': convergenceTimes(adaptive, bandwidth, ceilingRate=ceiling) if name == 'steps' else None,
+        }
+    return results
+
+
+def reportRateControl():
+    for name, result in benchmarkRateControl().items():
+        print(f"{name} trace:")
+        for mode in ('adaptive', 'fixed'):
+            run = result[mode]
+            print(f"  {mode:>8}: {run['sent']} frames sent, {run['missedDeadline']} missed the deadline,"
+                  f" {run['dropped']} dropped, mean latency {run['meanLatencyMs']:.0f} ms,"
+                  f" mean scale {run['meanScale']:.2f}, quality {run['meanQuality']:.0f}, {run['meanFrameRate']:.1f} fps")
+        print(f"  {result['levelChanges']} level changes")
+        for step in result['convergence'] or []:
+            converged = f"{step['convergenceS']:.1f} s" if step['convergenceS'] is not None else 'not converged'
+            print(f"  step to {8*step['bytesPerSecond']/1e6:.1f} Mbit/s at {step['time']:.0f} s: {converged}")
+
+
+#
+# vCastSlicerLib.zones
+#
+
+def benchmarkZones(pointCounts=(10000, 100000, 1000000), resourcesDir=None, loopLimit=100000, seed=0):
+    """
+    Times the vectorized labeling against the per-point loop (only run up to loopLimit
+    points, the loop being too slow above) and checks that both give the same names.
+    """
+    resourcesDir = resourcesDir or os.path.join(MODULE_DIR, 'Resources')
+    zoneNames = loadZoneNames(resourcesDir)
+    labels, rasToIjk, colorNames = syntheticParcellation(zoneNames, seed=seed)
+    table = labelTable(colorNames, zoneNames)
+    rng = numpy.random.default_rng(seed)
+    results = []
+    for count in pointCounts:
+        # Contacts spread over (and slightly outside) the volume
+        points = rng.uniform(-140, 140, size=(count, 3))
+        start = time.perf_counter()
+        labeler = ZoneLabeler(labels, rasToIjk, table)
+        shortNames, fullNames = labeler.classify(points)
+        vectorized = time.perf_counter() - start
+        result = {'points': count, 'vectorizedS': vectorized, 'loopS': None, 'speedup': None}
+        if count <= loopLimit:
+            start = time.perf_counter()
+            loopShortNames, loopFullNames = classifyLoop(labels, rasToIjk, table, points)
+            result['loopS'] = time.perf_counter() - start
+            result['speedup'] = result['loopS']/vectorized
+            if list(shortNames) != loopShortNames or list(fullNames) != loopFullNames:
+                raise AssertionError("The vectorized and loop labelings differ")
+        results.append(result)
+    return results
+
+
+def reportZones():
+    for result in benchmarkZones():
+        line = f"{result['points']:8d} points: vectorized {1000*result['vectorizedS']:9.1f} ms"
+        if result['loopS'] is not None:
+            line += f", loop {1000*result['loopS']:9.1f} ms, speedup x{result['speedup']:.0f}"
+        print(line)
+
+
+#
+# vCastSlicerLib.pyramid
+#
+
+def benchmarkPyramid(shape=(256, 512, 512), cacheDir=None):
+    """
+    Times the first build of a pyramid, a later lookup of the same volume (hash and
+    memory-mapped load of the level of each display) and reports the voxels of each level.
+    """
+    cacheDir = cacheDir or tempfile.mkdtemp(prefix='vCastPyramid')
+    volume = syntheticVolume(shape)
+    cache = PyramidCache(cacheDir)
+    results = {'shape': shape, 'megabytes': volume.nbytes/1e6}
+    try:
+        start = time.perf_counter()
+        key = contentHash(volume)
+        results['hashS'] = time.perf_counter() - start
+        start = time.perf_counter()
+        cache.build(volume).result()
+        results['buildS'] = time.perf_counter() - start
+        start = time.perf_counter()
+        cache.build(volume).result()
+        results['cachedBuildS'] = time.perf_counter() - start
+        results['displays'] = {}
+        for display in DISPLAY_VOXEL_BUDGETS:
+            start = time.perf_counter()
+            level = cache.levelFor(key, display)
+            array = cache.load(key, level) if level else volume
+            loadS = time.perf_counter() - start
+            # First read of all the voxels, as the upload to the GPU does
+            start = time.perf_counter()
+            float(array.sum())
+            readS = time.perf_counter() - start
+            results['displays'][display] = {'level': level, 'voxels': int(array.size), 'loadS': loadS, 'readS': readS}
+        results['stats'] = cache.stats()
+    finally:
+        cache.shutdown()
+        shutil.rmtree(cacheDir, ignore_errors=True)
+    return results
+
+
+def reportPyramid():
+    result = benchmarkPyramid()
+    print(f"Volume {result['shape']} ({result['megabytes']:.0f} MB): hash {1000*result['hashS']:.0f} ms,"
+          f" first build {1000*result['buildS']:.0f} ms, cached {1000*result['cachedBuildS']:.0f} ms")
+    for display, values in result['displays'].items():
+        print(f"  {display:>8}: level {values['level']}, {values['voxels']/1e6:6.2f} M voxels,"
+              f" load {1000*values['loadS']:.2f} ms, first read {1000*values['readS']:.1f} ms")
+    print(f"  cache: {result['stats']['bytes']/1e6:.0f} MB on disk")
+
+
+#
+# vCastSlicerLib.meshlod
+#
+
+def benchmarkMeshLOD(meshCount=4, workerCounts=(1, 2, 4), cacheDir=None):
+    """
+    Builds the levels of meshCount cortex-like meshes (~330k triangles each) with pools of
+    different sizes, then looks them up again (cache hits). Reports the wall times, the time
+    spent in the calling thread and the levels chosen for each display.
+    """
+    meshes = [sphereMesh(seed=i) for i in range(meshCount)]
+    results = {'triangles': len(meshes[0][1]), 'meshes': meshCount, 'builds': []}
+    for workers in workerCounts:
+        directory = tempfile.mkdtemp(prefix='vCastMeshLOD', dir=cacheDir)
+        cache = MeshLODCache(directory, workers=workers)
+        try:
+            # Worker processes started before timing, as they stay up during a session
+            cache._processes = concurrent.futures.ProcessPoolExecutor(workers)
+            list(cache._processes.map(abs, range(workers)))
+            start = time.perf_counter()
+            futures = [cache.build(points, triangles) for points, triangles in meshes]
+            callerS = time.perf_counter() - start
+            keys = [future.result() for future in futures]
+            wallS = time.perf_counter() - start
+            start = time.perf_counter()
+            for points, triangles in meshes:
+                cache.build(points, triangles).result()
+            hitS = (time.perf_counter() - start)/meshCount
+            stats = cache.stats()
+            results['builds'].append({'workers': workers, 'wallS': wallS, 'callerS': callerS, 'hitS': hitS,
+                                      'buildMedianS': stats['buildMedianS'], 'hits': stats['hits'],
+                                      'misses': stats['misses']})
+            counts = [cache.counts(key) for key in keys]
+            results['levels'] = counts[0]
+            results['displays'] = {display: chooseLevels(counts, budget)
+                                   for display, budget in DISPLAY_TRIANGLE_BUDGETS.items()}
+        finally:
+            cache.shutdown()
+            shutil.rmtree(directory, ignore_errors=True)
+    return results
+
+
+def reportMeshLOD():
+    result = benchmarkMeshLOD()
+    print(f"{result['meshes']} meshes of {result['triangles']} triangles, levels {result['levels']}")
+    for build in result['builds']:
+        print(f"  {build['workers']} workers: {1000*build['wallS']:.0f} ms"
+              f" ({1000*build['buildMedianS']:.0f} ms per mesh in a worker, {1000*build['callerS']:.1f} ms in the caller),"
+              f" cache hit {1000*build['hitS']:.2f} ms, {build['hits']} hits / {build['misses']} misses")
+    for display, levels in result['displays'].items():
+        total = sum(result['levels'][level] for level in levels)
+        print(f"  {display:>8}: levels {levels}, {total} triangles")
+
+
+#
+# vCastSlicerLib.prerender
+#
+
+def benchmarkPrerender(frameCount=96, workerCounts=(1, 2, 4), size=(640, 360)):
+    """
+    Times the pre-rendering of a turntable with the synthetic renderer for each number of
+    workers, and the seek to random frames of the result.
+    """
+    poses = turntablePoses((0, 0, 0), 400, frameCount)
+    results = {'frames': frameCount, 'size': size, 'cpus': os.cpu_count(), 'workers': {}}
+    for workers in workerCounts:
+        outputDir = tempfile.mkdtemp(prefix='vCastPrerender')
+        try:
+            posesFile = writePoses(outputDir, poses)
+            start = time.perf_counter()
+            runChunks(syntheticCommand(posesFile, outputDir, *size), chunkRanges(frameCount, workers), workers)
+            index = mergeIndex(outputDir, poses)
+            seconds = time.perf_counter() - start
+            packetBytes = sum(frame['size'] for frame in index['frames'])
+            reader = FrameSequenceReader(outputDir)
+            seeks = []
+            for n in numpy.random.default_rng(0).integers(0, frameCount, 20).tolist():
+                begin = time.perf_counter()
+                reader.frame(n)
+                seeks.append(time.perf_counter() - begin)
+            reader.close()
+            results['workers'][workers] = {
+                'seconds': seconds, 'framesPerS': frameCount/seconds,
+                'renderMsPerFrame': 1000*index['renderS']/frameCount, 'encodeMsPerFrame': 1000*index['encodeS']/frameCount,
+                'bytesPerFrame': packetBytes/frameCount, 'rawBytesPerFrame': size[0]*size[1]*3,
+                'seekMedianMs': 1000*sorted(seeks)[len(seeks)//2], 'seekMaxMs': 1000*max(seeks)}
+        finally:
+            shutil.rmtree(outputDir, ignore_errors=True)
+    single = results['workers'].get(1)
+    for values in results['workers'].values():
+        values['speedup'] = values['framesPerS']/single['framesPerS'] if single else None
+    return results
+
+
+def reportPrerender():
+    result = benchmarkPrerender()
+    print(f"Turntable of {result['frames']} frames at {result['size'][0]}x{result['size'][1]},"
+          f" {result['cpus']} CPU(s)")
+    for workers, values in result['workers'].items():
+        print(f"  {workers} workers: {values['seconds']:.2f} s, {values['framesPerS']:.1f} frames/s"
+              f" (x{values['speedup']:.2f}), render {values['renderMsPerFrame']:.1f} ms and encode"
+              f" {values['encodeMsPerFrame']:.1f} ms per frame, {values['bytesPerFrame']/1e3:.0f} kB per frame"
+              f" ({values['rawBytesPerFrame']/values['bytesPerFrame']:.1f}:1), seek median"
+              f" {values['seekMedianMs']:.1f} ms, max {values['seekMaxMs']:.1f} ms")
+
+
+#
+# vCastSlicerLib.recorder
+#
+
+class _Clock:
+    """
+    Simulated clock, so that an hour of session is recorded in seconds.
+    """
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def benchmarkRecorder(seconds=600, frameRate=30, seeks=50, videoFrames=60, videoSize=(3840, 2160), path=None):
+    """
+    Records a simulated review session and measures the storage per hour and the latency
+    of seeking to random times, and the same for a recording of the pixels of the views
+    (4K tile delta frames, keyframe every videoFrames frames).
+    """
+    import numpy
+    directory = tempfile.mkdtemp(prefix='vCastRecorder') if path is None else None
+    path = path or os.path.join(directory, 'session.vcrec')
+    results = {'seconds': seconds, 'frameRate': frameRate}
+    clock = _Clock()
+    recorder = SessionRecorder(path, clock=clock)
+    start = time.perf_counter()
+    for step in range(int(seconds*frameRate)):
+        clock.now = step/frameRate
+        simulateReviewSession(recorder.encoder, step, frameRate)
+        recorder.record()
+    recorder.close()
+    results['recordUsPerFrame'] = 1e6*(time.perf_counter() - start)/(seconds*frameRate)
+    results['bytes'] = recorder.bytesWritten
+    results['bytesPerHour'] = recorder.bytesWritten*3600/seconds
+    results['keyframes'] = recorder.keyframeCount
+    start = time.perf_counter()
+    reader = SessionReader(path)
+    results['openMs'] = 1000*(time.perf_counter() - start)
+    rng = random.Random(0)
+    timings = []
+    for _ in range(seeks):
+        position = rng.uniform(0, seconds)
+        start = time.perf_counter()
+        reader.snapshotAt(position)
+        timings.append(time.perf_counter() - start)
+    reader.close()
+    results['seekMedianMs'] = 1000*float(numpy.median(timings))
+    results['seekMaxMs'] = 1000*max(timings)
+    os.remove(path)
+    os.remove(path + INDEX_SUFFIX)
+    if directory is not None:
+        os.rmdir(directory)
+
+    # Pixels of the same kind of session: a 4K four-up layout with the 3D view rotating
+    encoder = TileDeltaEncoder(keyframeInterval=videoFrames)
+    packets = [encoder.encode(frame) for frame in syntheticFrames('FourUp', *videoSize, videoFrames)]
+    bytesPerFrame = sum(len(packet) for packet in packets)/len(packets)
+    results['videoBytesPerHour'] = bytesPerFrame*frameRate*3600
+    # Seeking to the last frame before a keyframe decodes the whole group of frames
+    start = time.perf_counter()
+    decoder = TileDeltaDecoder()
+    for packet in packets:
+        decoder.decode(packet)
+    results['videoSeekMaxMs'] = 1000*(time.perf_counter() - start)
+    # A random time is on average in the middle of a group of frames
+    results['videoSeekMeanMs'] = results['videoSeekMaxMs']/2
+    return results
+
+
+def reportRecorder():
+    result = benchmarkRecorder()
+    print(f"Session of {result['seconds']} s at {result['frameRate']} fps: {result['bytes']/1e3:.0f} kB"
+          f" ({result['keyframes']} keyframes), {result['recordUsPerFrame']:.0f} us per recorded frame")
+    print(f"  state log: {result['bytesPerHour']/1e6:8.2f} MB per hour, seek median {result['seekMedianMs']:.2f} ms,"
+          f" max {result['seekMaxMs']:.2f} ms (open {result['openMs']:.2f} ms)")
+    print(f"  4K pixels: {result['videoBytesPerHour']/1e6:8.0f} MB per hour, seek mean"
+          f" {result['videoSeekMeanMs']:.0f} ms, max {result['videoSeekMaxMs']:.0f} ms")
+
+
+# Benchmark of each vCastSlicerLib module
+REPORTS = {
+    'deltacodec': reportCodec,
+    'fanout': reportFanout,
+    'framering': reportRing,
+    'statesync': reportStateSync,
+    'telemetry': reportTelemetry,
+    'ratecontrol': reportRateControl,
+    'zones': reportZones,
+    'pyramid': reportPyramid,
+    'meshlod': reportMeshLOD,
+    'prerender': reportPrerender,
+    'recorder': reportRecorder,
+}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks of the vCastSlicerLib modules.")
+    parser.add_argument('modules', nargs='*', help=f"Modules to benchmark among {', '.join(REPORTS)} (default: all)")
+    args = parser.parse_args(argv)
+    unknown = [name for name in args.modules if name not in REPORTS]
+    if unknown:
+        parser.error(f"unknown module {', '.join(unknown)}")
+    for name in args.modules or REPORTS:
+        print(f"vCastSlicerLib.{name}")
+        REPORTS[name]()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
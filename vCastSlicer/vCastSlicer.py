@@ -1,17 +1,261 @@
+import time
+# Start of the import of the module (see vCastSlicerStartupProfiler)
+_importStart = time.perf_counter()
 import os
-import unittest
 import vtk, qt, ctk, slicer
 from slicer.ScriptedLoadableModule import *
 from slicer.util import VTKObservationMixin
-import re
-import numpy
-import collections
 import logging
-import json
-import platform
-from tempfile import mkstemp
-from shutil import move, copymode
-from os import fdopen, remove
+from vCastSlicerLib.startup import StartupProfiler
+# Slicer imports this module at every launch: numpy and the other vCastSlicerLib modules are
+# only imported by the functions that use them
+
+# Seconds during which an 'installed' result of the SlicerVR check is trusted
+SLICERVR_CHECK_TTL = 7*24*3600
+# Seconds during which a failed SlicerVR installation isn't tried again
+SLICERVR_RETRY_TTL = 24*3600
+# Delay of the SlicerVR check after startup (ms), so that it doesn't slow the startup down
+SLICERVR_CHECK_DELAY = 3000
+# Text of the toolbar action opening vCastSender
+TOOLBAR_ACTION_TEXT = "vCastSender"
+# Optional path to a local index.json used instead of the Slicer extensions server
+EXTENSIONS_CATALOG_ENV = 'VCASTSLICER_EXTENSIONS_CATALOG'
+# Time given to the extensions manager to install an extension from the server (ms)
+EXTENSION_INSTALL_TIMEOUT = 15*60*1000
+# MRML classes whose state is sent to remote renderers (see startStateSync)
+STATE_SYNC_CLASSES = ('vtkMRMLCameraNode', 'vtkMRMLSliceNode', 'vtkMRMLDisplayNode', 'vtkMRMLTransformNode')
+# Displays of the 'Target display' selector, in the order of its items (see vCastSlicerLib.pyramid
+# and vCastSlicerLib.meshlod)
+TARGET_DISPLAYS = ('desktop', 'vr', 'hololens', 'board')
+# Default disk budget of the volume pyramids ('pyramidCacheBytes' in the module settings)
+PYRAMID_CACHE_BYTES = 4*1024**3
+# Attribute of the downsampled volumes, holding the ID of the volume they come from
+PYRAMID_SOURCE_ATTRIBUTE = 'vCastSlicer.PyramidSource'
+# Default disk budget of the model levels of detail ('meshLODCacheBytes' in the module settings)
+MESH_LOD_CACHE_BYTES = 1024**3
+# Attribute of the decimated models, holding the ID of the model they come from
+MESH_LOD_SOURCE_ATTRIBUTE = 'vCastSlicer.LODSource'
+
+#
+# Time spent by the module in each phase of the Slicer startup.
+#
+
+_startupProfiler = StartupProfiler()
+
+def vCastSlicerStartupProfiler():
+    """
+    Returns the startup profile of the module (vCastSlicerLib.startup.StartupProfiler).
+    """
+    return _startupProfiler
+
+#
+# Settings shared by the module, widget and logic. Created on first use.
+#
+
+_settings = None
+
+def vCastSlicerSettings():
+    """
+    Returns the settings store of the module, kept next to the Slicer user settings.
+    """
+    from vCastSlicerLib.settings import SettingsStore
+    global _settings
+    if _settings is None:
+        settingsDir = os.path.dirname(slicer.app.slicerUserSettingsFilePath)
+        _settings = SettingsStore(os.path.join(settingsDir, 'vCastSlicer.json'))
+        if not _settings.get('legacySettingsMigrated'):
+            _migrateLegacySettings(_settings)
+    return _settings
+
+def _migrateLegacySettings(settings):
+    """
+    Versions before the settings store saved the vCastSender path in their own vCastSlicer.py,
+    which is replaced when the extension is updated. The path is looked for (once) in the
+    module files of the MultiViews extension installed for other Slicer versions.
+    """
+    import glob
+    from vCastSlicerLib.settings import findLegacyVCastSenderPath
+    values = {'legacySettingsMigrated': True}
+    if not settings.get('vCastSenderPath'):
+        extensionsDir = os.path.dirname(os.path.normpath(slicer.app.extensionsInstallPath))
+        scripts = glob.glob(os.path.join(extensionsDir, 'Extensions-*', 'MultiViews', '**', 'vCastSlicer.py'),
+                            recursive=True)
+        path = findLegacyVCastSenderPath(script for script in scripts if not os.path.samefile(script, __file__))
+        if path:
+            values['vCastSenderPath'] = path
+            logging.info(f"vCastSender path {path} imported from a previous version of the module")
+    try:
+        settings.update(values)
+    except (OSError, RuntimeError) as e:
+        # Tried again at the next launch
+        logging.warning(f"Failed to save the settings imported from a previous version of the module: {e}")
+
+#
+# Performance measurements of the casting pipeline, shown in the module panel.
+#
+
+_telemetry = None
+
+def vCastSlicerTelemetry():
+    """
+    Returns the telemetry shared by the stream server, the capture and the vCastSender supervisor.
+    """
+    from vCastSlicerLib.telemetry import Telemetry
+    global _telemetry
+    if _telemetry is None:
+        _telemetry = Telemetry()
+    return _telemetry
+
+#
+# Downsampled levels of the volumes, shared by all the logic instances.
+#
+
+_pyramidCache = None
+
+def vCastSlicerPyramidCache():
+    """
+    Returns the disk cache of the volume pyramids, in the Slicer cache directory.
+    """
+    from vCastSlicerLib.pyramid import PyramidCache
+    global _pyramidCache
+    if _pyramidCache is None:
+        cacheDir = os.path.join(slicer.app.cachePath, 'vCastSlicer', 'Pyramids')
+        _pyramidCache = PyramidCache(cacheDir, vCastSlicerSettings().get('pyramidCacheBytes', PYRAMID_CACHE_BYTES))
+        slicer.app.connect('aboutToQuit()', lambda: _pyramidCache.shutdown(wait=False))
+    return _pyramidCache
+
+_meshLODCache = None
+
+def vCastSlicerMeshLODCache():
+    """
+    Returns the disk cache of the model levels of detail, in the Slicer cache directory.
+    Decimation runs in worker processes started with PythonSlicer.
+    """
+    from vCastSlicerLib.meshlod import MeshLODCache
+    global _meshLODCache
+    if _meshLODCache is None:
+        import multiprocessing
+        import sys
+        context = multiprocessing.get_context('spawn')
+        # The Slicer application can't be the interpreter of the workers, PythonSlicer can
+        executable = os.path.join(os.path.dirname(sys.executable), 'PythonSlicer' + ('.exe' if os.name == 'nt' else ''))
+        if os.path.isfile(executable):
+            context.set_executable(executable)
+        cacheDir = os.path.join(slicer.app.cachePath, 'vCastSlicer', 'MeshLOD')
+        # Spawned workers start with the sys.path of Slicer, so they find vCastSlicerLib
+        _meshLODCache = MeshLODCache(cacheDir, vCastSlicerSettings().get('meshLODCacheBytes', MESH_LOD_CACHE_BYTES),
+                                     telemetry=vCastSlicerTelemetry(), mpContext=context)
+        slicer.app.connect('aboutToQuit()', lambda: _meshLODCache.shutdown(wait=False))
+    return _meshLODCache
+
+#
+# vCastSender child process, shared by the toolbar icon of the module and the widget.
+#
+
+_senderSupervisor = None
+_senderTimer = None
+
+def vCastSenderSupervisor():
+    """
+    Returns the supervisor that owns the vCastSender process.
+    """
+    from vCastSlicerLib.process import ProcessSupervisor
+    global _senderSupervisor, _senderTimer
+    if _senderSupervisor is None:
+        _senderSupervisor = ProcessSupervisor([])
+        # Health checks are cheap and non-blocking, they run on the main thread
+        _senderTimer = qt.QTimer()
+        _senderTimer.setInterval(500)
+        _senderTimer.connect('timeout()', _pollVCastSender)
+        slicer.app.connect('aboutToQuit()', _senderSupervisor.stop)
+    return _senderSupervisor
+
+def launchVCastSender(path):
+    """
+    Starts vCastSender, or reuses the running instance. Returns 'started' or 'reused'.
+    Raises OSError if the executable can't be started.
+    """
+    supervisor = vCastSenderSupervisor()
+    if not supervisor.isRunning:
+        supervisor.setCommand([path])
+    result = supervisor.start()
+    _senderTimer.start()
+    return result
+
+def _pollVCastSender():
+    """
+    Checks the vCastSender process: reports when it is ready and when it crashed.
+    """
+    from vCastSlicerLib.process import FAILED, READY, RESTARTING, STOPPED
+    previousState = _senderSupervisor.state
+    state = _senderSupervisor.poll()
+    if state == previousState:
+        return
+    if state == READY:
+        slicer.util.showStatusMessage(f"vCastSender ready in {_senderSupervisor.lastLaunchLatency:.1f} s", 5000)
+    elif state == RESTARTING:
+        vCastSlicerTelemetry().increment('senderRestarts')
+        logging.warning(f"vCastSender closed unexpectedly (exit code {_senderSupervisor.lastExitCode}). Restarting...")
+    elif state == FAILED:
+        _senderTimer.stop()
+        slicer.util.errorDisplay("vCastSender keeps closing unexpectedly. Please verify the installation.")
+    elif state == STOPPED:
+        _senderTimer.stop()
+
+#
+# Toolbar icon opening vCastSender, shared by the module and the widget.
+#
+
+_toolbarAction = None
+
+def addToolbarIcon():
+    """
+    Adds the vCastSender icon to the module toolbar, once per session. Returns its action.
+    """
+    global _toolbarAction
+    if _toolbarAction is None:
+        mainToolBar = slicer.util.findChild(slicer.util.mainWindow(), 'ModuleToolBar')
+        # After a reload of the module, the icon of the previous instance is reused
+        for action in mainToolBar.actions():
+            if action.text == TOOLBAR_ACTION_TEXT:
+                action.triggered.disconnect()
+                _toolbarAction = action
+                break
+        else:
+            iconPath = os.path.join(os.path.dirname(__file__), 'Resources/Icons/vCastSlicer.png')
+            _toolbarAction = mainToolBar.addAction(qt.QIcon(iconPath), TOOLBAR_ACTION_TEXT)
+        _toolbarAction.triggered.connect(toggleVCastSender)
+    return _toolbarAction
+
+def toggleVCastSender():
+    """
+    Opens vCastSender with the path saved in the settings (behavior of the toolbar icon).
+    """
+    # vCastSender is already open (or opening): don't start a second instance
+    if vCastSenderSupervisor().isRunning:
+        slicer.util.showStatusMessage("vCastSender is already running.", 5000)
+        return
+    # Message box to give instructions related to vCastSender
+    msgbox = qt.QMessageBox()
+    # Set style of the message box
+    msgbox.setStyleSheet("QLabel{min-width: 700px;}")
+    msgbox.setWindowTitle("vCastSender will open.")
+    msgbox.setInformativeText("After vCastSender is opened, click 'Device List' and choose your ViewSonic device.")
+    msgbox.setStandardButtons(qt.QMessageBox.Cancel | qt.QMessageBox.Ok)
+    msgbox.setDefaultButton(qt.QMessageBox.Ok)
+    ret = msgbox.exec()
+    path = vCastSlicerSettings().get('vCastSenderPath', "")
+    # If Ok Button is pressed and a vCastSender path has been set
+    if ret == qt.QMessageBox.Ok and len(path)>0:
+        try:
+            launchVCastSender(path)
+        except OSError:
+            slicer.util.errorDisplay("Failed to open the exe file. Please verify the path.")
+    # If button Cancel is pressed
+    elif ret == qt.QMessageBox.Cancel: 
+        pass
+    else:
+        slicer.util.errorDisplay("Failed to open the exe file. Please verify the path.")
 
 #
 # vCastSlicer. Module to connect 3D Slicer with vCastSender application.
@@ -23,10 +267,10 @@ class vCastSlicer(ScriptedLoadableModule):
   """
 
     def __init__(self, parent):
+        start = _startupProfiler.start()
         ScriptedLoadableModule.__init__(self, parent)
         self.parent.title = "vCastSlicer"
         self.parent.categories = ["Multiviews"]
-        self._dir_chosen = "" # Saves path to vCast exe file
         self.parent.dependencies = []
         self.parent.contributors = ["Mauricio Cespedes Tenorio (Western University)"]
         self.parent.helpText = """
@@ -39,77 +283,61 @@ class vCastSlicer(ScriptedLoadableModule):
 
         # Add app icon when application has started up
         if not slicer.app.commandOptions().noMainWindow:
-            slicer.app.connect("startupCompleted()", self.modifyWindowUI)
-            slicer.app.connect("startupCompleted()", self.checkSlicerVR)
-            
+            slicer.app.connect("startupCompleted()", self.onStartupCompleted)
+        _startupProfiler.stop('moduleCreation', start)
 
-    def modifyWindowUI(self):
+    def onStartupCompleted(self):
         """
-        Function to add custom icon to toolbar.
+        Function to add the toolbar icon once Slicer has started. SlicerVR is checked a few
+        seconds later, out of the way of the startup.
         """
-        # Look for ModuleToolBar in the mainWindow
-        mainToolBar = slicer.util.findChild(slicer.util.mainWindow(), 'ModuleToolBar')
-        # This condition is made to avoid multiple repetitions of the icon
-        add_widget = True
-        # Look for elements in the toolbar to search for any instances of vCastSender
-        for element in mainToolBar.actions():
-            if element.text == "vCastSender":
-                add_widget = False
-        # If the vCastSender icon is not in the toolbar
-        if add_widget:
-            iconPath = os.path.join(os.path.dirname(__file__), 'Resources/Icons/vCastSlicer.png')    
-            moduleIcon = qt.QIcon(iconPath)
-            self.StyleAction = mainToolBar.addAction(moduleIcon, "vCastSender")
-            self.StyleAction.triggered.connect(self.toggleStyle)
-    
-    def toggleStyle(self):
-        """
-        Function to set behavior of custom icon on click.
-        """
-        # Message box to give instructions related to vCastSender
-        msgbox = qt.QMessageBox()
-        # Set style of the message box
-        msgbox.setStyleSheet("QLabel{min-width: 700px;}")
-        msgbox.setWindowTitle("vCastSender will open.")
-        msgbox.setInformativeText("After vCastSender is opened, click 'Device List' and choose your ViewSonic device.")
-        msgbox.setStandardButtons(qt.QMessageBox.Cancel | qt.QMessageBox.Ok)
-        msgbox.setDefaultButton(qt.QMessageBox.Ok)
-        ret = msgbox.exec()
-        # If Ok Button is pressed and a vCastSender path has been set
-        if ret == qt.QMessageBox.Ok and len(self._dir_chosen)>0:
-            try:
-                import subprocess
-                subprocess.Popen(
-                self._dir_chosen, shell = True
-                )
-            except:
-                slicer.util.errorDisplay("Failed to open the exe file. Please verify the path.")
-        # If button Cancel is pressed
-        elif ret == qt.QMessageBox.Cancel: 
-            pass
-        else:
-            slicer.util.errorDisplay("Failed to open the exe file. Please verify the path.")
+        with _startupProfiler.phase('toolbarIcon'):
+            addToolbarIcon()
+        qt.QTimer.singleShot(SLICERVR_CHECK_DELAY, self.checkSlicerVR)
 
     def checkSlicerVR(self):
         """
-        Function to verify if SlicerVR is installed.
+        Function to verify if SlicerVR is installed. The result is cached in the module settings
+        (SLICERVR_CHECK_TTL if installed, SLICERVR_RETRY_TTL after a failed installation), so
+        normal launches don't query the extensions manager at all.
         """
-        extensionName = 'SlicerVirtualReality'
-        manager = slicer.app.extensionsManagerModel()
-        if not manager.isExtensionInstalled(extensionName):
-            print(f"Installing {extensionName}...")
-            slicer.util.mainWindow().initialWindowShown.connect(self.installSlicerVR())
-        else:
-            print(f'{extensionName} is already installed.')
-    
+        from vCastSlicerLib.extensions import isCheckFresh
+        with _startupProfiler.phase('slicerVRCheck'):
+            extensionName = 'SlicerVirtualReality'
+            fresh = isCheckFresh(vCastSlicerSettings().get(extensionName), SLICERVR_CHECK_TTL,
+                                 failedTtl=SLICERVR_RETRY_TTL)
+        logging.info(f"vCastSlicer startup: {_startupProfiler.report()}")
+        if fresh:
+            return
+        # Leave the timer callback right away, the manager is queried from the event loop
+        qt.QTimer.singleShot(0, self.installSlicerVR)
+
     def installSlicerVR(self):
         """
-        Function to install SlicerVR extension.
+        Function to install SlicerVR extension if it is missing. The archive is downloaded in
+        the background; progress is shown in the progress bar of the logic.
+        isExtensionInstalled runs on the main thread (the extensions manager can't be used
+        from another thread), so it is only called when the cached result of the check is
+        missing or has expired: at most once a week, or once a day after a failed installation.
         """
         extensionName = 'SlicerVirtualReality'
         manager = slicer.app.extensionsManagerModel()
-        extensionMetaData = manager.retrieveExtensionMetadataByName(extensionName)
-        manager.downloadAndInstallExtension(extensionMetaData['extension_id'])
+        if manager.isExtensionInstalled(extensionName):
+            vCastSlicerSettings().set(extensionName, {'installed': True, 'checkedAt': time.time()})
+            logging.info(f'{extensionName} is already installed.')
+            return
+        logging.info(f"Installing {extensionName}...")
+        self._installLogic = vCastSlicerLogic()
+        self._installLogic.installExtension(extensionName, self.onSlicerVRInstalled)
+
+    def onSlicerVRInstalled(self, success, error):
+        """
+        Function called on the main thread when the SlicerVR installation has finished.
+        """
+        self._installLogic = None
+        if not success:
+            logging.error(f"Failed to install SlicerVirtualReality: {error}")
+            return
         # Display message to indicate that SlicerVR was installed and the app will be restarted.
         msgbox = qt.QMessageBox()
         # Set style of the message box
@@ -135,25 +363,29 @@ class vCastSlicerWidget(ScriptedLoadableModuleWidget, VTKObservationMixin):
         self.logic = None
         self._parameterNode = None
         self._updatingGUIFromParameterNode = False
-        self._dir_chosen = "" # Saves path to vCast exe file
+        self._dir_chosen = vCastSlicerSettings().get('vCastSenderPath', "") # Saves path to vCast exe file
         self._tmp_dir = self._dir_chosen # Saves temp path to vCast exe file before clicking on Apply
-        # Defines whether the icon is connected to the function from vCastSlicer class or
-        # the vCastSlicerWidget class.
-        self._IconConnected = False   
+        # Refreshes the performance panel while it is expanded
+        self._telemetryTimer = None
+        # Follows the position of the session being replayed
+        self._replayTimer = None
 
     def setup(self):
         """
         Called when the user opens the module the first time and the widget is initialized.
         """
+        start = _startupProfiler.start()
         ScriptedLoadableModuleWidget.setup(self)
-        # Add or connect icon in toolbar
-        self.modifyWindowUI()
+        # Add icon in toolbar (if the module is opened before the end of the startup)
+        addToolbarIcon()
 
-        self._loadUI()
+        with _startupProfiler.phase('uiLoad'):
+            self._loadUI()
         self.logic = vCastSlicerLogic()
 
         # Connections
         self._setupConnections()
+        _startupProfiler.stop('widgetSetup', start)
     
     def _loadUI(self):
         """
@@ -173,6 +405,8 @@ class vCastSlicerWidget(ScriptedLoadableModuleWidget, VTKObservationMixin):
             self.ui.applyButton.toolTip = "Please select a valid directory for vCastSender.exe"
             self.ui.applyButton.enabled = False
             
+        # Servers only accept connections from this computer unless allowed in the settings
+        self.ui.networkAccessCheckBox.checked = bool(vCastSlicerSettings().get('allowNetworkAccess', False))
 
         # Set scene in MRML widgets. Make sure that in Qt designer the top-level qMRMLWidget's
         # "mrmlSceneChanged(vtkMRMLScene*)" signal in is connected to each MRML widget's.
@@ -193,6 +427,18 @@ class vCastSlicerWidget(ScriptedLoadableModuleWidget, VTKObservationMixin):
 
         # Buttons
         self.ui.applyButton.connect('clicked(bool)', self.onApplyButton)
+        self.ui.streamButton.connect('toggled(bool)', self.onStreamButton)
+        self.ui.networkAccessCheckBox.connect('toggled(bool)', self.onNetworkAccessToggled)
+        self.ui.sharedMemoryCheckBox.connect('toggled(bool)', self.onSharedMemoryToggled)
+        self.ui.stateSyncCheckBox.connect('toggled(bool)', self.onStateSyncToggled)
+        self.ui.telemetryExportCheckBox.connect('toggled(bool)', self.onTelemetryExportToggled)
+        self.ui.metricsServerCheckBox.connect('toggled(bool)', self.onMetricsServerToggled)
+        self.ui.telemetryCollapsibleButton.connect('contentsCollapsed(bool)', self.onTelemetryCollapsed)
+        self.ui.targetDisplayComboBox.connect('currentIndexChanged(int)', self.onTargetDisplayChanged)
+        self.ui.recordButton.connect('toggled(bool)', self.onRecordToggled)
+        self.ui.replayButton.connect('toggled(bool)', self.onReplayToggled)
+        self.ui.replaySpeedSpinBox.connect('valueChanged(double)', self.logic.setReplaySpeed)
+        self.ui.replaySlider.connect('sliderReleased()', self.onReplaySliderReleased)
 
         # Make sure parameter node is initialized (needed for module reload)
         self.initializeParameterNode()
@@ -202,6 +448,18 @@ class vCastSlicerWidget(ScriptedLoadableModuleWidget, VTKObservationMixin):
         Called when the application closes and the module widget is destroyed.
         """
         self.removeObservers()
+        if self._telemetryTimer is not None:
+            self._telemetryTimer.stop()
+        if self.logic is not None:
+            self.logic.stopStreaming()
+            self.logic.stopFrameRing()
+            self.logic.stopStateSync()
+            self.logic.stopTelemetryExport()
+            self.logic.stopMetricsServer()
+            self.logic.stopRecording()
+            self.logic.stopReplay()
+        if self._replayTimer is not None:
+            self._replayTimer.stop()
 
     def onSceneStartClose(self, caller, event):
         """
@@ -264,7 +522,6 @@ class vCastSlicerWidget(ScriptedLoadableModuleWidget, VTKObservationMixin):
         The module GUI is updated to show the current state of the parameter node.
         """
         if self._parameterNode is None or self._updatingGUIFromParameterNode:
-            print('lolo')
             return
 
         # Make sure GUI changes do not call updateParameterNodeFromGUI (it could cause infinite loop)
@@ -314,11 +571,13 @@ class vCastSlicerWidget(ScriptedLoadableModuleWidget, VTKObservationMixin):
         """
         Configures the behavior of 'Apply' button by connecting it to the logic function.
         """
-        # Path to this script
-        pythonScriptPath = os.path.dirname(slicer.util.modulePath(self.moduleName))+'/vCastSlicer.py'
         # Update directory to vCastSender exe file.
+        try:
+            self.logic.setVCastSenderPath(str(self.ui.vCastSenderSelector.currentPath))
+        except (OSError, RuntimeError) as e:
+            slicer.util.errorDisplay(f"Failed to save the path to vCastSender: {e}")
+            return
         self._dir_chosen = self._tmp_dir
-        vCastSlicerLogic().runZoneDetection(str(self.ui.vCastSenderSelector.currentPath), pythonScriptPath)\
         # Update the state of the apply button
         self.ui.applyButton.toolTip = "Please select a new path to vCastSender.exe"
         self.ui.applyButton.enabled = False
@@ -329,65 +588,840 @@ class vCastSlicerWidget(ScriptedLoadableModuleWidget, VTKObservationMixin):
         msgbox.setInformativeText("Path to vCastSender succesfully updated!")
         ret = msgbox.exec()
     
-    # Function to add icon
-    def modifyWindowUI(self):
-        # Look for ModuleToolBar in the mainWindow
-        mainToolBar = slicer.util.findChild(slicer.util.mainWindow(), 'ModuleToolBar')
-        # Variable that saved id of vCast Icon if found
-        vCastIconIdx = None
-        for idx,element in enumerate(mainToolBar.actions()):
-            if element.text == "vCastSender":
-                vCastIconIdx = idx
-        # If vCast Icon was not found, it's added to the toolbar
-        if vCastIconIdx ==  None:        
-            moduleIcon = qt.QIcon(self.resourcePath('Icons/vCastSlicer.png'))
-            self.StyleAction = mainToolBar.addAction(moduleIcon, "vCastSender")
-            self.StyleAction.triggered.connect(self.toggleStyle)
-        # Reset connection (as it was started with the connection from vCastSlicer class)
-        elif self._IconConnected == False:
-            self._IconConnected = True
-            mainToolBar.actions()[idx].triggered.disconnect()
-            mainToolBar.actions()[idx].triggered.connect(self.toggleStyle)
-
-    # Function to set behavior of icon on click
-    def toggleStyle(self):
-        # Message box to give instructions related to vCastSender
-        msgbox = qt.QMessageBox()
-        # Set style of the message box
-        msgbox.setStyleSheet("QLabel{min-width: 700px;}")
-        msgbox.setWindowTitle("vCastSender will open.")
-        msgbox.setInformativeText("After vCastSender is opened, click 'Device List' and choose your ViewSonic device.")
-        msgbox.setStandardButtons(qt.QMessageBox.Cancel | qt.QMessageBox.Ok)
-        msgbox.setDefaultButton(qt.QMessageBox.Ok)
-        ret = msgbox.exec()
-        # If Ok Button is pressed and a vCastSender path has been set
-        if ret == qt.QMessageBox.Ok and len(self._dir_chosen)>0:
+    def onStreamButton(self, checked):
+        """
+        Starts or stops the in-process streaming of the Slicer views.
+        """
+        if checked:
             try:
-                import subprocess
-                subprocess.Popen(
-                self._dir_chosen, shell = True
-                )
-            except:
-                slicer.util.errorDisplay("Failed to open the exe file. Please verify the path.")
-        # If button Cancel is pressed
-        elif ret == qt.QMessageBox.Cancel: 
-            pass
+                url = self.logic.startStreaming(self.ui.portSpinBox.value, self.ui.frameRateSpinBox.value,
+                                                self.ui.qualitySpinBox.value, self.ui.networkAccessCheckBox.checked,
+                                                adaptive=self.ui.adaptiveCheckBox.checked)
+            except OSError as e:
+                slicer.util.errorDisplay(f"Failed to start streaming: {e}")
+                self.ui.streamButton.checked = False
+                return
+            self.ui.streamButton.text = "Stop streaming"
+            self.ui.streamStatusLabel.text = f"Streaming on {url} (also ?tier=half and ?tier=delta)"
         else:
-            slicer.util.errorDisplay("Failed to open the exe file. Please verify the path.")
+            self.logic.stopStreaming()
+            self.ui.streamButton.text = "Start streaming"
+            self.ui.streamStatusLabel.text = "Not streaming"
+        # Settings can't be changed while the server is running
+        for widget in (self.ui.portSpinBox, self.ui.frameRateSpinBox, self.ui.qualitySpinBox, self.ui.adaptiveCheckBox):
+            widget.enabled = not checked
+
+    def onNetworkAccessToggled(self, checked):
+        """
+        Saves whether other devices may connect to the servers started afterwards.
+        """
+        vCastSlicerSettings().set('allowNetworkAccess', bool(checked))
+
+    def onSharedMemoryToggled(self, checked):
+        """
+        Starts or stops publishing the views in the shared-memory ring buffer.
+        """
+        if checked:
+            try:
+                path = self.logic.startFrameRing(frameRate=self.ui.frameRateSpinBox.value)
+            except OSError as e:
+                slicer.util.errorDisplay(f"Failed to create the shared-memory frame buffer: {e}")
+                self.ui.sharedMemoryCheckBox.checked = False
+                return
+            self.ui.sharedMemoryCheckBox.toolTip = f"Frames are published in {path}"
+        else:
+            self.logic.stopFrameRing()
+            self.ui.sharedMemoryCheckBox.toolTip = "Publish the views in a memory-mapped file for local consumers."
+
+    def onStateSyncToggled(self, checked):
+        """
+        Starts or stops sending the scene state to remote renderers, on the port after the stream port.
+        """
+        if checked:
+            try:
+                host, port = self.logic.startStateSync(self.ui.portSpinBox.value + 1,
+                                                       self.ui.networkAccessCheckBox.checked)
+            except OSError as e:
+                slicer.util.errorDisplay(f"Failed to start the scene-state sync: {e}")
+                self.ui.stateSyncCheckBox.checked = False
+                return
+            self.ui.stateSyncCheckBox.toolTip = f"Scene state is sent on {host}:{port}"
+        else:
+            self.logic.stopStateSync()
+            self.ui.stateSyncCheckBox.toolTip = ("Send the cameras, slice offsets, visibility and transforms (port + 1)"
+                                                 " to clients that render the scene themselves.")
+
+    def sessionPath(self):
+        return self.ui.sessionPathLineEdit.currentPath or os.path.join(slicer.app.defaultScenePath, 'session.vcrec')
+
+    def onRecordToggled(self, checked):
+        """
+        Starts or stops recording the session (cameras, slice offsets, visibility and transforms).
+        """
+        if checked:
+            path = self.sessionPath()
+            try:
+                self.logic.startRecording(path)
+            except OSError as e:
+                slicer.util.errorDisplay(f"Failed to start recording the session: {e}")
+                self.ui.recordButton.checked = False
+                return
+            self.ui.sessionPathLineEdit.setCurrentPath(path)
+            self.ui.replayButton.enabled = False
+            self.ui.sessionStatusLabel.text = f"Recording to {path}"
+        else:
+            stats = self.logic.stopRecording()
+            self.ui.replayButton.enabled = True
+            if stats is not None:
+                self.ui.sessionStatusLabel.text = (f"Recorded {stats['duration']:.0f} s in {stats['bytes']/1e3:.0f} kB"
+                                                   f" ({stats['keyframes']} keyframes)")
+
+    def onReplayToggled(self, checked):
+        """
+        Starts or stops replaying the session file in the scene (and so on the cast devices).
+        """
+        if checked:
+            try:
+                duration = self.logic.startReplay(self.sessionPath(), self.ui.replaySpeedSpinBox.value,
+                                                  onFinished=self.onReplayFinished)
+            except (OSError, ValueError) as e:
+                slicer.util.errorDisplay(f"Failed to replay the session: {e}")
+                self.ui.replayButton.checked = False
+                return
+            self.ui.recordButton.enabled = False
+            self.ui.replaySlider.enabled = True
+            self.ui.replaySlider.maximum = max(int(10*duration), 1)
+            if self._replayTimer is None:
+                self._replayTimer = qt.QTimer()
+                self._replayTimer.setInterval(250)
+                self._replayTimer.connect('timeout()', self.updateReplayStatus)
+            self._replayTimer.start()
+        else:
+            self.logic.stopReplay()
+            self.onReplayFinished()
+
+    def onReplayFinished(self):
+        if self._replayTimer is not None:
+            self._replayTimer.stop()
+        self.ui.replayButton.checked = False
+        self.ui.recordButton.enabled = True
+        self.ui.replaySlider.enabled = False
+        self.ui.sessionStatusLabel.text = "Replay finished"
+
+    def onReplaySliderReleased(self):
+        self.logic.seekReplay(self.ui.replaySlider.value/10)
+
+    def updateReplayStatus(self):
+        position, duration = self.logic.replayPosition, self.logic.replayDuration
+        if not self.ui.replaySlider.sliderDown:
+            self.ui.replaySlider.value = int(10*position)
+        self.ui.sessionStatusLabel.text = f"Replaying {position:.0f} / {duration:.0f} s"
+
+    def onTelemetryCollapsed(self, collapsed):
+        """
+        Refreshes the performance panel every second while it is expanded.
+        """
+        if collapsed:
+            if self._telemetryTimer is not None:
+                self._telemetryTimer.stop()
+            return
+        if self._telemetryTimer is None:
+            self._telemetryTimer = qt.QTimer()
+            self._telemetryTimer.setInterval(1000)
+            self._telemetryTimer.connect('timeout()', self.updateTelemetryPanel)
+        self._telemetryTimer.start()
+        self.updateTelemetryPanel()
+
+    def updateTelemetryPanel(self):
+        """
+        Shows the latest measurements (only while the performance section is expanded).
+        """
+        from vCastSlicerLib.telemetry import formatSnapshot
+        if self.ui.telemetryCollapsibleButton.collapsed:
+            return
+        self.ui.telemetryLabel.text = (formatSnapshot(vCastSlicerTelemetry().snapshot())
+                                       + f"\nStartup: {_startupProfiler.report()}")
+
+    def onTelemetryExportToggled(self, checked):
+        """
+        Starts or stops appending the measurements to a rolling file.
+        """
+        if checked:
+            path = self.logic.startTelemetryExport()
+            self.ui.telemetryExportCheckBox.toolTip = f"Measurements are appended to {path}"
+        else:
+            self.logic.stopTelemetryExport()
+
+    def onMetricsServerToggled(self, checked):
+        """
+        Starts or stops serving the measurements on /metrics, on the second port after the stream port.
+        """
+        if checked:
+            try:
+                url = self.logic.startMetricsServer(self.ui.portSpinBox.value + 2,
+                                                    self.ui.networkAccessCheckBox.checked)
+            except OSError as e:
+                slicer.util.errorDisplay(f"Failed to serve the measurements: {e}")
+                self.ui.metricsServerCheckBox.checked = False
+                return
+            self.ui.metricsServerCheckBox.toolTip = f"Measurements are served on {url}"
+        else:
+            self.logic.stopMetricsServer()
+            self.ui.metricsServerCheckBox.toolTip = ("Serve the measurements as JSON on /metrics (port + 2),"
+                                                     " also while not streaming.")
+
+    def onTargetDisplayChanged(self, index):
+        """
+        Volume-renders the visible volumes at the resolution the selected display can render.
+        """
+        display = TARGET_DISPLAYS[index]
+        volumes = self.logic.showVolumesForDisplay(display, self.onPyramidShown)
+        models = self.logic.showModelsForDisplay(display, self.onModelLODsShown)
+        self.ui.targetDisplayStatusLabel.text = (f"{volumes} volume(s) and {models} model(s) switched,"
+                                                 f" {self.logic.pyramidBuildCount + self.logic.meshLODBuildCount}"
+                                                 " being prepared")
+
+    def onPyramidShown(self, volumeNode, level):
+        """
+        Called when a volume downsampled in the background is shown.
+        """
+        self.ui.targetDisplayStatusLabel.text = (f"{volumeNode.GetName()} shown at 1/{2**level} resolution,"
+                                                 f" {self.logic.pyramidBuildCount} volume(s) being downsampled")
+
+    def onModelLODsShown(self, triangles):
+        """
+        Called when the models decimated in the background are shown.
+        """
+        self.ui.targetDisplayStatusLabel.text = f"Models shown with {triangles} triangles in total"
 
 #########################################################################################
 ####                                                                                 ####
 #### vCastSlicerLogic                                                          ####
 ####                                                                                 ####
 #########################################################################################
-class vCastSlicerLogic(ScriptedLoadableModuleLogic):
+class vCastSlicerLogic(ScriptedLoadableModuleLogic, VTKObservationMixin):
     """
   """
 
     def __init__(self):
         ScriptedLoadableModuleLogic.__init__(self)
-        # Create a Progress Bar
-        self.pb = qt.QProgressBar()
+        VTKObservationMixin.__init__(self)  # needed for the observation of the views
+        # Progress bar of the extension installs, created on first use
+        self._progressBar = None
+        # Capture of the views, shared by the stream server and the shared-memory ring.
+        # Captures are only done when the views change (see _observeViews).
+        self._viewCapture = None
+        self._scheduler = None
+        self._consumerTimer = None
+        self._lastClientCount = 0
+        self._streamServer = None
+        self._frameRing = None
+        # Scene-state sync for remote renderers, flushed at most once per display frame
+        self._stateSyncServer = None
+        self._stateScheduler = None
+        # Rolling file of the performance measurements, and their HTTP server
+        self._telemetryExporter = None
+        self._metricsServer = None
+        # Zone tables used by runZoneDetection
+        self._zoneNames = None
+        # Pyramids of the volumes: {volume node ID: (image MTime, key)}, and the ones being
+        # built: {volume node ID: (future, image MTime, display, onShown)}
+        self._pyramidKeys = {}
+        self._pyramidBuilds = {}
+        self._pyramidTimer = None
+        # Levels of detail of the models: {model node ID: (polydata MTime, key)}, the ones
+        # being built: {model node ID: (future, polydata MTime)}, and the models to show
+        # once they are built: (display, model node IDs, onShown)
+        self._meshLODKeys = {}
+        self._meshLODBuilds = {}
+        self._meshLODRequest = None
+        self._meshLODTimer = None
+        # Session being recorded (scene state sent to its encoder like to the state sync one),
+        # and session being replayed
+        self._recorder = None
+        self._recordScheduler = None
+        self._observingState = False
+        self._player = None
+        self._replayTimer = None
+        self._onReplayFinished = None
+        # Image filters of the offscreen views (see renderPose)
+        self._prerenderCapture = None
+        # Background installation of extensions
+        self._downloadTask = None
+        self._downloadTimer = None
+        self._serverInstallTimer = None
+    
+    @property
+    def pb(self):
+        if self._progressBar is None:
+            self._progressBar = qt.QProgressBar()
+        return self._progressBar
+
+    def installExtension(self, extensionName, onFinished=None, retries=3):
+        """
+        Installs an extension without blocking the main thread, and calls onFinished(success,
+        error) at the end. From the Slicer extensions server, the extensions manager queries the
+        metadata, downloads and installs the archive asynchronously (retrying up to retries
+        times). From a local catalog
+        (EXTENSIONS_CATALOG_ENV), the archive is looked up and downloaded in a worker thread
+        (resuming and retrying if needed, and reusing the archive cache) and installed on the
+        main thread once downloaded.
+        """
+        manager = slicer.app.extensionsManagerModel()
+        catalogPath = os.environ.get(EXTENSIONS_CATALOG_ENV)
+        # Progress bar in busy mode until the size of the archive is known
+        self.pb.setWindowTitle(f"Installing {extensionName}")
+        self.pb.setRange(0, 0)
+        self.pb.show()
+        if catalogPath:
+            self._installFromCatalog(manager, catalogPath, extensionName, onFinished, retries)
+        else:
+            self._installFromServer(manager, extensionName, onFinished, retries)
+
+    def _installFromCatalog(self, manager, catalogPath, extensionName, onFinished, retries):
+        """
+        Downloads the archive of an extension from a local catalog in a worker thread, polled
+        from the main thread.
+        """
+        from vCastSlicerLib.extensions import ExtensionDownloadTask, LocalExtensionCatalog
+        cacheDir = os.path.join(slicer.app.cachePath, 'vCastSlicer', 'Extensions')
+        self._downloadTask = ExtensionDownloadTask(LocalExtensionCatalog(catalogPath), extensionName, cacheDir, retries)
+        self._downloadTask.start()
+        self._downloadTimer = qt.QTimer()
+        self._downloadTimer.setInterval(100)
+        self._downloadTimer.connect('timeout()', lambda: self._checkDownload(manager, onFinished))
+        self._downloadTimer.start()
+
+    def _installFromServer(self, manager, extensionName, onFinished, retries):
+        """
+        Installs an extension from the Slicer extensions server with the extensions manager.
+        The manager reports the download progress and the installation with signals; an attempt
+        fails if the installation hasn't been reported after EXTENSION_INSTALL_TIMEOUT, and is
+        tried again after 1, 2, 4... s, up to retries times. The manager downloads the archive
+        into its own temporary directory and doesn't report its path, so unlike the archives of
+        a local catalog it can't be kept in the archive cache of the module.
+        """
+        # One timer per installation, for the timeout of an attempt and the delay before the
+        # next one. It is stopped when the installation finishes, so it can't fail a later one.
+        if self._serverInstallTimer is not None:
+            self._serverInstallTimer.stop()
+        timer = qt.QTimer()
+        timer.setSingleShot(True)
+        self._serverInstallTimer = timer
+        attempt = {'count': 0, 'running': False}
+
+        def onProgress(name, received, total):
+            if name == extensionName and total > 0:
+                self.pb.setRange(0, 100)
+                self.pb.setValue(int(100*received/total))
+
+        def onInstalled(name):
+            if name == extensionName:
+                finish(True, None)
+
+        def start():
+            attempt['count'] += 1
+            attempt['running'] = True
+            if not manager.downloadAndInstallExtensionByName(extensionName, True, False):
+                failed(f"Could not start the installation of {extensionName} from the extensions server")
+                return
+            timer.start(EXTENSION_INSTALL_TIMEOUT)
+
+        def failed(error):
+            if attempt['count'] > retries:
+                finish(False, error)
+                return
+            logging.warning(f"{error}, trying again")
+            attempt['running'] = False
+            timer.start(1000*2**(attempt['count'] - 1))
+
+        def onTimeout():
+            if attempt['running']:
+                failed(f"The installation of {extensionName} timed out")
+            else:
+                start()
+
+        def finish(success, error):
+            # Called once: by the manager signal, or when the last attempt failed
+            if self._serverInstallTimer is not timer:
+                return
+            timer.stop()
+            self._serverInstallTimer = None
+            manager.installDownloadProgress.disconnect(onProgress)
+            manager.extensionInstalled.disconnect(onInstalled)
+            self._finishInstall(extensionName, success, error, onFinished)
+
+        manager.installDownloadProgress.connect(onProgress)
+        manager.extensionInstalled.connect(onInstalled)
+        timer.connect('timeout()', onTimeout)
+        start()
+
+    def _checkDownload(self, manager, onFinished):
+        """
+        Polls the download task: updates the progress bar and installs the archive when done.
+        """
+        task = self._downloadTask
+        done, total = task.progress
+        if total:
+            self.pb.setRange(0, 100)
+            self.pb.setValue(int(100*done/total))
+        if not task.isFinished:
+            return
+        self._downloadTimer.stop()
+        self._downloadTimer = None
+        self._downloadTask = None
+        success, error = False, task.error
+        if task.state == 'done':
+            success = manager.installExtension(task.archivePath)
+            if not success:
+                error = f"Could not install {task.archivePath}"
+        self._finishInstall(task.name, success, error, onFinished)
+
+    def _finishInstall(self, extensionName, success, error, onFinished):
+        """
+        Function to cache the result of an installation in the module settings (see
+        vCastSlicer.checkSlicerVR) and report it.
+        """
+        vCastSlicerSettings().set(extensionName, {'installed': bool(success), 'checkedAt': time.time()})
+        self.pb.hide()
+        if onFinished is not None:
+            onFinished(bool(success), error)
+    
+    def startStreaming(self, port=8090, frameRate=15, quality=75, allowNetworkAccess=False, adaptive=False):
+        """
+        Starts serving the rendered views as MJPEG over HTTP. Frames are captured on the
+        main thread; encoding and sending is done by the server threads. Three tiers are
+        served, each encoded once for all its viewers (and only while it has viewers): full
+        resolution JPEG (default), half resolution JPEG ('?tier=half' in the URL) and the
+        changed tiles of full resolution frames ('?tier=delta', see vCastSlicerLib.deltacodec),
+        for viewers that decode them. With adaptive, frameRate and quality are the maximums:
+        the resolution, quality and frame rate of each viewer follow its link.
+        Only this computer can connect unless allowNetworkAccess (the views are served without
+        authentication). Returns the URL of the stream.
+        """
+        from vCastSlicerLib.deltacodec import TileDeltaEncoder
+        from vCastSlicerLib.fanout import Tier
+        from vCastSlicerLib.network import listenHost
+        from vCastSlicerLib.ratecontrol import RateLimits
+        from vCastSlicerLib.streaming import JPEGEncoder, StreamServer
+        self.stopStreaming()
+        tiers = [Tier('full', JPEGEncoder(quality)), Tier('half', JPEGEncoder(quality), scale=0.5),
+                 Tier('delta', TileDeltaEncoder())]
+        rateLimits = None
+        if adaptive:
+            rateLimits = RateLimits(minQuality=min(30, quality), maxQuality=quality, minFrameRate=min(5, frameRate),
+                                    maxFrameRate=frameRate)
+        self._streamServer = StreamServer(listenHost(allowNetworkAccess), port, frameRate, tiers=tiers, telemetry=vCastSlicerTelemetry(),
+                                          rateLimits=rateLimits)
+        self._streamServer.start()
+        self._startCapture(frameRate)
+        return self._streamServer.url
+
+    def stopStreaming(self):
+        """
+        Closes the stream server (and stops capturing if nothing else needs frames).
+        """
+        if self._streamServer is not None:
+            self._streamServer.stop()
+            self._streamServer = None
+        self._stopCaptureIfIdle()
+
+    def startFrameRing(self, path=None, frameRate=15):
+        """
+        Starts publishing the rendered views in a shared-memory ring buffer, so that local
+        consumers can read them without copies. The ring file is specific to this session
+        (unless path is given) and announced to the consumers in
+        vCastSlicerLib.framering.ANNOUNCEMENT_PATH. Returns the path of the ring file.
+        Raises FileExistsError if another process writes the ring file.
+        """
+        from vCastSlicerLib.framering import FrameRingWriter
+        self.stopFrameRing()
+        viewport = slicer.app.layoutManager().viewport()
+        ratio = viewport.devicePixelRatio()
+        # Slots big enough for 4K frames, or for the whole layout if it is bigger
+        maxWidth = max(3840, int(viewport.width*ratio))
+        maxHeight = max(2160, int(viewport.height*ratio))
+        self._frameRing = FrameRingWriter(path, maxWidth=maxWidth, maxHeight=maxHeight)
+        self._startCapture(frameRate)
+        return self._frameRing.path
+
+    def stopFrameRing(self):
+        """
+        Stops publishing frames in the shared-memory ring buffer.
+        """
+        if self._frameRing is not None:
+            # Rings are per session: don't leave the file behind
+            self._frameRing.close(remove=True)
+            self._frameRing = None
+        self._stopCaptureIfIdle()
+
+    def startTelemetryExport(self, path=None, interval=5.0):
+        """
+        Starts appending the performance measurements every interval seconds to a rolling
+        JSON-lines (or CSV, if path ends with .csv) file. Returns the path of the file.
+        """
+        from vCastSlicerLib.telemetry import TelemetryExporter
+        self.stopTelemetryExport()
+        if path is None:
+            settingsDir = os.path.dirname(slicer.app.slicerUserSettingsFilePath)
+            path = os.path.join(settingsDir, 'vCastSlicerTelemetry.jsonl')
+        self._telemetryExporter = TelemetryExporter(vCastSlicerTelemetry(), path, interval)
+        self._telemetryExporter.start()
+        return path
+
+    def stopTelemetryExport(self):
+        if self._telemetryExporter is not None:
+            self._telemetryExporter.stop()
+            self._telemetryExporter = None
+
+    def startMetricsServer(self, port=8092, allowNetworkAccess=False):
+        """
+        Starts serving the performance measurements as JSON on /metrics, whether streaming or
+        not (the stream server also serves them on its own port). Only this computer can
+        connect unless allowNetworkAccess. Returns the URL.
+        """
+        from vCastSlicerLib.network import listenHost
+        from vCastSlicerLib.telemetry import MetricsServer
+        self.stopMetricsServer()
+        self._metricsServer = MetricsServer(vCastSlicerTelemetry(), listenHost(allowNetworkAccess), port)
+        self._metricsServer.start()
+        return self._metricsServer.url
+
+    def stopMetricsServer(self):
+        if self._metricsServer is not None:
+            self._metricsServer.stop()
+            self._metricsServer = None
+
+    def startStateSync(self, port=8091, allowNetworkAccess=False, frameRate=60):
+        """
+        Starts sending the scene state (cameras, slice offsets, display visibility/opacity
+        and linear transforms) to remote renderers, as deltas sent at most frameRate times
+        per second. Much lighter than streaming pixels for clients that render the scene
+        themselves. Only this computer can connect unless allowNetworkAccess. Returns the
+        (host, port) clients connect to.
+        """
+        from vCastSlicerLib.network import listenHost, reachableHost
+        from vCastSlicerLib.scheduler import CaptureScheduler
+        from vCastSlicerLib.statesync import StateSyncServer
+        self.stopStateSync()
+        self._stateSyncServer = StateSyncServer(host=listenHost(allowNetworkAccess), port=port)
+        self._stateScheduler = CaptureScheduler(self._stateSyncServer.flush, self._scheduleCapture, frameRate)
+        self._observeState()
+        # Clients joining get a snapshot of the current state
+        self._stateSyncServer.start()
+        return reachableHost(self._stateSyncServer.host), self._stateSyncServer.port
+
+    def stopStateSync(self):
+        """
+        Closes the scene-state sync server.
+        """
+        if self._stateSyncServer is None:
+            return
+        self._stateScheduler.stop()
+        self._stateScheduler = None
+        self._stateSyncServer.stop()
+        self._stateSyncServer = None
+        self._stopObservingStateIfIdle()
+
+    def _stateConsumers(self):
+        """
+        Returns the (encoder, scheduler) of the state sync and of the session recorder, when active.
+        """
+        consumers = []
+        if self._stateSyncServer is not None:
+            consumers.append((self._stateSyncServer.encoder, self._stateScheduler))
+        if self._recorder is not None:
+            consumers.append((self._recorder.encoder, self._recordScheduler))
+        return consumers
+
+    def _observeState(self):
+        """
+        Observes the synced nodes (once for all the consumers) and sends their current state
+        to the encoders.
+        """
+        if self._observingState:
+            for className in STATE_SYNC_CLASSES:
+                for node in slicer.util.getNodesByClass(className):
+                    self.onStateNodeModified(node)
+            return
+        self._observingState = True
+        for className in STATE_SYNC_CLASSES:
+            for node in slicer.util.getNodesByClass(className):
+                self._observeStateNode(node)
+        self.addObserver(slicer.mrmlScene, slicer.mrmlScene.NodeAddedEvent, self.onStateNodeAdded)
+        self.addObserver(slicer.mrmlScene, slicer.mrmlScene.NodeRemovedEvent, self.onStateNodeRemoved)
+
+    def _stopObservingStateIfIdle(self):
+        if self._observingState and not self._stateConsumers():
+            self.removeObservers(self.onStateNodeModified)
+            self.removeObservers(self.onStateNodeAdded)
+            self.removeObservers(self.onStateNodeRemoved)
+            self._observingState = False
+
+    def _observeStateNode(self, node):
+        if not any(node.IsA(className) for className in STATE_SYNC_CLASSES):
+            return
+        if node.IsA('vtkMRMLTransformNode') and not node.IsLinear():
+            return
+        self.addObserver(node, vtk.vtkCommand.ModifiedEvent, self.onStateNodeModified)
+        if node.IsA('vtkMRMLTransformNode'):
+            self.addObserver(node, slicer.vtkMRMLTransformNode.TransformModifiedEvent, self.onStateNodeModified)
+        self.onStateNodeModified(node)
+
+    @vtk.calldata_type(vtk.VTK_OBJECT)
+    def onStateNodeAdded(self, caller, event, node):
+        self._observeStateNode(node)
+
+    @vtk.calldata_type(vtk.VTK_OBJECT)
+    def onStateNodeRemoved(self, caller, event, node):
+        self.removeObserver(node, vtk.vtkCommand.ModifiedEvent, self.onStateNodeModified)
+        if node.IsA('vtkMRMLTransformNode'):
+            self.removeObserver(node, slicer.vtkMRMLTransformNode.TransformModifiedEvent, self.onStateNodeModified)
+
+    def onStateNodeModified(self, node, event=None):
+        """
+        Records the synced state of a node in the encoders of the state sync and of the
+        session recorder. Unchanged values are not sent.
+        """
+        nodeID = node.GetID()
+        for encoder, scheduler in self._stateConsumers():
+            if node.IsA('vtkMRMLCameraNode'):
+                encoder.setCamera(nodeID, node.GetPosition(), node.GetFocalPoint(), node.GetViewUp(), node.GetViewAngle())
+            elif node.IsA('vtkMRMLSliceNode'):
+                sliceLogic = slicer.app.applicationLogic().GetSliceLogic(node)
+                if sliceLogic is not None:
+                    encoder.setSliceOffset(nodeID, sliceLogic.GetSliceOffset())
+            elif node.IsA('vtkMRMLDisplayNode'):
+                encoder.setDisplay(nodeID, node.GetVisibility(), node.GetOpacity())
+            elif node.IsA('vtkMRMLTransformNode'):
+                matrix = vtk.vtkMatrix4x4()
+                node.GetMatrixTransformToParent(matrix)
+                encoder.setTransform(nodeID, [matrix.GetElement(i, j) for i in range(4) for j in range(4)])
+            if encoder.hasChanges:
+                scheduler.requestCapture()
+
+    def startRecording(self, path, frameRate=30):
+        """
+        Starts recording the session to path: the changes of the cameras, slice offsets,
+        display visibility/opacity and linear transforms, at most frameRate times per second.
+        """
+        from vCastSlicerLib.recorder import SessionRecorder
+        from vCastSlicerLib.scheduler import CaptureScheduler
+        self.stopRecording()
+        self._recorder = SessionRecorder(path)
+        self._recordScheduler = CaptureScheduler(self._recorder.record, self._scheduleCapture, frameRate)
+        self._observeState()
+        self._recorder.record()
+
+    def stopRecording(self):
+        """
+        Closes the session being recorded. Returns its duration (s), size (bytes) and keyframe count.
+        """
+        if self._recorder is None:
+            return None
+        self._recordScheduler.stop()
+        self._recordScheduler = None
+        recorder, self._recorder = self._recorder, None
+        recorder.close()
+        self._stopObservingStateIfIdle()
+        return {'duration': recorder.duration, 'bytes': recorder.bytesWritten, 'keyframes': recorder.keyframeCount}
+
+    @property
+    def isRecording(self):
+        return self._recorder is not None
+
+    def startReplay(self, path, speed=1.0, position=0.0, onFinished=None):
+        """
+        Replays a recorded session in the scene from position (s) at speed times real time:
+        the views change as they did, and are cast as usual. Nodes that are not in the scene
+        are skipped. Returns the duration of the session. Raises OSError or ValueError if the
+        file can't be read.
+        """
+        from vCastSlicerLib.recorder import SessionPlayer, SessionReader
+        from vCastSlicerLib.statesync import StateSyncReceiver
+        self.stopReplay()
+        reader = SessionReader(path)
+        receiver = StateSyncReceiver(listener=self._applyRecordedState)
+        self._player = SessionPlayer(reader, receiver.apply, speed)
+        self._onReplayFinished = onFinished
+        self._player.play(position)
+        self._replayTimer = qt.QTimer()
+        self._replayTimer.setInterval(10)
+        self._replayTimer.connect('timeout()', self._pollReplay)
+        self._replayTimer.start()
+        return reader.duration
+
+    def stopReplay(self):
+        if self._player is None:
+            return
+        self._replayTimer.stop()
+        self._replayTimer = None
+        self._player.reader.close()
+        self._player = None
+
+    def seekReplay(self, position):
+        if self._player is not None:
+            self._player.seek(position)
+
+    def setReplaySpeed(self, speed):
+        if self._player is not None:
+            self._player.speed = speed
+
+    @property
+    def replayPosition(self):
+        return self._player.position if self._player is not None else 0.0
+
+    @property
+    def replayDuration(self):
+        return self._player.reader.duration if self._player is not None else 0.0
+
+    def _pollReplay(self):
+        self._player.poll()
+        if self._player.finished:
+            onFinished = self._onReplayFinished
+            self.stopReplay()
+            if onFinished is not None:
+                onFinished()
+
+    def _applyRecordedState(self, kind, name, values):
+        """
+        Applies a state message of a recorded session to its node.
+        """
+        from vCastSlicerLib.statesync import CAMERA, DISPLAY, SLICE, TRANSFORM
+        node = slicer.mrmlScene.GetNodeByID(name)
+        if node is None:
+            return
+        if kind == CAMERA:
+            wasModified = node.StartModify()
+            node.SetPosition(values[0:3])
+            node.SetFocalPoint(values[3:6])
+            node.SetViewUp(values[6:9])
+            node.SetViewAngle(values[9])
+            node.EndModify(wasModified)
+        elif kind == SLICE:
+            sliceLogic = slicer.app.applicationLogic().GetSliceLogic(node)
+            if sliceLogic is not None:
+                sliceLogic.SetSliceOffset(values[0])
+        elif kind == DISPLAY:
+            wasModified = node.StartModify()
+            node.SetVisibility(bool(values[0]))
+            node.SetOpacity(values[1])
+            node.EndModify(wasModified)
+        elif kind == TRANSFORM:
+            matrix = vtk.vtkMatrix4x4()
+            matrix.DeepCopy(values)
+            node.SetMatrixTransformToParent(matrix)
+
+    def _startCapture(self, frameRate):
+        """
+        Starts capturing the views when they change, at most frameRate times per second.
+        """
+        from vCastSlicerLib.scheduler import CaptureScheduler
+        from vCastSlicerLib.streaming import ViewCapture
+        if self._scheduler is None:
+            self._viewCapture = ViewCapture(self.layoutViews)
+            self._scheduler = CaptureScheduler(self.captureFrame, self._scheduleCapture, frameRate, self._wantsFrames)
+            self._observeViews()
+            slicer.app.layoutManager().connect('layoutChanged(int)', self.onLayoutChanged)
+            # Cheap check (no capture) to send a fresh frame to new consumers of an idle scene
+            self._consumerTimer = qt.QTimer()
+            self._consumerTimer.setInterval(500)
+            self._consumerTimer.connect('timeout()', self._checkConsumers)
+            self._consumerTimer.start()
+        self._scheduler.frameRate = frameRate
+        self._scheduler.requestCapture()
+
+    def _stopCaptureIfIdle(self):
+        if self._streamServer is None and self._frameRing is None and self._scheduler is not None:
+            self._scheduler.stop()
+            self.removeObservers(self._scheduler.requestCapture)
+            self._scheduler = None
+            self._consumerTimer.stop()
+            self._consumerTimer = None
+            slicer.app.layoutManager().disconnect('layoutChanged(int)', self.onLayoutChanged)
+            self._viewCapture = None
+
+    def _scheduleCapture(self, delay, callback):
+        qt.QTimer.singleShot(int(1000*delay), callback)
+
+    def _wantsFrames(self):
+        return self._frameRing is not None or (self._streamServer is not None and self._streamServer.clientCount > 0)
+
+    def _observeViews(self):
+        """
+        Observes everything that can change the pixels of the views: the end of every render,
+        the cameras and slice nodes (interaction) and nodes added to or removed from the scene.
+        All of them only request a capture; the scheduler coalesces the requests.
+        """
+        requestCapture = self._scheduler.requestCapture
+        for renderWindow, position in self.layoutViews():
+            self.addObserver(renderWindow, vtk.vtkCommand.EndEvent, requestCapture)
+        for className in ('vtkMRMLCameraNode', 'vtkMRMLSliceNode'):
+            for node in slicer.util.getNodesByClass(className):
+                self.addObserver(node, vtk.vtkCommand.ModifiedEvent, requestCapture)
+        self.addObserver(slicer.mrmlScene, slicer.mrmlScene.NodeAddedEvent, requestCapture)
+        self.addObserver(slicer.mrmlScene, slicer.mrmlScene.NodeRemovedEvent, requestCapture)
+
+    def onLayoutChanged(self, layout):
+        """
+        Views were added or removed: observe the new ones and capture the new layout.
+        """
+        if self._scheduler is None:
+            return
+        self.removeObservers(self._scheduler.requestCapture)
+        self._viewCapture.reset()
+        self._observeViews()
+        self._scheduler.requestCapture()
+
+    def _checkConsumers(self):
+        clientCount = self._streamServer.clientCount if self._streamServer is not None else 0
+        newClient = clientCount > self._lastClientCount
+        self._lastClientCount = clientCount
+        if (newClient or self._scheduler.stale) and self._wantsFrames():
+            self._scheduler.requestCapture()
+
+    def captureCounters(self):
+        """
+        Returns the counters of the capture scheduler (requested, coalesced, captured, skipped).
+        """
+        return self._scheduler.counters() if self._scheduler is not None else {}
+
+    def captureFrame(self):
+        """
+        Grabs the current views and hands the frame over to the stream server and the ring.
+        """
+        streaming = self._streamServer is not None and self._streamServer.clientCount > 0
+        start = time.perf_counter()
+        frame = self._viewCapture.capture()
+        if frame is None:
+            return
+        vCastSlicerTelemetry().observe('capture', time.perf_counter() - start)
+        if streaming:
+            self._streamServer.publish(frame)
+        if self._frameRing is not None:
+            try:
+                self._frameRing.publish(frame)
+            except ValueError as e:
+                logging.warning(str(e))
+
+    def layoutViews(self):
+        """
+        Returns the visible 3D and slice views as (renderWindow, (x, y)) tuples, with (x, y)
+        the position of the view in the layout, in pixels.
+        """
+        layoutManager = slicer.app.layoutManager()
+        viewport = layoutManager.viewport()
+        views = [layoutManager.threeDWidget(i).threeDView() for i in range(layoutManager.threeDViewCount)]
+        views += [layoutManager.sliceWidget(name).sliceView() for name in layoutManager.sliceViewNames()]
+        result = []
+        for view in views:
+            if not view.isVisible():
+                continue
+            position = view.mapTo(viewport, qt.QPoint(0, 0))
+            # Render windows are in device pixels (HiDPI screens)
+            ratio = view.devicePixelRatio()
+            result.append((view.renderWindow(), (int(position.x()*ratio), int(position.y()*ratio))))
+        return result
     
     def setDefaultParameters(self, parameterNode):
         """
@@ -396,45 +1430,399 @@ class vCastSlicerLogic(ScriptedLoadableModuleLogic):
         if not parameterNode.GetParameter("LUT"):
             parameterNode.SetParameter("LUT", "Select LUT file")
 
-    def runZoneDetection(self, vCastSenderPath, pythonScriptPath):
+    def runZoneDetection(self, markupsNode, labelVolumeNode, atlases=None):
         """
-        Updates this file by changing the default _dir_chosen attribute from
-        the vCastSlicer and vCastSlicerWidget classes so that the next time
-        3D Slicer is launched, the directory to vCastSender.exe is saved.
+        Labels every control point of markupsNode (e.g. the SEEG contacts) with the zone of
+        the parcellation labelVolumeNode it is in. The short name is stored in the description
+        of the control point (atlases: the zones.ATLASES by default). Returns the
+        (shortNames, fullNames) arrays. Raises ValueError if the label volume has no color
+        table or is under a non-linear transform.
         """
-        line_to_replace = r'self._dir_chosen = ".*"'
-        replacement = f'self._dir_chosen = "{vCastSenderPath}"'
-        self.replacer(pythonScriptPath, line_to_replace, replacement)
-    
-    def replacer(self, file_path, pattern, subst):
-        """
-        Method to replace a specific pattern in a file to a substitute text.
-        """
-        #Create temp file to write updates
-        fh, abs_path = mkstemp()
-        with fdopen(fh,'w') as new_file:
-            with open(file_path) as old_file:
-                cond = 0 # Condition to only replace first 2 matches
-                i = 0 # id to avoid touching this function
-                for line in old_file:
-                    # Get new line based on conditions
-                    if (cond<2) and (i<280):
-                        tmp_line = re.sub(pattern, subst, line)
-                        # Update condition
-                        if line != tmp_line:
-                            cond += 1
-                    else:
-                        tmp_line = line
-                    # Write line
-                    new_file.write(tmp_line)
-                    i +=1
-                    
-        #Copy the file permissions from the old file to the new file
-        copymode(file_path, abs_path)
-        #Remove original file
-        remove(file_path)
-        #Move new file
-        move(abs_path, file_path)
+        from vCastSlicerLib.zones import ATLASES, ZoneLabeler, labelTable
+        if atlases is None:
+            atlases = ATLASES
+        points = slicer.util.arrayFromMarkupsControlPoints(markupsNode, world=True)
+        labeler = ZoneLabeler(slicer.util.arrayFromVolume(labelVolumeNode), self.worldToIjkMatrix(labelVolumeNode),
+                              labelTable(self.colorNames(labelVolumeNode), self.zoneNames(), atlases))
+        shortNames, fullNames = labeler.classify(points)
+        wasModifying = markupsNode.StartModify()
+        for i, shortName in enumerate(shortNames):
+            markupsNode.SetNthControlPointDescription(i, shortName)
+        markupsNode.EndModify(wasModifying)
+        return shortNames, fullNames
+
+    def zoneNames(self):
+        """
+        Returns the zone tables shipped with the module (read once).
+        """
+        from vCastSlicerLib.zones import loadZoneNames
+        if self._zoneNames is None:
+            self._zoneNames = loadZoneNames(os.path.join(os.path.dirname(__file__), 'Resources'))
+        return self._zoneNames
+
+    def colorNames(self, labelVolumeNode):
+        """
+        Returns {labelValue: colorName} from the color table of a label volume. Raises
+        ValueError if it has none.
+        """
+        displayNode = labelVolumeNode.GetDisplayNode()
+        colorNode = displayNode.GetColorNode() if displayNode is not None else None
+        if colorNode is None:
+            raise ValueError(f"{labelVolumeNode.GetName()} has no color table: the zones can't be named")
+        return {i: colorNode.GetColorName(i) for i in range(colorNode.GetNumberOfColors())}
+
+    def worldToIjkMatrix(self, volumeNode):
+        """
+        Returns the 4x4 matrix from world RAS to the voxel indices of volumeNode, taking its
+        parent transforms into account. Raises ValueError if one of them is not linear.
+        """
+        worldToVolume = vtk.vtkMatrix4x4()
+        if not slicer.vtkMRMLTransformNode.GetMatrixTransformBetweenNodes(None, volumeNode.GetParentTransformNode(),
+                                                                          worldToVolume):
+            raise ValueError(f"{volumeNode.GetName()} is under a non-linear transform: harden it first")
+        rasToIjk = vtk.vtkMatrix4x4()
+        volumeNode.GetRASToIJKMatrix(rasToIjk)
+        vtk.vtkMatrix4x4.Multiply4x4(rasToIjk, worldToVolume, rasToIjk)
+        return slicer.util.arrayFromVTKMatrix(rasToIjk)
+
+    @property
+    def pyramidBuildCount(self):
+        return len(self._pyramidBuilds)
+
+    def showVolumesForDisplay(self, display, onShown=None):
+        """
+        Volume-renders every visible volume at the level of its pyramid suited to display
+        ('desktop', 'vr' or 'board'). Missing pyramids are built in the background and
+        shown when ready (onShown(volumeNode, level) is then called). Returns the number of
+        volumes switched right away.
+        """
+        volRenLogic = slicer.modules.volumerendering.logic()
+        switched = 0
+        for volumeNode in slicer.util.getNodesByClass('vtkMRMLScalarVolumeNode'):
+            if volumeNode.GetAttribute(PYRAMID_SOURCE_ATTRIBUTE):
+                continue
+            displayNode = volRenLogic.GetFirstVolumeRenderingDisplayNode(volumeNode)
+            rendered = displayNode is not None and displayNode.GetVisibility()
+            if (rendered or self.pyramidProxy(volumeNode) is not None) and self.showVolumeForDisplay(
+                    volumeNode, display, onShown):
+                switched += 1
+        return switched
+
+    def showVolumeForDisplay(self, volumeNode, display, onShown=None):
+        """
+        Volume-renders volumeNode at the level suited to display. Returns False if its
+        pyramid has to be built first (see showVolumesForDisplay).
+        """
+        from vCastSlicerLib.pyramid import chooseLevel, levelShapes
+        imageData = volumeNode.GetImageData()
+        if imageData is None:
+            return False
+        array = slicer.util.arrayFromVolume(volumeNode)
+        if chooseLevel(levelShapes(array.shape), display) == 0:
+            self._showPyramidLevel(volumeNode, None, 0)
+            return True
+        cache = vCastSlicerPyramidCache()
+        known = self._pyramidKeys.get(volumeNode.GetID())
+        # The content hash is only computed again when the voxels changed
+        if known is not None and known[0] == imageData.GetMTime() and cache.levels(known[1]) is not None:
+            self._showPyramidLevel(volumeNode, known[1], cache.levelFor(known[1], display))
+            return True
+        mode = 'nearest' if volumeNode.IsA('vtkMRMLLabelMapVolumeNode') else 'mean'
+        # A copy, as the voxels may be edited while the workers read them
+        future = cache.build(array.copy(), mode)
+        self._pyramidBuilds[volumeNode.GetID()] = (future, imageData.GetMTime(), display, onShown)
+        if self._pyramidTimer is None:
+            self._pyramidTimer = qt.QTimer()
+            self._pyramidTimer.setInterval(200)
+            self._pyramidTimer.connect('timeout()', self._checkPyramidBuilds)
+            self._pyramidTimer.start()
+        return False
+
+    def pyramidProxy(self, volumeNode):
+        """
+        Returns the downsampled volume shown instead of volumeNode (None if there is none).
+        """
+        for node in slicer.util.getNodesByClass(volumeNode.GetClassName()):
+            if node.GetAttribute(PYRAMID_SOURCE_ATTRIBUTE) == volumeNode.GetID():
+                return node
+        return None
+
+    def _checkPyramidBuilds(self):
+        """
+        Polls the pyramid builds and shows the volumes whose pyramid is ready.
+        """
+        cache = vCastSlicerPyramidCache()
+        for nodeID, (future, mtime, display, onShown) in list(self._pyramidBuilds.items()):
+            if not future.done():
+                continue
+            del self._pyramidBuilds[nodeID]
+            try:
+                key = future.result()
+            except Exception as e:
+                logging.error(f"Failed to downsample {nodeID}: {e}")
+                continue
+            self._pyramidKeys[nodeID] = (mtime, key)
+            volumeNode = slicer.mrmlScene.GetNodeByID(nodeID)
+            if volumeNode is None:
+                continue
+            level = cache.levelFor(key, display)
+            self._showPyramidLevel(volumeNode, key, level)
+            if onShown is not None:
+                onShown(volumeNode, level)
+        if not self._pyramidBuilds:
+            self._pyramidTimer.stop()
+            self._pyramidTimer = None
+
+    def _showPyramidLevel(self, volumeNode, key, level):
+        """
+        Volume-renders a level of the pyramid of volumeNode: level 0 is volumeNode itself,
+        the others are shown through a hidden volume node with the same transfer functions.
+        """
+        from vCastSlicerLib.pyramid import levelIjkToRas
+        volRenLogic = slicer.modules.volumerendering.logic()
+        displayNode = volRenLogic.GetFirstVolumeRenderingDisplayNode(volumeNode)
+        if displayNode is None:
+            displayNode = volRenLogic.CreateDefaultVolumeRenderingNodes(volumeNode)
+        proxyNode = self.pyramidProxy(volumeNode)
+        if level == 0:
+            if proxyNode is not None:
+                slicer.mrmlScene.RemoveNode(proxyNode)
+            displayNode.SetVisibility(True)
+            return volumeNode
+        cache = vCastSlicerPyramidCache()
+        if proxyNode is None:
+            proxyNode = slicer.mrmlScene.AddNewNodeByClass(volumeNode.GetClassName(),
+                                                           f"{volumeNode.GetName()} (downsampled)")
+            proxyNode.SetAttribute(PYRAMID_SOURCE_ATTRIBUTE, volumeNode.GetID())
+            proxyNode.SetHideFromEditors(True)
+            proxyNode.SetSaveWithScene(False)
+        proxyNode.SetAndObserveTransformNodeID(volumeNode.GetTransformNodeID())
+        ijkToRas = vtk.vtkMatrix4x4()
+        volumeNode.GetIJKToRASMatrix(ijkToRas)
+        proxyIjkToRas = levelIjkToRas(slicer.util.arrayFromVTKMatrix(ijkToRas), level, cache.levels(key)['mode'])
+        proxyNode.SetIJKToRASMatrix(slicer.util.vtkMatrixFromArray(proxyIjkToRas))
+        # Memory-mapped: only read from the disk cache now
+        slicer.util.updateVolumeFromArray(proxyNode, cache.load(key, level))
+        proxyDisplayNode = volRenLogic.GetFirstVolumeRenderingDisplayNode(proxyNode)
+        if proxyDisplayNode is None:
+            proxyDisplayNode = volRenLogic.CreateDefaultVolumeRenderingNodes(proxyNode)
+        proxyDisplayNode.SetAndObserveVolumePropertyNodeID(displayNode.GetVolumePropertyNodeID())
+        proxyDisplayNode.SetAndObserveROINodeID(displayNode.GetROINodeID())
+        proxyDisplayNode.SetCroppingEnabled(displayNode.GetCroppingEnabled())
+        proxyDisplayNode.SetVisibility(True)
+        displayNode.SetVisibility(False)
+        return proxyNode
+
+    @property
+    def meshLODBuildCount(self):
+        return len(self._meshLODBuilds)
+
+    def showModelsForDisplay(self, display, onShown=None):
+        """
+        Shows every visible model at the level of detail that keeps the whole scene within
+        the triangle budget of display ('desktop', 'vr', 'hololens' or 'board'). Missing
+        levels are built in worker processes and the models are switched once all are
+        ready (onShown(triangles) is then called). Returns the number of models switched
+        right away.
+        """
+        from vCastSlicerLib.meshlod import DISPLAY_TRIANGLE_BUDGETS
+        modelNodes = []
+        for modelNode in slicer.util.getNodesByClass('vtkMRMLModelNode'):
+            if modelNode.GetAttribute(MESH_LOD_SOURCE_ATTRIBUTE) or modelNode.GetPolyData() is None:
+                continue
+            displayNode = modelNode.GetDisplayNode()
+            if (displayNode is not None and displayNode.GetVisibility()) or self.meshLODProxy(modelNode) is not None:
+                modelNodes.append(modelNode)
+        self._meshLODRequest = (display, [modelNode.GetID() for modelNode in modelNodes], onShown)
+        if DISPLAY_TRIANGLE_BUDGETS[display] is not None:
+            cache = vCastSlicerMeshLODCache()
+            for modelNode in modelNodes:
+                mtime = modelNode.GetPolyData().GetMTime()
+                known = self._meshLODKeys.get(modelNode.GetID())
+                if known is not None and known[0] == mtime and cache.index(known[1]) is not None:
+                    continue
+                points, triangles = self.modelTriangles(modelNode)
+                self._meshLODBuilds[modelNode.GetID()] = (cache.build(points, triangles), mtime)
+        if self._meshLODBuilds:
+            if self._meshLODTimer is None:
+                self._meshLODTimer = qt.QTimer()
+                self._meshLODTimer.setInterval(200)
+                self._meshLODTimer.connect('timeout()', self._checkMeshLODBuilds)
+                self._meshLODTimer.start()
+            return 0
+        self._showMeshLODs()
+        return len(modelNodes)
+
+    def modelTriangles(self, modelNode):
+        """
+        Returns copies of the points and triangles of a model as (n, 3) arrays.
+        """
+        from vtk.util.numpy_support import vtk_to_numpy
+        polyData = modelNode.GetPolyData()
+        if polyData.GetNumberOfStrips() or polyData.GetPolys().IsHomogeneous() != 3:
+            triangleFilter = vtk.vtkTriangleFilter()
+            triangleFilter.SetInputData(polyData)
+            triangleFilter.Update()
+            polyData = triangleFilter.GetOutput()
+        points = vtk_to_numpy(polyData.GetPoints().GetData()).copy()
+        triangles = vtk_to_numpy(polyData.GetPolys().GetConnectivityArray()).reshape(-1, 3).copy()
+        return points, triangles
+
+    def meshLODProxy(self, modelNode):
+        """
+        Returns the decimated model shown instead of modelNode (None if there is none).
+        """
+        for node in slicer.util.getNodesByClass('vtkMRMLModelNode'):
+            if node.GetAttribute(MESH_LOD_SOURCE_ATTRIBUTE) == modelNode.GetID():
+                return node
+        return None
+
+    def _checkMeshLODBuilds(self):
+        """
+        Polls the level of detail builds and switches the models when all are done.
+        """
+        for nodeID, (future, mtime) in list(self._meshLODBuilds.items()):
+            if not future.done():
+                continue
+            del self._meshLODBuilds[nodeID]
+            try:
+                self._meshLODKeys[nodeID] = (mtime, future.result())
+            except Exception as e:
+                logging.error(f"Failed to decimate {nodeID}: {e}")
+        if self._meshLODBuilds:
+            return
+        self._meshLODTimer.stop()
+        self._meshLODTimer = None
+        triangles = self._showMeshLODs()
+        onShown = self._meshLODRequest[2] if self._meshLODRequest is not None else None
+        if onShown is not None:
+            onShown(triangles)
+
+    def _showMeshLODs(self):
+        """
+        Shows the models of the last request at the levels chosen for its display.
+        Returns the number of triangles shown.
+        """
+        from vCastSlicerLib.meshlod import DISPLAY_TRIANGLE_BUDGETS, chooseLevels
+        display, nodeIDs, _ = self._meshLODRequest
+        modelNodes = [slicer.mrmlScene.GetNodeByID(nodeID) for nodeID in nodeIDs]
+        modelNodes = [modelNode for modelNode in modelNodes if modelNode is not None]
+        budget = DISPLAY_TRIANGLE_BUDGETS[display]
+        cache = vCastSlicerMeshLODCache() if budget is not None else None
+        counts = []
+        for modelNode in modelNodes:
+            known = self._meshLODKeys.get(modelNode.GetID())
+            if budget is not None and known is not None and cache.index(known[1]) is not None:
+                counts.append(cache.counts(known[1]))
+            else:
+                # Without levels (failed build or full resolution): always shown as is
+                counts.append([modelNode.GetPolyData().GetNumberOfCells()])
+        levels = chooseLevels(counts, budget)
+        for modelNode, level in zip(modelNodes, levels):
+            self._showMeshLOD(modelNode, level)
+        return sum(modelCounts[level] for modelCounts, level in zip(counts, levels))
+
+    def _showMeshLOD(self, modelNode, level):
+        """
+        Shows a level of detail of modelNode: level 0 is modelNode itself, the others are
+        shown through a hidden model node with the same display properties.
+        """
+        import numpy
+        from vtk.util.numpy_support import numpy_to_vtk, numpy_to_vtkIdTypeArray
+        displayNode = modelNode.GetDisplayNode()
+        proxyNode = self.meshLODProxy(modelNode)
+        if level == 0:
+            if proxyNode is not None:
+                slicer.mrmlScene.RemoveNode(proxyNode)
+            displayNode.SetVisibility(True)
+            return modelNode
+        points, triangles = vCastSlicerMeshLODCache().load(self._meshLODKeys[modelNode.GetID()][1], level)
+        polyData = vtk.vtkPolyData()
+        polyData.SetPoints(vtk.vtkPoints())
+        polyData.GetPoints().SetData(numpy_to_vtk(numpy.asarray(points), deep=True))
+        polys = vtk.vtkCellArray()
+        polys.SetData(numpy_to_vtkIdTypeArray(numpy.arange(0, 3*len(triangles) + 1, 3, dtype=numpy.int64), deep=True),
+                      numpy_to_vtkIdTypeArray(numpy.asarray(triangles, dtype=numpy.int64).ravel(), deep=True))
+        polyData.SetPolys(polys)
+        if proxyNode is None:
+            proxyNode = slicer.mrmlScene.AddNewNodeByClass('vtkMRMLModelNode', f"{modelNode.GetName()} (LOD)")
+            proxyNode.SetAttribute(MESH_LOD_SOURCE_ATTRIBUTE, modelNode.GetID())
+            proxyNode.SetHideFromEditors(True)
+            proxyNode.SetSaveWithScene(False)
+            proxyNode.CreateDefaultDisplayNodes()
+        proxyNode.SetAndObservePolyData(polyData)
+        proxyNode.SetAndObserveTransformNodeID(modelNode.GetTransformNodeID())
+        proxyNode.GetDisplayNode().CopyContent(displayNode)
+        proxyNode.GetDisplayNode().SetVisibility(True)
+        displayNode.SetVisibility(False)
+        return proxyNode
+
+    def createOffscreenView(self, width, height):
+        """
+        Creates a 3D view of the scene rendering offscreen at width x height, outside of the
+        layout (e.g. in a Slicer started with --no-main-window). Returns the qMRMLThreeDWidget.
+        """
+        viewNode = slicer.mrmlScene.AddNewNodeByClass('vtkMRMLViewNode', 'vCastPrerenderView')
+        viewNode.SetLayoutName('vCastPrerender')
+        viewNode.SetBoxVisible(False)
+        viewNode.SetAxisLabelsVisible(False)
+        viewWidget = slicer.qMRMLThreeDWidget()
+        viewWidget.setMRMLScene(slicer.mrmlScene)
+        viewWidget.setMRMLViewNode(viewNode)
+        viewWidget.resize(width, height)
+        renderWindow = viewWidget.threeDView().renderWindow()
+        renderWindow.SetOffScreenRendering(1)
+        renderWindow.SetSize(width, height)
+        return viewWidget
+
+    def renderPose(self, viewWidget, pose):
+        """
+        Renders a view from a {'position', 'focalPoint', 'viewUp'} camera pose. Returns the
+        (height, width, 3) frame.
+        """
+        from vCastSlicerLib.streaming import ViewCapture
+        renderWindow = viewWidget.threeDView().renderWindow()
+        renderer = renderWindow.GetRenderers().GetFirstRenderer()
+        camera = renderer.GetActiveCamera()
+        camera.SetPosition(*pose['position'])
+        camera.SetFocalPoint(*pose['focalPoint'])
+        camera.SetViewUp(*pose['viewUp'])
+        camera.OrthogonalizeViewUp()
+        renderer.ResetCameraClippingRange()
+        renderWindow.Render()
+        if self._prerenderCapture is None:
+            self._prerenderCapture = ViewCapture(lambda: [])
+        return self._prerenderCapture.grabWindow(renderWindow)
+
+    def turntableForView(self, viewWidget, count, elevation=15.0):
+        """
+        Returns the camera poses of one turn around everything shown in a view, at the
+        distance the view resets its camera to.
+        """
+        from vCastSlicerLib.prerender import turntablePoses
+        renderer = viewWidget.threeDView().renderWindow().GetRenderers().GetFirstRenderer()
+        renderer.ResetCamera()
+        camera = renderer.GetActiveCamera()
+        return turntablePoses(camera.GetFocalPoint(), camera.GetDistance(), count, elevation)
+
+    def pathForMarkups(self, markupsNode, count, lookAhead=None):
+        """
+        Returns the camera poses of a fly-through along the points of a markups node
+        (the interpolated points of a curve, the control points otherwise).
+        """
+        from vCastSlicerLib.prerender import pathPoses
+        if markupsNode.IsA('vtkMRMLMarkupsCurveNode'):
+            points = slicer.util.arrayFromMarkupsCurvePoints(markupsNode, world=True)
+        else:
+            points = slicer.util.arrayFromMarkupsControlPoints(markupsNode, world=True)
+        return pathPoses(points, count, lookAhead)
+
+    def setVCastSenderPath(self, vCastSenderPath):
+        """
+        Saves the directory to vCastSender.exe in the module settings so that the next time
+        3D Slicer is launched, it is loaded by the vCastSlicer and vCastSlicerWidget classes.
+        """
+        vCastSlicerSettings().set('vCastSenderPath', vCastSenderPath)
 
 
 class vCastSlicerTest(ScriptedLoadableModuleTest):
@@ -449,11 +1837,41 @@ class vCastSlicerTest(ScriptedLoadableModuleTest):
     """
     slicer.mrmlScene.Clear(0)
 
+  def fixtures(self):
+    """ Imports the synthetic fixtures of Testing/Python, which is only found when the module is
+    loaded from its source tree. Returns None if they are not there.
+    """
+    import sys
+    testingDir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'Testing', 'Python')
+    if not os.path.isfile(os.path.join(testingDir, 'vCastSlicerFixtures.py')):
+      self.delayDisplay("No Testing/Python/vCastSlicerFixtures.py next to the module: test skipped")
+      return None
+    if testingDir not in sys.path:
+      sys.path.insert(0, testingDir)
+    import vCastSlicerFixtures
+    return vCastSlicerFixtures
+
   def runTest(self):
     """Run as few or as many tests as needed here.
     """
     self.setUp()
     self.test_vCastSlicer1()
+    self.test_streamingServer()
+    self.test_settingsStore()
+    self.test_extensionDownload()
+    self.test_processSupervisor()
+    self.test_frameRing()
+    self.test_captureScheduler()
+    self.test_fanoutBackpressure()
+    self.test_stateSync()
+    self.test_zoneLabeling()
+    self.test_telemetry()
+    self.test_rateControl()
+    self.test_volumePyramid()
+    self.test_meshLOD()
+    self.test_prerender()
+    self.test_sessionRecorder()
+    self.test_startupProfiler()
 
   def test_vCastSlicer1(self):
     """ Ideally you should have several levels of tests.  At the lowest level
@@ -467,4 +1885,736 @@ class vCastSlicerTest(ScriptedLoadableModuleTest):
     your test should break so they know that the feature is needed.
     """
 
-    self.delayDisplay("No tests are implemented")
\ No newline at end of file
+    self.delayDisplay("No tests are implemented")
+
+  def test_streamingServer(self):
+    """ Checks that published frames reach a local MJPEG client.
+    """
+    import numpy
+    import threading
+    from vCastSlicerLib.streaming import StreamServer, readFrames
+    self.delayDisplay("Starting the streaming test")
+    # Port 0 picks a free port. Frames are 'encoded' as raw bytes to keep the test fast.
+    server = StreamServer(port=0, frameRate=60, encoder=lambda frame: frame.tobytes())
+    server.start()
+    received = []
+    client = threading.Thread(target=lambda: received.extend(readFrames(server.url, 3)))
+    client.start()
+    try:
+      for value in range(100):
+        if not client.is_alive():
+          break
+        server.publish(numpy.full((8, 8, 3), value, dtype=numpy.uint8))
+        client.join(0.02)
+    finally:
+      server.stop()
+    client.join()
+    self.assertEqual(len(received), 3)
+    self.assertEqual(len(received[0][1]), 8*8*3)
+    # Only this computer can connect by default, and the URL of a server listening on all the
+    # interfaces is one other devices can open
+    from vCastSlicerLib.network import ALL_INTERFACES, LOCAL_HOST, reachableHost
+    self.assertTrue(server.url.startswith(f'http://{LOCAL_HOST}:'))
+    self.assertNotEqual(reachableHost(ALL_INTERFACES), ALL_INTERFACES)
+    self.assertEqual(StreamServer(ALL_INTERFACES, 8090).url.split('/')[2], f'{reachableHost(ALL_INTERFACES)}:8090')
+    # Delta tier: the viewer rebuilds the frames from the changed tiles, and can ask for a keyframe
+    import urllib.request
+    from vCastSlicerLib.deltacodec import FLAG_KEYFRAME, HEADER, TileDeltaDecoder, TileDeltaEncoder
+    from vCastSlicerLib.fanout import Tier
+    from vCastSlicerLib.streaming import iterStream
+    server = StreamServer(port=0, frameRate=60, tiers=[Tier('full', lambda frame: frame.tobytes()),
+                                                       Tier('delta', TileDeltaEncoder(tileSize=8))])
+    server.start()
+    packets = []
+    def readDelta():
+      for index, timestamp, packet in iterStream(server.url + '?tier=delta'):
+        packets.append(packet)
+        if len(packets) == 2:
+          keyframeUrl = server.url.replace('/stream.mjpg', f'/keyframe?client={server.hub.clients[0].name}')
+          urllib.request.urlopen(keyframeUrl, timeout=5).close()
+        if len(packets) == 5:
+          return
+    client = threading.Thread(target=readDelta)
+    client.start()
+    try:
+      for value in range(200):
+        if not client.is_alive():
+          break
+        frame = numpy.zeros((16, 24, 3), dtype=numpy.uint8)
+        frame[:8, :8] = value
+        server.publish(frame)
+        client.join(0.02)
+    finally:
+      server.stop()
+    client.join()
+    self.assertEqual(len(packets), 5)
+    keyframes = [bool(HEADER.unpack_from(packet)[1] & FLAG_KEYFRAME) for packet in packets]
+    self.assertTrue(keyframes[0])
+    self.assertIn(True, keyframes[2:])
+    # Only the changed tile is sent between keyframes
+    self.assertIn(False, keyframes)
+    self.assertLess(min(map(len, packets)), len(packets[0]))
+    decoder = TileDeltaDecoder()
+    for packet in packets:
+      decoded = decoder.decode(packet)
+    self.assertEqual(decoded.shape, (16, 24, 3))
+    self.assertEqual(decoded[8:].max(), 0)
+    self.delayDisplay('Test passed!')
+
+  def test_settingsStore(self):
+    """ Checks that values and device profiles written by one store are seen by another one.
+    """
+    from vCastSlicerLib.settings import SettingsStore, findLegacyVCastSenderPath
+    import tempfile
+    self.delayDisplay("Starting the settings test")
+    settingsPath = os.path.join(tempfile.mkdtemp(), 'vCastSlicer.json')
+    first = SettingsStore(settingsPath)
+    second = SettingsStore(settingsPath)
+    first.set('vCastSenderPath', 'C:/vCast/vCastSender.exe')
+    second.setProfile('Board', {'resolution': [1920, 1080], 'frameRate': 15})
+    settings = SettingsStore(settingsPath)
+    self.assertEqual(settings.get('vCastSenderPath'), 'C:/vCast/vCastSender.exe')
+    self.assertEqual(settings.getProfile('Board')['frameRate'], 15)
+    self.assertFalse(os.path.exists(settingsPath + '.lock'))
+    # Path saved in the module file by the versions before the settings store
+    legacyDir = tempfile.mkdtemp()
+    scripts = [os.path.join(legacyDir, name) for name in ('old.py', 'new.py', 'empty.py')]
+    for script, line in zip(scripts, ('C:/Old/vCastSender.exe', 'C:/New/vCastSender.exe', '')):
+      with open(script, 'w') as scriptFile:
+        scriptFile.write(f'        self._dir_chosen = "{line}" # Saves path to vCast exe file\n')
+    os.utime(scripts[0], (0, 0))
+    self.assertEqual(findLegacyVCastSenderPath(scripts), 'C:/New/vCastSender.exe')
+    self.assertIsNone(findLegacyVCastSenderPath(scripts[2:] + [os.path.join(legacyDir, 'missing.py')]))
+    self.delayDisplay('Test passed!')
+
+  def test_extensionDownload(self):
+    """ Checks that an interrupted extension download is resumed from a local stand-in catalog.
+    """
+    import json
+    from vCastSlicerLib.extensions import ExtensionDownloadTask, LocalExtensionCatalog, isCheckFresh
+    import hashlib, tempfile
+    self.delayDisplay("Starting the extension download test")
+    catalogDir = tempfile.mkdtemp()
+    archive = os.urandom(200000)
+    with open(os.path.join(catalogDir, 'SlicerVirtualReality.tar.gz'), 'wb') as archiveFile:
+      archiveFile.write(archive)
+    with open(os.path.join(catalogDir, 'index.json'), 'w') as indexFile:
+      json.dump({'extensions': {'SlicerVirtualReality': {'archive': 'SlicerVirtualReality.tar.gz',
+                 'md5': hashlib.md5(archive).hexdigest()}}}, indexFile)
+    cacheDir = os.path.join(catalogDir, 'cache')
+    os.makedirs(cacheDir)
+    # Leave a partial download behind, as if Slicer was closed while downloading
+    with open(os.path.join(cacheDir, 'SlicerVirtualReality.tar.gz.part'), 'wb') as partFile:
+      partFile.write(archive[:50000])
+    catalog = LocalExtensionCatalog(os.path.join(catalogDir, 'index.json'))
+    task = ExtensionDownloadTask(catalog, 'SlicerVirtualReality', cacheDir).start()
+    self.assertTrue(task.wait(10))
+    self.assertEqual(task.state, 'done')
+    self.assertEqual(task.progress, (len(archive), len(archive)))
+    with open(task.archivePath, 'rb') as archiveFile:
+      self.assertEqual(archiveFile.read(), archive)
+    # Cached results of the check: a failed installation is retried sooner than an installed
+    # extension is checked again
+    self.assertTrue(isCheckFresh({'installed': True, 'checkedAt': 0}, 100, now=50, failedTtl=10))
+    self.assertFalse(isCheckFresh({'installed': False, 'checkedAt': 0}, 100, now=50, failedTtl=10))
+    self.assertTrue(isCheckFresh({'installed': False, 'checkedAt': 0}, 100, now=5, failedTtl=10))
+    self.assertFalse(isCheckFresh(None, 100, now=5, failedTtl=10))
+    # From the extensions server: a timed out attempt is tried again, and the timer of a
+    # finished installation can't fail it afterwards
+    import types
+    class Signal(list):
+      def connect(self, slot):
+        self.append(slot)
+      def disconnect(self, slot):
+        self.remove(slot)
+      def emit(self, *args):
+        for slot in list(self):
+          slot(*args)
+    attempts, results = [], []
+    manager = types.SimpleNamespace(installDownloadProgress=Signal(), extensionInstalled=Signal(),
+                                    downloadAndInstallExtensionByName=lambda *args: attempts.append(args) or True)
+    logic = vCastSlicerLogic()
+    extensionName = 'vCastSlicerTestExtension'
+    try:
+      logic._installFromServer(manager, extensionName, lambda success, error: results.append((success, error)), 1)
+      timer = logic._serverInstallTimer
+      timer.timeout()
+      timer.timeout()
+      self.assertEqual(len(attempts), 2)
+      manager.extensionInstalled.emit(extensionName)
+      timer.timeout()
+      self.assertEqual(results, [(True, None)])
+      self.assertEqual(len(manager.extensionInstalled), 0)
+      # Every attempt timed out
+      results.clear()
+      logic._installFromServer(manager, extensionName, lambda success, error: results.append((success, error)), 0)
+      logic._serverInstallTimer.timeout()
+      self.assertEqual(results, [(False, f"The installation of {extensionName} timed out")])
+    finally:
+      vCastSlicerSettings().remove(extensionName)
+    self.delayDisplay('Test passed!')
+
+  def test_processSupervisor(self):
+    """ Checks reuse, crash restart and launch timing with a stand-in for vCastSender.
+    """
+    from vCastSlicerLib.process import FAILED, ProcessSupervisor, RESTARTING
+    import sys, tempfile
+    self.delayDisplay("Starting the process supervisor test")
+    workDir = tempfile.mkdtemp()
+    readyPath = os.path.join(workDir, 'ready')
+    # Stand-in sender: becomes ready after 0.1 s and crashes 0.3 s later
+    sender = os.path.join(workDir, 'sender.py')
+    with open(sender, 'w') as senderFile:
+      senderFile.write("import sys, time\ntime.sleep(0.1)\nopen(sys.argv[1], 'w').close()\n"
+                       "time.sleep(0.3)\nsys.exit(1)\n")
+    supervisor = ProcessSupervisor([sys.executable, sender, readyPath], backoff=0.05, maxRestarts=1,
+                                   readyProbe=lambda process: os.path.exists(readyPath))
+    self.assertEqual(supervisor.start(), 'started')
+    self.assertEqual(supervisor.start(), 'reused')
+    deadline = time.monotonic() + 10
+    while supervisor.poll() != FAILED and time.monotonic() < deadline:
+      if supervisor.state == RESTARTING and os.path.exists(readyPath):
+        os.remove(readyPath)
+      time.sleep(0.01)
+    supervisor.stop()
+    self.assertEqual(supervisor.restarts, 1)
+    self.assertEqual(supervisor.lastExitCode, 1)
+    self.assertEqual(len(supervisor.launchLatencies), 2)
+    self.delayDisplay('Test passed!')
+
+  def test_frameRing(self):
+    """ Checks that frames published in the shared-memory ring are read back in place.
+    """
+    import numpy
+    import tempfile
+    from vCastSlicerLib.framering import MAGIC, RING_HEADER, VERSION, FrameRingReader, FrameRingWriter
+    self.delayDisplay("Starting the frame ring test")
+    ringDir = tempfile.mkdtemp()
+    ringPath = os.path.join(ringDir, 'frames.ring')
+    announcementPath = os.path.join(ringDir, 'frames.json')
+    writer = FrameRingWriter(ringPath, slotCount=2, maxWidth=64, maxHeight=32, announcementPath=announcementPath)
+    # The reader finds the ring through its announcement
+    reader = FrameRingReader(announcementPath=announcementPath)
+    self.assertEqual(reader.path, writer.path)
+    # A second writer would corrupt the ring
+    with self.assertRaises(FileExistsError):
+      FrameRingWriter(ringPath, slotCount=2, maxWidth=64, maxHeight=32, announcementPath=None)
+    self.assertIsNone(reader.view())
+    for value in range(3):
+      writer.publish(numpy.full((32, 64, 3), value, dtype=numpy.uint8))
+    view = reader.view()
+    self.assertEqual((view.frameIndex, view.width, view.height), (2, 64, 32))
+    self.assertTrue((view.pixels == 2).all() and view.isValid())
+    # Frame 0 was overwritten (2 slots)
+    self.assertIsNone(reader.view(0))
+    writer.publish(numpy.zeros((32, 64, 3), dtype=numpy.uint8))
+    writer.publish(numpy.zeros((32, 64, 3), dtype=numpy.uint8))
+    self.assertFalse(view.isValid())
+    view = None
+    reader.close()
+    writer.close(remove=True)
+    self.assertFalse(os.path.exists(announcementPath))
+    # Ring of another process (the process id of the writer is in the header)
+    with open(ringPath, 'wb') as ringFile:
+      ringFile.write(RING_HEADER.pack(MAGIC, VERSION, 1, 1, -1, os.getpid() + 1))
+    with self.assertRaises(FileExistsError):
+      FrameRingWriter(ringPath, slotCount=2, maxWidth=64, maxHeight=32, announcementPath=None)
+    # Once closed, it can be written again
+    with open(ringPath, 'wb') as ringFile:
+      ringFile.write(RING_HEADER.pack(MAGIC, VERSION, 1, 1, -1, 0))
+    FrameRingWriter(ringPath, slotCount=2, maxWidth=64, maxHeight=32, announcementPath=None).close(remove=True)
+    self.delayDisplay('Test passed!')
+
+  def test_captureScheduler(self):
+    """ Checks that bursts of damage events are coalesced in one capture per display frame.
+    """
+    from vCastSlicerLib.scheduler import CaptureScheduler
+    self.delayDisplay("Starting the capture scheduler test")
+    now = [0.0]
+    scheduled = []
+    captures = []
+    schedule = lambda delay, callback: scheduled.append((now[0] + delay, callback))
+    scheduler = CaptureScheduler(lambda: captures.append(now[0]), schedule, frameRate=50, clock=lambda: now[0])
+    def runScheduled():
+      while scheduled:
+        now[0], callback = scheduled.pop(0)
+        callback()
+    # Burst of events (e.g. node modified, camera modified and render end)
+    for _ in range(5):
+      scheduler.requestCapture()
+    runScheduled()
+    # A second burst right after the capture waits for the next display frame (20 ms)
+    for _ in range(3):
+      scheduler.requestCapture()
+    runScheduled()
+    # Idle: nothing requested, nothing captured
+    runScheduled()
+    self.assertEqual(captures, [0.0, 0.02])
+    self.assertEqual(scheduler.counters(), {'requested': 8, 'coalesced': 6, 'captured': 2, 'skipped': 0})
+    self.delayDisplay('Test passed!')
+
+  def test_fanoutBackpressure(self):
+    """ Checks that a client that doesn't read only drops its own frames.
+    """
+    import numpy
+    from vCastSlicerLib.deltacodec import TileDeltaDecoder, TileDeltaEncoder
+    from vCastSlicerLib.fanout import FanoutClient, FanoutHub, Tier
+    self.delayDisplay("Starting the fan-out test")
+    encodedFrames = []
+    def encoder(frame):
+      encodedFrames.append(frame.shape)
+      return frame.tobytes()
+    hub = FanoutHub([Tier('full', encoder), Tier('half', encoder, scale=0.5)])
+    hub.start()
+    fastClient = hub.addClient('fast')
+    slowClient = hub.addClient('slow', maxQueue=2)
+    halfClients = [hub.addClient(f'half{i}', 'half') for i in range(3)]
+    try:
+      for value in range(10):
+        hub.publish(numpy.full((8, 8, 3), value, dtype=numpy.uint8))
+        self.assertEqual(fastClient.get(timeout=5)[1][0], value)
+        for client in halfClients:
+          self.assertEqual(len(client.get(timeout=5)[1]), 4*4*3)
+    finally:
+      hub.stop()
+    self.assertEqual(fastClient.dropped, 0)
+    self.assertEqual(slowClient.dropped, 8)
+    # One encoding per tier and frame, whatever the number of clients
+    self.assertEqual(len(encodedFrames), 20)
+    # Stateful encoder: a full queue is emptied, and the deltas skipped until the next keyframe
+    client = FanoutClient('delta', 'delta', maxQueue=2)
+    self.assertEqual([client.put((0, b'k0', 0), True), client.put((1, b'd1', 0), False)], [0, 0])
+    self.assertEqual(client.put((2, b'd2', 0), False), 3)
+    self.assertTrue(client.waitingKeyframe)
+    self.assertEqual(client.put((3, b'd3', 0), False), 1)
+    self.assertEqual(client.put((4, b'k4', 0), True), 0)
+    self.assertEqual(client.get(timeout=0)[0], 4)
+    self.assertEqual(client.dropped, 4)
+    # A slow client of a delta tier still decodes the frames it gets
+    hub = FanoutHub([Tier('delta', TileDeltaEncoder(tileSize=8))])
+    hub.start()
+    fastClient = hub.addClient('fast')
+    slowClient = hub.addClient('slow', maxQueue=2)
+    frames = [numpy.full((8, 16, 3), value, dtype=numpy.uint8) for value in range(5)]
+    fastDecoder = TileDeltaDecoder()
+    try:
+      for frame in frames:
+        hub.publish(frame)
+        self.assertTrue((fastDecoder.decode(fastClient.get(timeout=5)[1]) == frame).all())
+    finally:
+      hub.stop()
+    slowDecoder = TileDeltaDecoder()
+    for index, packet, timestamp in iter(lambda: slowClient.get(timeout=0), None):
+      decoded = slowDecoder.decode(packet)
+      self.assertIsNotNone(decoded)
+    self.assertTrue((decoded == frames[-1]).all())
+    self.delayDisplay('Test passed!')
+
+  def test_stateSync(self):
+    """ Checks that a client gets the state snapshot on join and then only the changes.
+    """
+    self.delayDisplay("Starting the state sync test")
+    import time
+    from vCastSlicerLib.statesync import (DEFINE, FLAG_SNAPSHOT, FORMATS, MAGIC, SLICE, StateSyncEncoder,
+                                          StateSyncReceiver, StateSyncServer, iterPackets)
+    server = StateSyncServer(port=0)
+    server.encoder.setCamera('vtkMRMLCameraNode1', (0, -500, 0), (0, 0, 0), (0, 0, 1), 30)
+    server.encoder.setDisplay('vtkMRMLModelDisplayNode1', True, 1.0)
+    server.flush()
+    server.start()
+    receiver = StateSyncReceiver()
+    try:
+      packets = iterPackets(server.host, server.port)
+      self.assertEqual(receiver.apply(next(packets)), 2)
+      # Unchanged values are not sent again
+      server.encoder.setCamera('vtkMRMLCameraNode1', (0, -500, 0), (0, 0, 0), (0, 0, 1), 30)
+      self.assertEqual(server.flush(), 0)
+      server.encoder.setSliceOffset('vtkMRMLSliceNodeRed', 12.5)
+      server.flush()
+      self.assertEqual(receiver.apply(next(packets)), 1)
+    finally:
+      server.stop()
+    self.assertEqual(receiver.sliceOffsets['vtkMRMLSliceNodeRed'], 12.5)
+    self.assertTrue(receiver.displays['vtkMRMLModelDisplayNode1']['visible'])
+    # Node ids beyond 16 bits (long sessions creating many nodes)
+    encoder = StateSyncEncoder()
+    for i in range(70000):
+      encoder.setSliceOffset(f'vtkMRMLSliceNode{i}', 1.0)
+    receiver = StateSyncReceiver()
+    self.assertEqual(receiver.apply(encoder.flush()), 70000)
+    self.assertEqual(receiver.sliceOffsets['vtkMRMLSliceNode69999'], 1.0)
+    # Version 1 packets, e.g. of older session recordings, are still read
+    header, defineHeader, messages = FORMATS[1]
+    packet = (header.pack(MAGIC, 1, FLAG_SNAPSHOT, 1, time.time(), 2) + defineHeader.pack(DEFINE, 0, 5) + b'Slice'
+              + messages[SLICE].pack(SLICE, 0, 3.0))
+    receiver.apply(packet)
+    self.assertEqual(receiver.sliceOffsets, {'Slice': 3.0})
+    # Through the logic: the camera of the scene is observed, its changes reach the encoder and
+    # it is no longer observed once removed
+    logic = vCastSlicerLogic()
+    camera = slicer.mrmlScene.AddNewNodeByClass('vtkMRMLCameraNode')
+    logic.startStateSync(0)
+    try:
+      encoder = logic._stateSyncServer.encoder
+      receiver = StateSyncReceiver()
+      receiver.apply(encoder.snapshot())
+      self.assertIn(camera.GetID(), receiver.cameras)
+      encoder.flush()
+      camera.SetPosition(10, 20, 30)
+      # Headless, the stand-in scene doesn't invoke the observers
+      logic.onStateNodeModified(camera)
+      self.assertTrue(encoder.hasChanges)
+      receiver.apply(encoder.flush())
+      self.assertEqual(list(receiver.cameras[camera.GetID()]['position']), [10, 20, 30])
+      slicer.mrmlScene.RemoveNode(camera)
+      logic.onStateNodeRemoved(slicer.mrmlScene, slicer.mrmlScene.NodeRemovedEvent, camera)
+      self.assertFalse([observation for observation in logic.Observations if observation[0] is camera])
+    finally:
+      logic.stopStateSync()
+    self.delayDisplay('Test passed!')
+
+  def test_zoneLabeling(self):
+    """ Checks the vectorized labeling of contacts against the per-point loop.
+    """
+    import numpy
+    self.delayDisplay("Starting the zone labeling test")
+    fixtures = self.fixtures()
+    if fixtures is None:
+      return
+    from vCastSlicerLib.zones import ZoneLabeler, labelTable
+    classifyLoop, syntheticParcellation = fixtures.classifyLoop, fixtures.syntheticParcellation
+    zoneNames = vCastSlicerLogic().zoneNames()
+    labels, rasToIjk, colorNames = syntheticParcellation(zoneNames, shape=(64, 64, 64), blockSize=4)
+    table = labelTable(colorNames, zoneNames)
+    self.assertEqual(table[17], ('L Hip', 'Hippocampus'))
+    self.assertEqual(table[12111], ('R ' + zoneNames['parc2009'][10][0], 'G_cuneus'))
+    # Some of the points are outside of the volume
+    points = numpy.random.default_rng(0).uniform(-40, 40, size=(1000, 3))
+    shortNames, fullNames = ZoneLabeler(labels, rasToIjk, table).classify(points)
+    loopShortNames, loopFullNames = classifyLoop(labels, rasToIjk, table, points)
+    self.assertEqual(list(shortNames), loopShortNames)
+    self.assertEqual(list(fullNames), loopFullNames)
+    self.assertIn('', loopShortNames)
+    # Label volumes without display node or color table are reported, not crashed on
+    import types
+    for displayNode in (None, types.SimpleNamespace(GetColorNode=lambda: None)):
+      labelVolume = types.SimpleNamespace(GetDisplayNode=lambda: displayNode, GetName=lambda: 'Parcellation')
+      with self.assertRaisesRegex(ValueError, 'Parcellation has no color table'):
+        vCastSlicerLogic().colorNames(labelVolume)
+    self.delayDisplay('Test passed!')
+
+  def test_telemetry(self):
+    """ Checks that acknowledged frames are measured per device and exported to a file.
+    """
+    import numpy
+    from vCastSlicerLib.telemetry import MetricsServer, Telemetry, TelemetryExporter
+    self.delayDisplay("Starting the telemetry test")
+    import tempfile
+    import threading
+    from vCastSlicerLib.streaming import StreamServer, iterStream
+    telemetry = Telemetry()
+    server = StreamServer(port=0, encoder=lambda frame: frame.tobytes(), telemetry=telemetry)
+    server.start()
+    def publishWhenConnected():
+      # The viewer only connects when the first frame is asked for
+      while not server.clientCount:
+        time.sleep(0.01)
+      server.publish(numpy.zeros((8, 8, 3), dtype=numpy.uint8))
+    try:
+      frames = iterStream(server.url, acknowledge=True)
+      threading.Thread(target=publishWhenConnected, daemon=True).start()
+      next(frames)
+      server.publish(numpy.ones((8, 8, 3), dtype=numpy.uint8))
+      # Acknowledges the first frame
+      next(frames)
+      frames.close()
+    finally:
+      server.stop()
+    device = telemetry.snapshot()['devices']['127.0.0.1']
+    self.assertEqual(device['framesSent'], 2)
+    self.assertEqual(device['latencies']['ack']['count'], 1)
+    path = os.path.join(tempfile.mkdtemp(), 'telemetry.csv')
+    exporter = TelemetryExporter(telemetry, path, maxBytes=1, backupCount=1)
+    exporter.export()
+    exporter.export()
+    self.assertTrue(os.path.exists(path + '.1'))
+    with open(path) as f:
+      self.assertEqual(f.readline().strip(), 'time,device,metric,value')
+    # /metrics is also served without a stream server
+    import json
+    import urllib.request
+    metrics = MetricsServer(telemetry, port=0)
+    metrics.start()
+    try:
+      with urllib.request.urlopen(metrics.url, timeout=5) as response:
+        served = json.loads(response.read())
+    finally:
+      metrics.stop()
+    self.assertEqual(served['devices']['127.0.0.1']['framesSent'], 2)
+    self.delayDisplay('Test passed!')
+
+  def test_rateControl(self):
+    """ Checks that the level follows the link: in a simulation and for a client that drops frames.
+    """
+    import numpy
+    from vCastSlicerLib.fanout import FanoutHub, Tier
+    self.delayDisplay("Starting the rate control test")
+    fixtures = self.fixtures()
+    if fixtures is None:
+      return
+    from vCastSlicerLib.ratecontrol import RateController, RateLimits
+    simulateLink, stepTrace = fixtures.simulateLink, fixtures.stepTrace
+    # 20 Mbit/s, then 1 Mbit/s
+    bandwidth = stepTrace([(0, 20e6/8), (10, 1e6/8)])
+    controller = RateController(clock=lambda: 0.0)
+    adaptive = simulateLink(bandwidth, 20.0, controller)
+    fixed = simulateLink(bandwidth, 20.0, level=controller.ladder[0])
+    self.assertGreater(adaptive['sent'], 2*fixed['sent'])
+    self.assertLess(adaptive['meanLatencyMs'], fixed['meanLatencyMs']/2)
+    self.assertLess(controller.level.cost, controller.ladder[0].cost/10)
+    # Steps of this ladder only lower the resolution (and there is no frame rate limit)
+    encodedFrames = []
+    def encoder(frame):
+      encodedFrames.append(frame.shape)
+      return frame.tobytes()
+    limits = RateLimits(minScale=0.5, minQuality=90, maxQuality=90, minFrameRate=10**6, maxFrameRate=10**6)
+    hub = FanoutHub([Tier('full', encoder)], rateLimits=limits)
+    hub.start()
+    fastClient = hub.addClient('fast')
+    slowClient = hub.addClient('slow', maxQueue=1)
+    try:
+      for value in range(5):
+        hub.publish(numpy.full((8, 8, 3), value, dtype=numpy.uint8))
+        self.assertEqual(len(fastClient.get(timeout=5)[1]), 8*8*3)
+      self.assertEqual(len(slowClient.get(timeout=5)[1]), 6*6*3)
+    finally:
+      hub.stop()
+    self.assertEqual(fastClient.controller.index, 0)
+    self.assertEqual(slowClient.controller.index, 1)
+    self.delayDisplay('Test passed!')
+
+  def test_volumePyramid(self):
+    """ Checks the levels of a pyramid, their reuse and the eviction of the least recently used one.
+    """
+    import numpy
+    from vCastSlicerLib.pyramid import PyramidCache, levelIjkToRas
+    self.delayDisplay("Starting the volume pyramid test")
+    import shutil
+    import tempfile
+    cacheDir = tempfile.mkdtemp()
+    cache = PyramidCache(cacheDir, minSize=8)
+    volume = numpy.arange(16*16*15, dtype=numpy.int16).reshape(16, 16, 15)
+    try:
+      key = cache.build(volume).result()
+      self.assertEqual(cache.levels(key)['shapes'], [[16, 16, 15], [8, 8, 8]])
+      level = cache.load(key, 1)
+      # Odd dimensions are padded with their last slice
+      self.assertEqual(level[0, 0, 0], round(volume[:2, :2, :2].mean()))
+      self.assertEqual(level[0, 0, 7], round(volume[:2, :2, 14].mean()))
+      self.assertEqual(cache.build(volume).result(), key)
+      self.assertEqual((cache.hits, cache.misses), (1, 1))
+      self.assertEqual(cache.levelFor(key, 'desktop'), 0)
+      self.assertEqual(cache.levelFor(key, 'small', {'small': 1000}), 1)
+      # The center of a voxel of level 1 is the center of the 2x2x2 block it averages
+      self.assertEqual(list(levelIjkToRas(numpy.eye(4), 1) @ [0, 0, 0, 1]), [0.5, 0.5, 0.5, 1])
+      # Room for one pyramid only: the oldest one goes
+      cache.maxBytes = os.path.getsize(os.path.join(cacheDir, key, 'level1.npy')) + 1000
+      otherKey = cache.build(volume + 1).result()
+      self.assertIsNone(cache.levels(key))
+      self.assertIsNotNone(cache.levels(otherKey))
+    finally:
+      cache.shutdown()
+      shutil.rmtree(cacheDir)
+    self.delayDisplay('Test passed!')
+
+  def test_meshLOD(self):
+    """ Checks the levels of detail of a mesh, their reuse and the triangle budget of a scene.
+    """
+    self.delayDisplay("Starting the mesh level of detail test")
+    import shutil
+    import tempfile
+    fixtures = self.fixtures()
+    if fixtures is None:
+      return
+    from vCastSlicerLib.meshlod import MeshLODCache, chooseLevels
+    sphereMesh = fixtures.sphereMesh
+    cacheDir = tempfile.mkdtemp()
+    cache = MeshLODCache(cacheDir, workers=1, minTriangles=100)
+    points, triangles = sphereMesh(40, 50)
+    try:
+      key = cache.build(points, triangles).result()
+      counts = cache.counts(key)
+      self.assertEqual(counts[0], len(triangles))
+      target = len(triangles)
+      for count in counts[1:]:
+        target = int(target*0.25)
+        self.assertLessEqual(count, target)
+        self.assertGreater(count, target*0.6)
+      levelPoints, levelTriangles = cache.load(key, 1)
+      self.assertEqual(len(levelTriangles), counts[1])
+      self.assertLess(int(levelTriangles.max()), len(levelPoints))
+      # A second model with the same geometry is a hit, without any worker
+      self.assertTrue(cache.build(points.copy(), triangles.copy()).done())
+      self.assertEqual((cache.hits, cache.misses), (1, 1))
+    finally:
+      cache.shutdown()
+      shutil.rmtree(cacheDir)
+    # The biggest models are coarsened first
+    self.assertEqual(chooseLevels([[1000, 250, 60], [400, 100], [50]], 800), [1, 0, 0])
+    self.assertEqual(chooseLevels([[1000, 250, 60], [400, 100], [50]], 500), [1, 1, 0])
+    self.assertEqual(chooseLevels([[1000, 250, 60], [400, 100], [50]], 300), [2, 1, 0])
+    self.assertEqual(chooseLevels([[1000, 250]], None), [0])
+    self.delayDisplay('Test passed!')
+
+  def test_prerender(self):
+    """ Pre-renders a turntable with 2 worker processes and reads it back.
+    """
+    import numpy
+    self.delayDisplay("Starting the pre-rendering test")
+    import shutil
+    import sys
+    import tempfile
+    fixtures = self.fixtures()
+    if fixtures is None:
+      return
+    from vCastSlicerLib.prerender import (FrameSequenceReader, chunkRanges, mergeIndex, pathPoses, runChunks,
+                                          turntablePoses, writePoses)
+    SyntheticRenderer, syntheticCommand = fixtures.SyntheticRenderer, fixtures.syntheticCommand
+    poses = turntablePoses((10, 0, 0), 200, 12, elevation=0)
+    self.assertAlmostEqual(numpy.linalg.norm(numpy.subtract(poses[3]['position'], (10, 0, 0))), 200)
+    numpy.testing.assert_allclose(poses[0]['position'], (10, 200, 0), atol=1e-9)
+    numpy.testing.assert_allclose(poses[6]['position'], (10, -200, 0), atol=1e-9)
+    path = pathPoses([(0, 0, 0), (0, 0, 0), (100, 0, 0), (100, 100, 0)], 5, lookAhead=10)
+    numpy.testing.assert_allclose(path[0]['position'], (0, 0, 0))
+    numpy.testing.assert_allclose(path[0]['focalPoint'], (10, 0, 0))
+    numpy.testing.assert_allclose(path[-1]['focalPoint'], (100, 110, 0))
+    self.assertEqual(chunkRanges(10, 3), [(0, 3), (3, 7), (7, 10)])
+    self.assertEqual(chunkRanges(2, 4), [(0, 1), (1, 2)])
+    outputDir = tempfile.mkdtemp()
+    try:
+      posesFile = writePoses(outputDir, poses)
+      environment = dict(os.environ, PYTHONPATH=os.pathsep.join(p for p in sys.path if p))
+      runChunks(syntheticCommand(posesFile, outputDir, 96, 64), chunkRanges(len(poses), 2), 2, env=environment)
+      index = mergeIndex(outputDir, poses, frameRate=24)
+      self.assertEqual((index['frameCount'], index['width'], index['height']), (12, 96, 64))
+      self.assertTrue(index['frames'][0]['keyframe'] and index['frames'][6]['keyframe'])
+      renderer = SyntheticRenderer(96, 64)
+      reader = FrameSequenceReader(outputDir)
+      # Random access, then in order
+      for n in (9, 2, 3, 4, 11):
+        numpy.testing.assert_array_equal(reader.frame(n), renderer(poses[n]))
+        self.assertEqual(reader.pose(n), poses[n])
+      reader.close()
+      with self.assertRaises(RuntimeError):
+        runChunks(lambda start, stop: [sys.executable, '-c', 'raise SystemExit(3)'], [(0, 1)], 1)
+    finally:
+      shutil.rmtree(outputDir)
+    self.delayDisplay('Test passed!')
+
+  def test_sessionRecorder(self):
+    """ Records a session, reopens it after an interrupted index and seeks and replays it.
+    """
+    from vCastSlicerLib.statesync import StateSyncReceiver
+    self.delayDisplay("Starting the session recorder test")
+    import shutil
+    import tempfile
+    from vCastSlicerLib.recorder import INDEX_SUFFIX, KEYFRAME, SessionPlayer, SessionReader, SessionRecorder
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, 'session.vcrec')
+    clock = [0.0]
+    recorder = SessionRecorder(path, keyframeInterval=2.0, clock=lambda: clock[0])
+    try:
+      for step in range(100):
+        clock[0] = step/10
+        recorder.encoder.setCamera('vtkMRMLCameraNode1', (step, 0, 0), (0, 0, 0), (0, 0, 1), 30)
+        if step % 20 == 0:
+          recorder.encoder.setDisplay('vtkMRMLModelDisplayNode1', step % 40 == 0, 0.5)
+        recorder.record()
+      # Nothing changed: nothing written
+      self.assertEqual(recorder.record(), 0)
+      recorder.close()
+      self.assertEqual(recorder.keyframeCount, 5)
+      reader = SessionReader(path)
+      self.assertAlmostEqual(reader.duration, 9.9)
+      self.assertEqual([offset for _, offset in reader.keyframes],
+                       [offset for offset, kind, _, _ in reader.records() if kind == KEYFRAME])
+      state, _ = reader.stateAt(3.05)
+      self.assertEqual(state.cameras['vtkMRMLCameraNode1']['position'][0], 30)
+      self.assertEqual(state.displays['vtkMRMLModelDisplayNode1']['visible'], False)
+      reader.close()
+      # Index of the last keyframes lost and the last record half-written: recovered from the log
+      with open(path + INDEX_SUFFIX, 'r+b') as indexFile:
+        indexFile.truncate(16)
+      with open(path, 'r+b') as logFile:
+        logFile.truncate(os.path.getsize(path) - 3)
+      reader = SessionReader(path)
+      self.assertEqual(len(reader.keyframes), 5)
+      self.assertAlmostEqual(reader.duration, 9.8)
+      # Replay at 4x from 8 s, with a simulated clock
+      applied = StateSyncReceiver()
+      now = [0.0]
+      player = SessionPlayer(reader, applied.apply, speed=4.0, clock=lambda: now[0])
+      player.play(8.0)
+      self.assertEqual(applied.cameras['vtkMRMLCameraNode1']['position'][0], 80)
+      now[0] = 0.11
+      player.poll()
+      self.assertEqual(applied.cameras['vtkMRMLCameraNode1']['position'][0], 84)
+      now[0] = 1.0
+      player.poll()
+      self.assertTrue(player.finished)
+      self.assertEqual(applied.cameras['vtkMRMLCameraNode1']['position'][0], 98)
+      reader.close()
+    finally:
+      shutil.rmtree(directory)
+    self.delayDisplay('Test passed!')
+
+  def test_startupProfiler(self):
+    """ Checks the startup phases and that a fresh import of the module doesn't load numpy or the
+    rest of vCastSlicerLib.
+    """
+    self.delayDisplay("Starting the startup profiler test")
+    import sys
+    from vCastSlicerLib.startup import StartupProfiler
+    now = [0.0]
+    profiler = StartupProfiler(clock=lambda: now[0])
+    self.assertEqual(profiler.report(), "no startup phase recorded")
+    start = profiler.start()
+    now[0] += 0.002
+    profiler.stop('import', start)
+    with profiler.phase('moduleCreation'):
+      now[0] += 0.0005
+    # A second creation (module reload) adds up
+    with profiler.phase('moduleCreation'):
+      now[0] += 0.0005
+    self.assertAlmostEqual(profiler.total(), 0.003)
+    self.assertAlmostEqual(profiler.total(['moduleCreation']), 0.001)
+    self.assertEqual(profiler.report(), "import 2.0 ms, module creation 1.0 ms (total 3.0 ms)")
+    # The import of this module was profiled
+    self.assertIn('import', vCastSlicerStartupProfiler().phases)
+    # Fresh import in a new interpreter, with the stand-ins of the headless benchmark (from
+    # Testing/Python, which is only found when the module is loaded from its source tree)
+    import json
+    import subprocess
+    import tempfile
+    moduleDir = os.path.dirname(os.path.abspath(__file__))
+    testingDir = os.path.join(moduleDir, 'Testing', 'Python')
+    if not os.path.isfile(os.path.join(testingDir, 'SlicerStandIns.py')):
+      self.delayDisplay("No Testing/Python/SlicerStandIns.py next to the module: fresh import not checked")
+    else:
+      # In Slicer, sys.executable is the application: the workers use PythonSlicer
+      python = os.path.join(os.path.dirname(sys.executable), 'PythonSlicer' + ('.exe' if os.name == 'nt' else ''))
+      if not os.path.isfile(python):
+        python = sys.executable
+      script = ('import json, sys; sys.path[:0] = sys.argv[1:3]; import SlicerStandIns; '
+                'SlicerStandIns.install(sys.argv[3]); import vCastSlicer; print(json.dumps(sorted(sys.modules)))')
+      output = subprocess.run([python, '-c', script, testingDir, moduleDir, tempfile.mkdtemp()], check=True,
+                              capture_output=True, text=True).stdout
+      loaded = json.loads(output.splitlines()[-1])
+      self.assertIn('vCastSlicerLib.startup', loaded)
+      eager = [name for name in loaded if name == 'numpy' or name.startswith('vCastSlicerLib.')
+               and name != 'vCastSlicerLib.startup']
+      self.assertEqual(eager, [])
+    self.delayDisplay('Test passed!')
+
+# End of the import of the module
+_startupProfiler.stop('import', _importStart)
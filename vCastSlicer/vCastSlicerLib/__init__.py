@@ -0,0 +1,7 @@
+#
+# vCastSlicerLib. Helper package of the vCastSlicer module.
+#
+# The submodules in this package don't import slicer, so they can be used (and tested)
+# outside of a running 3D Slicer session. Import them explicitly, e.g.:
+#   from vCastSlicerLib.streaming import StreamServer
+#
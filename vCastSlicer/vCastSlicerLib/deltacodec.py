@@ -0,0 +1,168 @@
+import struct
+import zlib
+import numpy
+
+#
+# Tile-based delta codec for casting.
+# Each RGB frame is split in square tiles which are hashed in one vectorized pass. Only
+# the tiles whose hash changed since the previous frame are encoded and sent; keyframes
+# (all tiles) are sent periodically and whenever a client asks for one.
+#
+
+# Packet header: magic, flags, frame index, width, height, tile size, number of tiles
+HEADER = struct.Struct('<4sBIHHHI')
+# Tile header: column, row, length of the encoded payload
+TILE_HEADER = struct.Struct('<HHI')
+MAGIC = b'VCTD'
+FLAG_KEYFRAME = 1
+
+
+def zlibTileEncoder(tile):
+    """
+    Default (lossless) tile encoder.
+    """
+    return zlib.compress(numpy.ascontiguousarray(tile).tobytes(), 1)
+
+
+def zlibTileDecoder(data, shape):
+    """
+    Decoder matching zlibTileEncoder.
+    """
+    return numpy.frombuffer(zlib.decompress(data), dtype=numpy.uint8).reshape(shape)
+
+
+def padFrame(frame, tileSize):
+    """
+    Function to pad a frame with black pixels so both dimensions are multiples of tileSize.
+    """
+    height, width, _ = frame.shape
+    padHeight = -height % tileSize
+    padWidth = -width % tileSize
+    if padHeight or padWidth:
+        frame = numpy.pad(frame, ((0, padHeight), (0, padWidth), (0, 0)))
+    return numpy.ascontiguousarray(frame)
+
+
+class TileHasher:
+    """
+    Computes a 64-bit hash per tile with a vectorized multiply-and-sum over the pixel words.
+    Each 8-byte word of a tile is multiplied by its own random odd coefficient and the
+    products are summed modulo 2**64, so any change to a single word changes the hash.
+    """
+
+    def __init__(self, tileSize=64, seed=0x5EE6):
+        if tileSize % 8:
+            raise ValueError("tileSize must be a multiple of 8")
+        self.tileSize = tileSize
+        # Words per tile row: tileSize pixels * 3 bytes / 8 bytes per word
+        wordsPerRow = tileSize*3//8
+        rng = numpy.random.default_rng(seed)
+        coefficients = rng.integers(0, 2**63, size=(tileSize, wordsPerRow), dtype=numpy.uint64)
+        self._coefficients = (coefficients << numpy.uint64(1)) | numpy.uint64(1)
+
+    def __call__(self, paddedFrame):
+        """
+        Returns a (rows, columns) array with the hash of every tile of a padded frame.
+        """
+        height, width, _ = paddedFrame.shape
+        t = self.tileSize
+        words = paddedFrame.reshape(height, width*3).view(numpy.uint64).reshape(height//t, t, width//t, t*3//8)
+        products = words*self._coefficients[None, :, None, :]
+        return products.sum(axis=(1, 3), dtype=numpy.uint64)
+
+
+class TileDeltaEncoder:
+    """
+    Stateful encoder producing delta packets. Can be used as the encoder of a StreamServer.
+    """
+
+    contentType = 'application/x-vcast-delta'
+
+    def __init__(self, tileSize=64, keyframeInterval=120, tileEncoder=zlibTileEncoder):
+        self.tileSize = tileSize
+        # A keyframe is sent at least every keyframeInterval frames (0 disables it)
+        self.keyframeInterval = keyframeInterval
+        self.tileEncoder = tileEncoder
+        self._hasher = TileHasher(tileSize)
+        self._hashes = None
+        self._shape = None
+        self._frameIndex = 0
+        self._sinceKeyframe = 0
+        self._keyframeRequested = True
+        # Whether the last encoded packet is a keyframe (see vCastSlicerLib.fanout)
+        self.lastFrameWasKeyframe = False
+
+    def requestKeyframe(self):
+        """
+        Function to force a full frame on the next call (e.g. when a new client connects).
+        """
+        self._keyframeRequested = True
+
+    def __call__(self, frame):
+        return self.encode(frame)
+
+    def encode(self, frame):
+        """
+        Function to encode a (height, width, 3) uint8 frame as a delta packet.
+        """
+        height, width, _ = frame.shape
+        padded = padFrame(frame, self.tileSize)
+        hashes = self._hasher(padded)
+        keyframe = (self._keyframeRequested or self._hashes is None or self._shape != frame.shape
+                    or (self.keyframeInterval and self._sinceKeyframe >= self.keyframeInterval))
+        if keyframe:
+            rows, columns = numpy.indices(hashes.shape).reshape(2, -1)
+            self._sinceKeyframe = 0
+            self._keyframeRequested = False
+        else:
+            rows, columns = numpy.nonzero(hashes != self._hashes)
+            self._sinceKeyframe += 1
+        self._hashes = hashes
+        self._shape = frame.shape
+        self.lastFrameWasKeyframe = bool(keyframe)
+        t = self.tileSize
+        parts = [HEADER.pack(MAGIC, FLAG_KEYFRAME if keyframe else 0, self._frameIndex, width, height, t, len(rows))]
+        for row, column in zip(rows.tolist(), columns.tolist()):
+            payload = self.tileEncoder(padded[row*t:(row + 1)*t, column*t:(column + 1)*t])
+            parts.append(TILE_HEADER.pack(column, row, len(payload)))
+            parts.append(payload)
+        self._frameIndex += 1
+        return b''.join(parts)
+
+
+class TileDeltaDecoder:
+    """
+    Rebuilds the frames from the packets of a TileDeltaEncoder (reference receiver).
+    """
+
+    def __init__(self, tileDecoder=zlibTileDecoder):
+        self.tileDecoder = tileDecoder
+        self._canvas = None
+        self.frameIndex = -1
+
+    @property
+    def needsKeyframe(self):
+        return self._canvas is None
+
+    def decode(self, packet):
+        """
+        Function to apply a packet. Returns the current frame, or None while waiting for a keyframe.
+        """
+        magic, flags, frameIndex, width, height, t, count = HEADER.unpack_from(packet, 0)
+        if magic != MAGIC:
+            raise ValueError("Not a vCast delta packet")
+        keyframe = bool(flags & FLAG_KEYFRAME)
+        if keyframe:
+            self._canvas = numpy.zeros((height + (-height % t), width + (-width % t), 3), dtype=numpy.uint8)
+        elif self._canvas is None:
+            # Deltas are meaningless until the first keyframe arrives
+            return None
+        offset = HEADER.size
+        for _ in range(count):
+            column, row, length = TILE_HEADER.unpack_from(packet, offset)
+            offset += TILE_HEADER.size
+            tile = self.tileDecoder(packet[offset:offset + length], (t, t, 3))
+            self._canvas[row*t:(row + 1)*t, column*t:(column + 1)*t] = tile
+            offset += length
+        self.frameIndex = frameIndex
+        return self._canvas[:height, :width]
@@ -0,0 +1,165 @@
+import concurrent.futures
+import contextlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import numpy
+
+#
+# Base of the disk caches of derived data (volume pyramids, mesh levels of detail).
+# Every entry is a directory named after the hash of the source data, holding its files and
+# an index.json written last: a directory without an index is an unfinished build. The
+# modification time of the index is the last use of the entry, so the least recently used
+# entries can be removed when the cache gets bigger than its disk budget, across sessions.
+#
+
+INDEX_FILE = 'index.json'
+
+
+def saveArray(path, array):
+    """
+    Function to write an .npy file through a temporary file, so that it is never seen half-written.
+    """
+    fh, tmpPath = tempfile.mkstemp(prefix='.array', suffix='.tmp', dir=os.path.dirname(path))
+    try:
+        with os.fdopen(fh, 'wb') as tmpFile:
+            numpy.save(tmpFile, array)
+        os.replace(tmpPath, path)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.remove(tmpPath)
+        raise
+
+
+class DiskCache:
+    """
+    Directory per entry ({cacheDir}/{key}/) with LRU eviction under maxBytes, and a pool
+    of worker threads for the builds. All the methods can be called from any thread.
+    """
+
+    def __init__(self, cacheDir, maxBytes, workers=2, threadName='vCastCache'):
+        self.cacheDir = cacheDir
+        # Disk budget of the cache
+        self.maxBytes = maxBytes
+        self.workers = workers
+        self.hits = 0
+        self.misses = 0
+        self._threadName = threadName
+        self._executor = None
+        # Builds in progress: key -> Event set when done
+        self._builds = {}
+        self._lock = threading.Lock()
+
+    def entryDir(self, key):
+        return os.path.join(self.cacheDir, key)
+
+    def index(self, key):
+        """
+        Function to get the index of a complete entry, None if it isn't cached.
+        """
+        try:
+            with open(os.path.join(self.entryDir(key), INDEX_FILE), encoding='utf-8') as indexFile:
+                return json.load(indexFile)
+        except (OSError, ValueError):
+            return None
+
+    def writeIndex(self, key, index):
+        """
+        Function to mark an entry as complete, once all its files are written.
+        """
+        directory = self.entryDir(key)
+        fh, tmpPath = tempfile.mkstemp(prefix='.index', suffix='.tmp', dir=directory)
+        with os.fdopen(fh, 'w', encoding='utf-8') as indexFile:
+            json.dump(index, indexFile)
+        os.replace(tmpPath, os.path.join(directory, INDEX_FILE))
+
+    def touch(self, key):
+        with contextlib.suppress(OSError):
+            os.utime(os.path.join(self.entryDir(key), INDEX_FILE))
+
+    def submit(self, function, *args):
+        with self._lock:
+            if self._executor is None:
+                self._executor = concurrent.futures.ThreadPoolExecutor(self.workers, thread_name_prefix=self._threadName)
+            return self._executor.submit(function, *args)
+
+    def claim(self, key):
+        """
+        Function to start building an entry. Returns None if the entry is complete (after
+        waiting for another worker building it), otherwise an Event to pass to release().
+        """
+        with self._lock:
+            other = self._builds.get(key)
+            if other is None:
+                done = self._builds[key] = threading.Event()
+        if other is not None:
+            other.wait()
+        if self.index(key) is not None:
+            self.hits += 1
+            self.touch(key)
+            if other is None:
+                self.release(key, done)
+            return None
+        if other is not None:
+            # The other build failed: try again
+            return self.claim(key)
+        self.misses += 1
+        os.makedirs(self.entryDir(key), exist_ok=True)
+        return done
+
+    def release(self, key, done):
+        with self._lock:
+            del self._builds[key]
+        done.set()
+
+    def evict(self, keep=()):
+        """
+        Function to remove the least recently used entries (and unfinished builds) until the
+        cache fits in maxBytes. Returns the number of bytes removed.
+        """
+        entries = []
+        total = 0
+        with self._lock:
+            building = set(self._builds)
+        for name in os.listdir(self.cacheDir) if os.path.isdir(self.cacheDir) else ():
+            directory = os.path.join(self.cacheDir, name)
+            if not os.path.isdir(directory):
+                continue
+            size = sum(entry.stat().st_size for entry in os.scandir(directory) if entry.is_file())
+            total += size
+            if name in keep or name in building:
+                continue
+            try:
+                lastUse = os.stat(os.path.join(directory, INDEX_FILE)).st_mtime
+            except OSError:
+                # Unfinished build of a previous session: removed first
+                lastUse = -1.0
+            entries.append((lastUse, size, directory))
+        removed = 0
+        for lastUse, size, directory in sorted(entries):
+            if total - removed <= self.maxBytes:
+                break
+            shutil.rmtree(directory, ignore_errors=True)
+            removed += size
+        return removed
+
+    def stats(self):
+        entries = 0
+        size = 0
+        for name in os.listdir(self.cacheDir) if os.path.isdir(self.cacheDir) else ():
+            directory = os.path.join(self.cacheDir, name)
+            if os.path.isfile(os.path.join(directory, INDEX_FILE)):
+                entries += 1
+                size += sum(entry.stat().st_size for entry in os.scandir(directory) if entry.is_file())
+        with self._lock:
+            building = len(self._builds)
+        return {'entries': entries, 'bytes': size, 'maxBytes': self.maxBytes, 'building': building,
+                'hits': self.hits, 'misses': self.misses}
+
+    def shutdown(self, wait=True):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait, cancel_futures=True)
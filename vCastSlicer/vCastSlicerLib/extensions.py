@@ -0,0 +1,181 @@
+import hashlib
+import json
+import os
+import threading
+import time
+import urllib.parse
+import urllib.request
+
+#
+# Background download of extension archives from a local catalog (used to install
+# SlicerVirtualReality offline; from the Slicer extensions server, the extensions manager
+# downloads the archives itself). The archive is looked up and downloaded by a worker
+# thread into a local cache directory. Interrupted downloads are resumed from the partial
+# file, failed ones are retried with backoff, and an archive already in the cache is
+# reused without downloading it again.
+#
+
+
+def isCheckFresh(entry, ttl, now=None, failedTtl=0):
+    """
+    Function to know if a cached result (dict with 'installed' and 'checkedAt') can be
+    trusted without asking the extensions manager again: for ttl seconds if the extension
+    was installed, for failedTtl seconds after a failed installation.
+    """
+    if not entry:
+        return False
+    now = time.time() if now is None else now
+    return 0 <= now - entry.get('checkedAt', 0) < (ttl if entry.get('installed') else failedTtl)
+
+
+def fileMD5(path, chunkSize=1 << 20):
+    digest = hashlib.md5()
+    with open(path, 'rb') as archive:
+        for chunk in iter(lambda: archive.read(chunkSize), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class LocalExtensionCatalog:
+    """
+    Stand-in for the Slicer extensions server, made of an index.json file:
+      {"extensions": {"<name>": {"archive": "<path relative to the index>", "md5": "..."}}}
+    """
+
+    def __init__(self, indexPath):
+        self.indexPath = indexPath
+
+    def archiveInfo(self, name):
+        with open(self.indexPath, encoding='utf-8') as indexFile:
+            extensions = json.load(indexFile)['extensions']
+        if name not in extensions:
+            raise KeyError(f"Extension {name} not found in {self.indexPath}")
+        entry = extensions[name]
+        archivePath = os.path.join(os.path.dirname(os.path.abspath(self.indexPath)), entry['archive'])
+        return {
+            'name': name,
+            'url': urllib.parse.urljoin('file:', urllib.request.pathname2url(archivePath)),
+            'filename': os.path.basename(archivePath),
+            'md5': entry.get('md5'),
+        }
+
+
+def downloadArchive(url, destination, progress=None, chunkSize=1 << 16, timeout=30.0):
+    """
+    Function to download url into destination, resuming from destination + '.part' if a
+    previous download was interrupted. progress(bytesDone, bytesTotal) is called after
+    every chunk (bytesTotal is None when unknown).
+    """
+    partPath = destination + '.part'
+    offset = os.path.getsize(partPath) if os.path.exists(partPath) else 0
+    request = urllib.request.Request(url)
+    if offset and url.startswith(('http:', 'https:')):
+        request.add_header('Range', f'bytes={offset}-')
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        status = getattr(response, 'status', None)
+        length = response.headers.get('Content-Length')
+        if url.startswith('file:'):
+            # Local archives are resumed by seeking
+            if offset:
+                response.seek(offset)
+            if length is not None:
+                length = int(length) - offset
+        elif status != 206:
+            # The server ignored the range, start again
+            offset = 0
+        total = offset + int(length) if length is not None else None
+        done = offset
+        with open(partPath, 'ab' if offset else 'wb') as part:
+            while True:
+                chunk = response.read(chunkSize)
+                if not chunk:
+                    break
+                part.write(chunk)
+                done += len(chunk)
+                if progress is not None:
+                    progress(done, total)
+    os.replace(partPath, destination)
+    return destination
+
+
+class ExtensionDownloadTask:
+    """
+    Looks up and downloads the archive of an extension in a worker thread. The Qt main thread
+    polls progress/state (no Qt calls are done from the worker) and installs the archive.
+    """
+
+    def __init__(self, catalog, name, cacheDir, retries=3, backoff=1.0):
+        self.catalog = catalog
+        self.name = name
+        self.cacheDir = cacheDir
+        self.retries = retries
+        # Seconds to wait after the first failure, doubled after each new failure
+        self.backoff = backoff
+        self.archiveInfo = None
+        self.state = 'pending'
+        self.progress = (0, None)
+        self.attempts = 0
+        self.archivePath = None
+        self.error = None
+        self._thread = None
+        self._cancelled = threading.Event()
+
+    @property
+    def isFinished(self):
+        return self.state in ('done', 'failed', 'cancelled')
+
+    def start(self):
+        self._thread = threading.Thread(target=self.run, name=f'vCastDownload{self.name}', daemon=True)
+        self._thread.start()
+        return self
+
+    def cancel(self):
+        self._cancelled.set()
+
+    def wait(self, timeout=None):
+        if self._thread is not None:
+            self._thread.join(timeout)
+        return self.isFinished
+
+    def run(self):
+        """
+        Function executed by the worker thread.
+        """
+        try:
+            self.state = 'downloading'
+            self.archiveInfo = self.catalog.archiveInfo(self.name)
+            os.makedirs(self.cacheDir, exist_ok=True)
+            destination = os.path.join(self.cacheDir, self.archiveInfo['filename'])
+            if self._isCached(destination):
+                self.archivePath = destination
+                self.state = 'done'
+                return
+            delay = self.backoff
+            while True:
+                self.attempts += 1
+                try:
+                    downloadArchive(self.archiveInfo['url'], destination, self._onProgress)
+                    if not self._isCached(destination):
+                        # Corrupted archive: remove it so the next attempt starts from scratch
+                        os.remove(destination)
+                        raise OSError(f"Checksum mismatch for {self.archiveInfo['filename']}")
+                    self.archivePath = destination
+                    self.state = 'done'
+                    return
+                except OSError as e:
+                    self.error = e
+                    if self.attempts > self.retries or self._cancelled.wait(delay):
+                        raise
+                    delay *= 2
+        except Exception as e:
+            self.error = e
+            self.state = 'cancelled' if self._cancelled.is_set() else 'failed'
+
+    def _isCached(self, path):
+        if not os.path.isfile(path):
+            return False
+        md5 = self.archiveInfo.get('md5')
+        return md5 is None or fileMD5(path) == md5
+
+    def _onProgress(self, done, total):
+        self.progress = (done, total)
@@ -0,0 +1,334 @@
+import collections
+import copy
+import itertools
+import threading
+import time
+import numpy
+from vCastSlicerLib.ratecontrol import RateController
+
+#
+# Fan-out of the captured frames to many display clients.
+# Each frame is captured once and encoded once per quality tier (only for the tiers that
+# have clients), then the encoded bytes are shared by all the clients of the tier. Every
+# client has its own small bounded queue: when a client is slow (e.g. a board on Wi-Fi)
+# its oldest frames are dropped, so it never stalls the encoder or the other clients.
+# Frames of stateful encoders (e.g. TileDeltaEncoder) depend on the previous ones: a slow
+# client of such a tier loses its whole queue instead, and gets frames again from the next
+# keyframe, which the hub requests.
+#
+# With rate limits, every client also gets a RateController that adapts the resolution, JPEG
+# quality and frame rate of its frames to its link. Clients at the same level of the same
+# tier still share one encoding.
+#
+
+
+def downscale(frame, scale):
+    """
+    Function to resize a frame by scale (< 1) with nearest-neighbour sampling.
+    """
+    if scale >= 1.0:
+        return frame
+    height, width = frame.shape[:2]
+    rows = (numpy.arange(max(int(height*scale), 1))/scale).astype(numpy.intp)
+    columns = (numpy.arange(max(int(width*scale), 1))/scale).astype(numpy.intp)
+    return frame[rows[:, None], columns[None, :]]
+
+
+class Tier:
+    """
+    Quality/resolution level shared by a group of clients.
+    """
+
+    def __init__(self, name, encoder, scale=1.0):
+        self.name = name
+        self.encoder = encoder
+        self.scale = scale
+
+    def encode(self, frame):
+        return self.encoder(downscale(frame, self.scale))
+
+
+class FanoutClient:
+    """
+    Consumer of the hub with a bounded, drop-oldest queue of encoded frames.
+    """
+
+    def __init__(self, name, tier, maxQueue=2, latencyWindow=256, device=None, controller=None):
+        self.name = name
+        self.tier = tier
+        # Optional vCastSlicerLib.ratecontrol.RateController choosing the level of the frames
+        self.controller = controller
+        # Telemetry label: several clients (connections) can come from the same device
+        self.device = device or name
+        self.delivered = 0
+        self.dropped = 0
+        self.bytesDelivered = 0
+        # Seconds between the capture of a frame and the moment the client took it
+        self.latencies = collections.deque(maxlen=latencyWindow)
+        self.closed = False
+        # Deltas are skipped until the next keyframe (frames of a stateful encoder were dropped)
+        self.waitingKeyframe = False
+        self._queue = collections.deque(maxlen=maxQueue)
+        self._condition = threading.Condition()
+        # Frames sent and not acknowledged yet: index -> (send time, size, capture timestamp)
+        self._unacknowledged = collections.OrderedDict()
+
+    def put(self, item, keyframe=None):
+        """
+        Function called by the hub to queue an (index, data, timestamp) item. keyframe is None
+        for self-contained frames (e.g. JPEG): the oldest queued item is dropped when the queue
+        is full. For the frames of a stateful encoder it tells if the item is a keyframe: the
+        queued deltas are all dropped when the queue is full, and the next deltas too until
+        a keyframe comes (see waitingKeyframe). Returns the number of dropped items.
+        """
+        with self._condition:
+            full = len(self._queue) == self._queue.maxlen
+            if keyframe is None:
+                dropped = int(full)
+            elif keyframe:
+                self.waitingKeyframe = False
+                dropped = len(self._queue) if full else 0
+            elif self.waitingKeyframe:
+                dropped = 1
+            elif full:
+                # The new delta and the queued ones can't be decoded without the lost frame
+                dropped = len(self._queue) + 1
+                self.waitingKeyframe = True
+            else:
+                dropped = 0
+            if keyframe is not None and dropped:
+                self._queue.clear()
+            if not self.waitingKeyframe:
+                self._queue.append(item)
+                self._condition.notify()
+            self.dropped += dropped
+        return dropped
+
+    def get(self, timeout=None):
+        """
+        Function to take the oldest queued item. Returns None on timeout or once closed.
+        """
+        with self._condition:
+            if not self._condition.wait_for(lambda: self._queue or self.closed, timeout) or not self._queue:
+                return None
+            item = self._queue.popleft()
+        self.delivered += 1
+        self.bytesDelivered += len(item[1])
+        self.latencies.append(time.time() - item[2])
+        return item
+
+    def markSent(self, index, size, timestamp):
+        """
+        Function called once a frame was written to the client, to match its acknowledgement.
+        """
+        with self._condition:
+            self._unacknowledged[index] = (time.monotonic(), size, timestamp)
+            # Clients that don't acknowledge must not make it grow
+            while len(self._unacknowledged) > 64:
+                self._unacknowledged.popitem(last=False)
+
+    def acknowledge(self, index):
+        """
+        Function called when the client displayed a frame. Returns (send time, size, capture
+        timestamp) of the frame, or None if it is unknown or was already acknowledged.
+        """
+        with self._condition:
+            return self._unacknowledged.pop(index, None)
+
+    def close(self):
+        with self._condition:
+            self.closed = True
+            self._condition.notify_all()
+
+    def stats(self):
+        latencies = numpy.array(self.latencies) if self.latencies else None
+        return {
+            'name': self.name,
+            'tier': self.tier,
+            'level': repr(self.controller.level) if self.controller is not None else None,
+            'delivered': self.delivered,
+            'dropped': self.dropped,
+            'bytes': self.bytesDelivered,
+            'latencyMs': 1000*float(numpy.median(latencies)) if latencies is not None else None,
+            'latencyP95Ms': 1000*float(numpy.percentile(latencies, 95)) if latencies is not None else None,
+        }
+
+
+class FanoutHub:
+    """
+    Encodes the published frames once per tier in a worker thread and queues them to the clients.
+    """
+
+    def __init__(self, tiers, defaultTier=None, telemetry=None, rateLimits=None):
+        self.tiers = {tier.name: tier for tier in tiers}
+        self.defaultTier = defaultTier or tiers[0].name
+        # Optional vCastSlicerLib.telemetry.Telemetry receiving the encode times and drops
+        self.telemetry = telemetry
+        # Optional vCastSlicerLib.ratecontrol.RateLimits: adapt the frames of every client to its link
+        self.rateLimits = rateLimits
+        # Encoders of the adapted levels: (tier, quality[, client]) -> encoder
+        self._levelEncoders = {}
+        self._clients = []
+        self._clientIds = itertools.count()
+        self._clientsLock = threading.Lock()
+        self._running = False
+        self._thread = None
+        # Latest raw frame waiting to be encoded (older pending frames are dropped)
+        self._pending = None
+        self._condition = threading.Condition()
+        self._frameIndex = 0
+        self.encodeTimes = {name: collections.deque(maxlen=256) for name in self.tiers}
+
+    @property
+    def clientCount(self):
+        with self._clientsLock:
+            return len(self._clients)
+
+    @property
+    def clients(self):
+        with self._clientsLock:
+            return list(self._clients)
+
+    def start(self):
+        if self._running:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._encodeLoop, name='vCastFanout', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if not self._running:
+            return
+        self._running = False
+        with self._condition:
+            self._condition.notify_all()
+        self._thread.join(timeout=2.0)
+        self._thread = None
+        for client in self.clients:
+            client.close()
+
+    def addClient(self, name=None, tier=None, maxQueue=2, device=None):
+        """
+        Function to register a client. Raises KeyError for an unknown tier.
+        """
+        tier = tier or self.defaultTier
+        if tier not in self.tiers:
+            raise KeyError(f"Unknown tier {tier}")
+        controller = RateController(self.rateLimits) if self.rateLimits is not None else None
+        client = FanoutClient(name or f'client{next(self._clientIds)}', tier, maxQueue, device=device,
+                              controller=controller)
+        with self._clientsLock:
+            self._clients.append(client)
+        # Stateful encoders (e.g. TileDeltaEncoder) must send a full frame to the new client
+        requestKeyframe = getattr(self.tiers[tier].encoder, 'requestKeyframe', None)
+        if requestKeyframe is not None:
+            requestKeyframe()
+        return client
+
+    def findClient(self, name):
+        """
+        Function to get a client by name (None if it is gone).
+        """
+        with self._clientsLock:
+            return next((client for client in self._clients if client.name == name), None)
+
+    def requestKeyframe(self, client):
+        """
+        Function to send a full frame to a client of a stateful tier (e.g. TileDeltaEncoder),
+        for instance when it lost a frame. Returns False if the encoder of its tier isn't stateful.
+        """
+        if not hasattr(self.tiers[client.tier].encoder, 'requestKeyframe'):
+            return False
+        if client.controller is None:
+            self.tiers[client.tier].encoder.requestKeyframe()
+        else:
+            # Adaptive clients have their own encoders (see _levelEncoder)
+            with self._clientsLock:
+                encoders = [encoder for key, encoder in self._levelEncoders.items() if key[2:] == (client.name,)]
+            for encoder in encoders:
+                encoder.requestKeyframe()
+        return True
+
+    def removeClient(self, client):
+        client.close()
+        with self._clientsLock:
+            if client in self._clients:
+                self._clients.remove(client)
+            for key in [key for key in self._levelEncoders if key[2:] == (client.name,)]:
+                del self._levelEncoders[key]
+
+    def publish(self, frame, timestamp=None):
+        """
+        Function to hand over a new frame. Returns immediately.
+        """
+        if not self._running or frame is None:
+            return
+        timestamp = time.time() if timestamp is None else timestamp
+        with self._condition:
+            self._pending = (frame, timestamp)
+            self._condition.notify()
+
+    def stats(self):
+        return [client.stats() for client in self.clients]
+
+    def _levelEncoder(self, client):
+        """
+        Function to get the (scale, encoder) of the level of an adaptive client.
+        """
+        tier = self.tiers[client.tier]
+        level = client.controller.level
+        # Delta encoders keep the previous frame: clients skipping frames at their own rate
+        # can't share one
+        stateful = hasattr(tier.encoder, 'requestKeyframe')
+        if not stateful and not hasattr(tier.encoder, 'quality'):
+            return tier.scale*level.scale, tier.encoder
+        key = (client.tier, level.quality) + ((client.name,) if stateful else ())
+        with self._clientsLock:
+            encoder = self._levelEncoders.get(key)
+            if encoder is None:
+                encoder = self._levelEncoders[key] = copy.deepcopy(tier.encoder)
+                if hasattr(encoder, 'quality'):
+                    encoder.quality = level.quality
+                if stateful:
+                    encoder.requestKeyframe()
+        return tier.scale*level.scale, encoder
+
+    def _encodeLoop(self):
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._pending is not None or not self._running)
+                if not self._running:
+                    return
+                frame, timestamp = self._pending
+                self._pending = None
+            # Clients grouped by (tier, scale, encoder)
+            groups = collections.defaultdict(list)
+            for client in self.clients:
+                if client.controller is None:
+                    tier = self.tiers[client.tier]
+                    groups[(client.tier, tier.scale, tier.encoder)].append(client)
+                elif client.controller.wantsFrame():
+                    groups[(client.tier,) + self._levelEncoder(client)].append(client)
+            # Only the levels with clients are encoded, once for all their clients
+            for (tierName, scale, encoder), clients in groups.items():
+                start = time.perf_counter()
+                data = encoder(downscale(frame, scale))
+                encodeTime = time.perf_counter() - start
+                self.encodeTimes[tierName].append(encodeTime)
+                item = (self._frameIndex, data, timestamp)
+                # None for the encoders whose frames don't depend on the previous ones
+                keyframe = getattr(encoder, 'lastFrameWasKeyframe', None)
+                dropped = [client.put(item, keyframe) for client in clients]
+                for client, clientDropped in zip(clients, dropped):
+                    if clientDropped and client.controller is not None:
+                        client.controller.onDrop()
+                if self.telemetry is not None:
+                    self.telemetry.observe('encode', encodeTime)
+                    for client, clientDropped in zip(clients, dropped):
+                        if clientDropped:
+                            self.telemetry.increment('framesDropped', client.device, clientDropped)
+                # A client that missed a delta frame needs a full frame to recover
+                requestKeyframe = getattr(encoder, 'requestKeyframe', None)
+                if requestKeyframe is not None and any(client.waitingKeyframe for client in clients):
+                    requestKeyframe()
+            self._frameIndex += 1
@@ -0,0 +1,282 @@
+import json
+import mmap
+import os
+import struct
+import tempfile
+import time
+import numpy
+
+#
+# Shared-memory ring buffer of rendered frames.
+# Slicer writes each captured frame in the next slot of a memory-mapped file; local
+# consumers (vCastSender, a VR bridge, a recorder...) map the same file and read the
+# pixels in place, without copies and without scraping the screen.
+#
+# Every Slicer session writes its own ring file and announces its path in a small JSON file
+# at a fixed place (ANNOUNCEMENT_PATH), where the readers look for it. A new session never
+# truncates a ring still mapped by the readers of an older one (which fails on Windows), and
+# a writer refuses a ring file another process is writing.
+#
+# File layout (little endian):
+#   ring header (64 bytes): magic 'VCRB', version, slot count, slot size, last frame index,
+#                           process id of the writer
+#   slot header (64 bytes): sequence, frame index, width, height, stride, channels, timestamp
+#   slot pixels (slot size bytes), rows of `stride` bytes, top row first
+#
+# Each slot is protected by a seqlock: the writer makes the sequence odd before touching
+# the slot and even again afterwards. A reader checks that the sequence is even and has
+# not changed after it is done with the pixels; otherwise the frame was overwritten.
+#
+
+MAGIC = b'VCRB'
+VERSION = 2
+# magic, version, slot count, slot size, last frame index (-1 when empty), process id of the
+# writer (0 once closed)
+RING_HEADER = struct.Struct('<4sIIQqQ')
+RING_HEADER_SIZE = 64
+# sequence, frame index, width, height, stride, channels, timestamp
+SLOT_HEADER = struct.Struct('<QqIIIId')
+SLOT_HEADER_SIZE = 64
+# Offset of the last frame index in the ring header
+LAST_INDEX_OFFSET = 20
+# Offset of the process id of the writer in the ring header
+WRITER_PID_OFFSET = 28
+
+# Where the writer announces its ring ({"path": ..., "pid": ...}) to the readers
+ANNOUNCEMENT_PATH = os.path.join(tempfile.gettempdir(), 'vCastSlicerFrames.json')
+
+# Ring files written by this process
+_openPaths = set()
+
+
+def ringFileSize(slotCount, slotSize):
+    return RING_HEADER_SIZE + slotCount*(SLOT_HEADER_SIZE + slotSize)
+
+
+def sessionRingPath(pid=None):
+    """
+    Function to get the default ring file of a Slicer session (one per process).
+    """
+    return os.path.join(tempfile.gettempdir(), f'vCastSlicerFrames-{pid or os.getpid()}.ring')
+
+
+def announcedRingPath(announcementPath=ANNOUNCEMENT_PATH):
+    """
+    Function to get the path of the ring announced by the current writer. Raises
+    FileNotFoundError if no ring is announced.
+    """
+    try:
+        with open(announcementPath, encoding='utf-8') as announcement:
+            return json.load(announcement)['path']
+    except (ValueError, KeyError, TypeError) as e:
+        raise FileNotFoundError(f"No frame ring announced in {announcementPath}") from e
+
+
+def ringWriterPid(path):
+    """
+    Function to read the process id of the writer of a ring file: 0 if it was closed, None if
+    the file is missing or isn't a ring of this version.
+    """
+    try:
+        with open(path, 'rb') as ringFile:
+            header = ringFile.read(RING_HEADER.size)
+    except OSError:
+        return None
+    if len(header) < RING_HEADER.size:
+        return None
+    magic, version, _, _, _, pid = RING_HEADER.unpack(header)
+    return pid if (magic, version) == (MAGIC, VERSION) else None
+
+
+class FrameRingWriter:
+    """
+    Producer side. Only one writer may use a ring file at a time: opening a ring file
+    another writer is using raises FileExistsError. The ring is announced at
+    announcementPath (None to not announce it).
+    """
+
+    def __init__(self, path=None, slotCount=3, maxWidth=3840, maxHeight=2160, channels=3,
+                 announcementPath=ANNOUNCEMENT_PATH):
+        self.path = os.path.abspath(path or sessionRingPath())
+        self.slotCount = slotCount
+        self.slotSize = maxWidth*maxHeight*channels
+        self.announcementPath = announcementPath
+        self._frameIndex = 0
+        # A ring of this process id that this process didn't open was left by a crashed process
+        # with the same id
+        pid = ringWriterPid(self.path)
+        if pid and (pid != os.getpid() or self.path in _openPaths):
+            raise FileExistsError(f"{self.path} is written by process {pid}"
+                                  " (remove the file if that process is gone)")
+        size = ringFileSize(slotCount, self.slotSize)
+        self._file = open(self.path, 'w+b')
+        self._file.truncate(size)
+        self._mmap = mmap.mmap(self._file.fileno(), size)
+        RING_HEADER.pack_into(self._mmap, 0, MAGIC, VERSION, slotCount, self.slotSize, -1, os.getpid())
+        _openPaths.add(self.path)
+        if announcementPath is not None:
+            self._announce()
+        # Sequence words of all the slots, as a writable view on the mapping
+        self._sequences = [numpy.frombuffer(self._mmap, dtype=numpy.uint64, count=1, offset=self._slotOffset(i))
+                           for i in range(slotCount)]
+
+    def _slotOffset(self, slot):
+        return RING_HEADER_SIZE + slot*(SLOT_HEADER_SIZE + self.slotSize)
+
+    def _announce(self):
+        """
+        Function to write the path of the ring in the announcement file (atomically).
+        """
+        temporaryPath = f'{self.announcementPath}.{os.getpid()}.tmp'
+        with open(temporaryPath, 'w', encoding='utf-8') as announcement:
+            json.dump({'path': self.path, 'pid': os.getpid()}, announcement)
+        os.replace(temporaryPath, self.announcementPath)
+
+    def publish(self, frame, timestamp=None):
+        """
+        Function to copy a (height, width, channels) uint8 frame in the next slot.
+        Returns the index of the published frame.
+        """
+        if frame is None:
+            return None
+        height, width = frame.shape[:2]
+        channels = frame.shape[2] if frame.ndim == 3 else 1
+        stride = width*channels
+        if stride*height > self.slotSize:
+            raise ValueError(f"Frame of {width}x{height} doesn't fit in the ring slots")
+        timestamp = time.time() if timestamp is None else timestamp
+        slot = self._frameIndex % self.slotCount
+        offset = self._slotOffset(slot)
+        sequence = self._sequences[slot]
+        # Odd sequence: slot being written
+        sequence += 1
+        SLOT_HEADER.pack_into(self._mmap, offset, int(sequence[0]), self._frameIndex, width, height, stride,
+                              channels, timestamp)
+        pixels = numpy.frombuffer(self._mmap, dtype=numpy.uint8, count=stride*height,
+                                  offset=offset + SLOT_HEADER_SIZE)
+        pixels.reshape(height, width, channels)[...] = frame.reshape(height, width, channels)
+        # Even sequence: slot is consistent again
+        sequence += 1
+        struct.pack_into('<q', self._mmap, LAST_INDEX_OFFSET, self._frameIndex)
+        self._frameIndex += 1
+        return self._frameIndex - 1
+
+    def close(self, remove=False):
+        """
+        Function to stop writing: marks the ring as closed, withdraws its announcement and,
+        with remove, deletes the file (kept while a reader maps it on Windows).
+        """
+        self._sequences = []
+        struct.pack_into('<Q', self._mmap, WRITER_PID_OFFSET, 0)
+        self._mmap.close()
+        self._file.close()
+        _openPaths.discard(self.path)
+        if self.announcementPath is not None:
+            try:
+                if announcedRingPath(self.announcementPath) == self.path:
+                    os.remove(self.announcementPath)
+            except OSError:
+                pass
+        if remove:
+            try:
+                os.remove(self.path)
+            except PermissionError:
+                pass
+
+
+class FrameView:
+    """
+    Zero-copy view of a frame in the ring. The pixels are only guaranteed to be the
+    published ones while isValid() returns True (call it after using them).
+    """
+
+    def __init__(self, reader, slot, sequence, frameIndex, width, height, stride, channels, timestamp, pixels):
+        self._reader = reader
+        self.slot = slot
+        self.sequence = sequence
+        self.frameIndex = frameIndex
+        self.width = width
+        self.height = height
+        self.stride = stride
+        self.channels = channels
+        self.timestamp = timestamp
+        self.pixels = pixels
+
+    def isValid(self):
+        return self._reader._sequence(self.slot) == self.sequence
+
+
+class FrameRingReader:
+    """
+    Reference consumer of a ring file written by FrameRingWriter (the announced ring by default).
+    """
+
+    def __init__(self, path=None, announcementPath=ANNOUNCEMENT_PATH):
+        self.path = path or announcedRingPath(announcementPath)
+        self._file = open(self.path, 'rb')
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.slotCount, self.slotSize, _, _ = RING_HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{self.path} is not a vCastSlicer frame ring")
+
+    @property
+    def lastFrameIndex(self):
+        return struct.unpack_from('<q', self._mmap, LAST_INDEX_OFFSET)[0]
+
+    def _slotOffset(self, slot):
+        return RING_HEADER_SIZE + slot*(SLOT_HEADER_SIZE + self.slotSize)
+
+    def _sequence(self, slot):
+        return struct.unpack_from('<Q', self._mmap, self._slotOffset(slot))[0]
+
+    def view(self, frameIndex=None):
+        """
+        Function to get a zero-copy view of a frame (the latest one by default).
+        Returns None if the ring is empty, the frame was overwritten or is being written.
+        """
+        lastIndex = self.lastFrameIndex
+        frameIndex = lastIndex if frameIndex is None else frameIndex
+        if frameIndex < 0 or frameIndex > lastIndex or lastIndex - frameIndex >= self.slotCount:
+            return None
+        slot = frameIndex % self.slotCount
+        offset = self._slotOffset(slot)
+        sequence, index, width, height, stride, channels, timestamp = SLOT_HEADER.unpack_from(self._mmap, offset)
+        if sequence % 2 or index != frameIndex:
+            return None
+        pixels = numpy.frombuffer(self._mmap, dtype=numpy.uint8, count=stride*height, offset=offset + SLOT_HEADER_SIZE)
+        pixels = pixels.reshape(height, stride)[:, :width*channels].reshape(height, width, channels)
+        # The header could have been changed while it was being read
+        if self._sequence(slot) != sequence:
+            return None
+        return FrameView(self, slot, sequence, index, width, height, stride, channels, timestamp, pixels)
+
+    def copy(self, frameIndex=None, retries=3):
+        """
+        Function to get a private copy of a frame, retrying if the writer overwrites it meanwhile.
+        """
+        for _ in range(retries):
+            view = self.view(frameIndex)
+            if view is None:
+                continue
+            pixels = view.pixels.copy()
+            if view.isValid():
+                return view.frameIndex, view.timestamp, pixels
+        return None
+
+    def waitForFrame(self, lastIndex, timeout=1.0, interval=0.0005):
+        """
+        Function to wait (polling) until a frame newer than lastIndex is published.
+        """
+        deadline = time.monotonic() + timeout
+        while self.lastFrameIndex <= lastIndex:
+            if time.monotonic() > deadline:
+                return None
+            time.sleep(interval)
+        return self.view()
+
+    def close(self):
+        """
+        Function to unmap the ring. All the FrameView objects must have been released.
+        """
+        self._mmap.close()
+        self._file.close()
@@ -0,0 +1,261 @@
+import collections
+import concurrent.futures
+import hashlib
+import heapq
+import os
+import time
+import numpy
+from vCastSlicerLib.diskcache import DiskCache, saveArray
+
+#
+# Levels of detail (LOD) of the surface models (cortex, electrodes...), cached on disk.
+# Level n of a mesh has about ratio**n times its triangles. Levels are made by vertex
+# clustering: the vertices are snapped to a grid, the vertices of a cell are merged at their
+# mean and the triangles that collapse are removed. It is pure NumPy, so the decimation runs
+# in a pool of worker processes (no VTK there, and the GUI never waits for it), and it is
+# fast enough to make all the levels of a 300k-triangle mesh in a few hundred milliseconds.
+#
+# Levels are saved by geometry hash (see DiskCache). Each display has a triangle budget for
+# the whole scene: the models are coarsened, biggest first, until the scene fits in it.
+#
+
+# Triangles rendered smoothly by each kind of display (None: the original models)
+DISPLAY_TRIANGLE_BUDGETS = {
+    'desktop': None,
+    'vr': 2000000,
+    'hololens': 150000,
+    'board': 500000,
+}
+# Triangles of a level relative to the previous one
+LEVEL_RATIO = 0.25
+# No level with fewer triangles than this is made
+MIN_TRIANGLES = 500
+
+
+def meshHash(points, triangles):
+    """
+    Function to get the key of a mesh: hash of its points and triangles.
+    """
+    digest = hashlib.sha1()
+    for array in (points, triangles):
+        array = numpy.ascontiguousarray(array)
+        digest.update(f'{array.dtype.str}{array.shape}'.encode())
+        digest.update(memoryview(array.reshape(-1)))
+    return digest.hexdigest()
+
+
+def surfaceArea(points, triangles):
+    a, b, c = (points[triangles[:, i]] for i in range(3))
+    return 0.5*float(numpy.linalg.norm(numpy.cross(b - a, c - a), axis=1).sum())
+
+
+def clusterVertices(points, triangles, cellSize):
+    """
+    Function to merge the vertices of each cell of a grid of cellSize. Returns the new
+    (points, triangles), without collapsed nor duplicated triangles and unused points.
+    """
+    cells = numpy.floor((points - points.min(axis=0))/cellSize).astype(numpy.int64)
+    dims = cells.max(axis=0) + 1
+    cellIds = (cells[:, 0]*dims[1] + cells[:, 1])*dims[2] + cells[:, 2]
+    _, vertexCluster = numpy.unique(cellIds, return_inverse=True)
+    vertexCluster = vertexCluster.reshape(-1)
+    merged = vertexCluster[triangles]
+    merged = merged[(merged[:, 0] != merged[:, 1]) & (merged[:, 1] != merged[:, 2]) & (merged[:, 0] != merged[:, 2])]
+    # Triangles made of the same 3 clusters: only the first one is kept
+    corners = numpy.sort(merged, axis=1)
+    clusterCount = int(vertexCluster.max()) + 1
+    if clusterCount**3 < 2**63:
+        # One integer per triangle: sorting integers is much faster than sorting rows
+        _, first = numpy.unique((corners[:, 0]*clusterCount + corners[:, 1])*clusterCount + corners[:, 2],
+                                return_index=True)
+    else:
+        _, first = numpy.unique(corners, axis=0, return_index=True)
+    merged = merged[numpy.sort(first)]
+    # Clusters used by the remaining triangles become the new points, at the mean of their vertices
+    used, newTriangles = numpy.unique(merged, return_inverse=True)
+    newIndex = numpy.full(clusterCount, -1, dtype=numpy.int64)
+    newIndex[used] = numpy.arange(len(used))
+    vertexIndex = newIndex[vertexCluster]
+    inside = vertexIndex >= 0
+    counts = numpy.bincount(vertexIndex[inside], minlength=len(used))
+    newPoints = numpy.empty((len(used), 3), dtype=numpy.float64)
+    for axis in range(3):
+        newPoints[:, axis] = numpy.bincount(vertexIndex[inside], weights=points[inside, axis], minlength=len(used))
+    newPoints /= counts[:, None]
+    return newPoints.astype(points.dtype), newTriangles.reshape(-1, 3).astype(triangles.dtype)
+
+
+def decimate(points, triangles, targetTriangles, iterations=8, area=None):
+    """
+    Function to reduce a mesh to at most targetTriangles (and close to it) by vertex clustering.
+    area is the surface area of the mesh, if already known.
+    """
+    if len(triangles) <= targetTriangles:
+        return points, triangles
+    area = surfaceArea(points, triangles) if area is None else area
+    # About 2 triangles per cell crossed by the surface
+    cellSize = numpy.sqrt(2*area/targetTriangles)
+    best = None
+    for _ in range(iterations):
+        result = clusterVertices(points, triangles, cellSize)
+        count = len(result[1])
+        if count <= targetTriangles:
+            if best is None or count > len(best[1]):
+                best = result
+            if count >= 0.9*targetTriangles:
+                break
+        cellSize *= numpy.sqrt(max(count, 1)/targetTriangles)*(1.02 if count > targetTriangles else 1.0)
+    while best is None:
+        # Not reached in the iterations: coarser cells until it fits
+        cellSize *= 1.5
+        result = clusterVertices(points, triangles, cellSize)
+        if len(result[1]) <= targetTriangles:
+            best = result
+    return best
+
+
+def buildLevels(points, triangles, ratio=LEVEL_RATIO, minTriangles=MIN_TRIANGLES):
+    """
+    Function executed by the worker processes: makes the levels 1, 2... of a mesh (each one
+    from the original mesh). Returns ([(points, triangles), ...], seconds).
+    """
+    start = time.perf_counter()
+    levels = []
+    area = surfaceArea(points, triangles)
+    target = int(len(triangles)*ratio)
+    while target >= minTriangles:
+        levels.append(decimate(points, triangles, target, area=area))
+        target = int(target*ratio)
+    return levels, time.perf_counter() - start
+
+
+def chooseLevels(levelCounts, budget):
+    """
+    Function to choose the level of every model of a scene so that the total number of
+    triangles fits in budget: the model with the most triangles is coarsened first.
+    levelCounts holds, per model, the triangles of each of its levels (level 0 first).
+    Returns the level of each model (the coarsest ones if the budget can't be met).
+    """
+    levels = [0]*len(levelCounts)
+    if budget is None:
+        return levels
+    total = sum(counts[0] for counts in levelCounts)
+    heap = [(-counts[0], i) for i, counts in enumerate(levelCounts) if len(counts) > 1]
+    heapq.heapify(heap)
+    while total > budget and heap:
+        _, i = heapq.heappop(heap)
+        counts = levelCounts[i]
+        total -= counts[levels[i]] - counts[levels[i] + 1]
+        levels[i] += 1
+        if levels[i] + 1 < len(counts):
+            heapq.heappush(heap, (-counts[levels[i]], i))
+    return levels
+
+
+class MeshLODCache(DiskCache):
+    """
+    Disk cache of mesh levels: {cacheDir}/{key}/points{n}.npy, triangles{n}.npy and index.json.
+    Level 0 (the mesh itself) is not stored. Decimation runs in a pool of worker processes;
+    mpContext, initializer and initargs are passed to it (e.g. to choose the Python
+    executable of the workers). telemetry (vCastSlicerLib.telemetry.Telemetry) receives the
+    build times ('lodBuild') and the 'lodCacheHits' and 'lodCacheMisses' counters.
+    """
+
+    def __init__(self, cacheDir, maxBytes=1024**3, workers=2, ratio=LEVEL_RATIO, minTriangles=MIN_TRIANGLES,
+                 telemetry=None, mpContext=None, initializer=None, initargs=()):
+        super().__init__(cacheDir, maxBytes, workers, 'vCastMeshLOD')
+        self.ratio = ratio
+        self.minTriangles = minTriangles
+        self.telemetry = telemetry
+        # Seconds of decimation of the last builds
+        self.buildTimes = collections.deque(maxlen=256)
+        self._processArgs = {'mp_context': mpContext, 'initializer': initializer, 'initargs': initargs}
+        self._processes = None
+
+    def build(self, points, triangles, key=None):
+        """
+        Function to make sure that the levels of a mesh are in the cache. Returns a
+        concurrent.futures.Future whose result is the key of the mesh (already done on a
+        cache hit). The arrays must not change until the future is done.
+        """
+        key = key or meshHash(points, triangles)
+        if self.index(key) is not None:
+            self.hits += 1
+            self.touch(key)
+            self._count('lodCacheHits')
+            future = concurrent.futures.Future()
+            future.set_result(key)
+            return future
+        return self.submit(self._build, points, triangles, key)
+
+    def counts(self, key):
+        """
+        Function to get the triangles of each level of a cached mesh, level 0 first.
+        Raises KeyError if it isn't cached.
+        """
+        index = self.index(key)
+        if index is None:
+            raise KeyError(f"No mesh {key} in {self.cacheDir}")
+        return index['triangles']
+
+    def load(self, key, level):
+        """
+        Function to get the (points, triangles) arrays of a level (>= 1), memory-mapped.
+        Raises KeyError if it isn't cached.
+        """
+        directory = self.entryDir(key)
+        try:
+            points = numpy.load(os.path.join(directory, f'points{level}.npy'), mmap_mode='r')
+            triangles = numpy.load(os.path.join(directory, f'triangles{level}.npy'), mmap_mode='r')
+        except OSError:
+            raise KeyError(f"No level {level} of mesh {key} in {self.cacheDir}")
+        self.touch(key)
+        return points, triangles
+
+    def stats(self):
+        stats = super().stats()
+        times = sorted(self.buildTimes)
+        stats['builds'] = len(times)
+        stats['buildMedianS'] = times[len(times)//2] if times else None
+        stats['buildMaxS'] = times[-1] if times else None
+        return stats
+
+    def shutdown(self, wait=True):
+        super().shutdown(wait)
+        processes, self._processes = self._processes, None
+        if processes is not None:
+            processes.shutdown(wait=wait, cancel_futures=True)
+
+    def _count(self, name):
+        if self.telemetry is not None:
+            self.telemetry.increment(name)
+
+    def _build(self, points, triangles, key):
+        """
+        Function executed by the threads of the cache: decimates in a worker process and saves the levels.
+        """
+        done = self.claim(key)
+        if done is None:
+            self._count('lodCacheHits')
+            return key
+        self._count('lodCacheMisses')
+        try:
+            with self._lock:
+                if self._processes is None:
+                    self._processes = concurrent.futures.ProcessPoolExecutor(self.workers, **self._processArgs)
+                processes = self._processes
+            levels, seconds = processes.submit(buildLevels, points, triangles, self.ratio, self.minTriangles).result()
+            directory = self.entryDir(key)
+            for n, (levelPoints, levelTriangles) in enumerate(levels, 1):
+                saveArray(os.path.join(directory, f'points{n}.npy'), levelPoints.astype(numpy.float32))
+                saveArray(os.path.join(directory, f'triangles{n}.npy'), levelTriangles.astype(numpy.int32))
+            self.writeIndex(key, {'triangles': [len(triangles)] + [len(t) for _, t in levels],
+                                  'points': [len(points)] + [len(p) for p, _ in levels],
+                                  'buildS': seconds, 'createdAt': time.time()})
+        finally:
+            self.release(key, done)
+        self.buildTimes.append(seconds)
+        if self.telemetry is not None:
+            self.telemetry.observe('lodBuild', seconds)
+        self.evict(keep=(key,))
+        return key
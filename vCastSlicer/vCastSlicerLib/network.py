@@ -0,0 +1,38 @@
+import socket
+
+#
+# Addresses the servers of the module (stream, scene-state sync, metrics) listen on.
+# They only accept connections from this computer unless network access is explicitly
+# allowed: the views, scene state and measurements are served without authentication.
+#
+
+# Only this computer
+LOCAL_HOST = '127.0.0.1'
+# All the network interfaces
+ALL_INTERFACES = '0.0.0.0'
+
+
+def listenHost(allowNetworkAccess):
+    """
+    Function to get the address the servers listen on.
+    """
+    return ALL_INTERFACES if allowNetworkAccess else LOCAL_HOST
+
+
+def reachableHost(host):
+    """
+    Function to get an address other devices can connect to, for a server listening on host.
+    Servers listening on all interfaces are given the address of the interface of the default
+    route (or the host name if there is no network).
+    """
+    if host not in (ALL_INTERFACES, '', '::'):
+        return host
+    probe = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        # Connecting a UDP socket only picks the interface, nothing is sent
+        probe.connect(('10.255.255.255', 1))
+        return probe.getsockname()[0]
+    except OSError:
+        return socket.gethostname()
+    finally:
+        probe.close()
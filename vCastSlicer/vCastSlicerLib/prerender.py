@@ -0,0 +1,321 @@
+import concurrent.futures
+import glob
+import json
+import math
+import os
+import shutil
+import subprocess
+import time
+import numpy
+from vCastSlicerLib.deltacodec import TileDeltaDecoder, TileDeltaEncoder
+
+#
+# Offline pre-rendering of camera sequences (turntables, fly-throughs along a path).
+# The poses are split in contiguous chunks rendered by separate worker processes (one
+# headless Slicer each, see vCastSlicerLib.prerendercli), which share nothing but the
+# output directory. Each worker writes its frames as tile delta packets
+# (vCastSlicerLib.deltacodec, lossless, with a keyframe every keyframeInterval frames) to
+# its own chunk file; the coordinator then merges the chunk indexes in index.json, which gives the file, offset,
+# size and camera pose of every frame, so that any frame can be decoded from the keyframe
+# before it. An MP4 video can be made from the sequence if ffmpeg is installed.
+#
+
+INDEX_FILE = 'index.json'
+POSES_FILE = 'poses.json'
+SEQUENCE_FORMAT = 'vcast-delta'
+KEYFRAME_INTERVAL = 30
+
+
+def turntablePoses(center, radius, count, elevation=15.0, axis=(0.0, 0.0, 1.0), start=(0.0, 1.0, 0.0)):
+    """
+    Function to place count cameras on one full turn around center, looking at it.
+    elevation is the angle (degrees) of the cameras above the plane normal to axis, start
+    the direction of the first camera from center (anterior by default). Returns a list of
+    {'position', 'focalPoint', 'viewUp'} poses.
+    """
+    axis = numpy.asarray(axis, dtype=float)
+    axis /= numpy.linalg.norm(axis)
+    start = numpy.asarray(start, dtype=float)
+    start = start - start.dot(axis)*axis
+    if numpy.linalg.norm(start) < 1e-9:
+        raise ValueError("The start direction can't be parallel to the rotation axis")
+    start /= numpy.linalg.norm(start)
+    side = numpy.cross(axis, start)
+    center = numpy.asarray(center, dtype=float)
+    elevation = math.radians(elevation)
+    poses = []
+    for n in range(count):
+        angle = 2*math.pi*n/count
+        direction = math.cos(elevation)*(math.cos(angle)*start + math.sin(angle)*side) + math.sin(elevation)*axis
+        poses.append({'position': (center + radius*direction).tolist(), 'focalPoint': center.tolist(),
+                      'viewUp': axis.tolist()})
+    return poses
+
+
+def pathPoses(points, count, lookAhead=None, viewUp=(0.0, 0.0, 1.0)):
+    """
+    Function to move count cameras at constant speed along a polyline (e.g. the control
+    points of a markup), each one looking at the point lookAhead further on the path (a
+    tenth of its length by default). Returns a list of {'position', 'focalPoint', 'viewUp'} poses.
+    """
+    points = numpy.asarray(points, dtype=float).reshape(-1, 3)
+    lengths = numpy.linalg.norm(numpy.diff(points, axis=0), axis=1)
+    # Repeated points would give segments without direction
+    points = points[numpy.concatenate([[True], lengths > 0])]
+    lengths = lengths[lengths > 0]
+    if len(points) < 2:
+        raise ValueError("A camera path needs at least 2 distinct points")
+    distances = numpy.concatenate([[0.0], numpy.cumsum(lengths)])
+    total = distances[-1]
+    lookAhead = total/10 if lookAhead is None else lookAhead
+    # The path goes on straight after its end, for the focal points of the last cameras
+    last = (points[-1] - points[-2])/lengths[-1]
+    points = numpy.vstack([points, points[-1] + last*lookAhead])
+    distances = numpy.append(distances, total + lookAhead)
+    positionDistances = numpy.linspace(0.0, total, count)
+
+    def at(d):
+        return numpy.stack([numpy.interp(d, distances, points[:, axis]) for axis in range(3)], axis=1)
+
+    positions = at(positionDistances)
+    focalPoints = at(positionDistances + lookAhead)
+    viewUp = numpy.asarray(viewUp, dtype=float)
+    poses = []
+    for position, focalPoint in zip(positions, focalPoints):
+        direction = (focalPoint - position)/numpy.linalg.norm(focalPoint - position)
+        up = viewUp
+        if abs(direction.dot(up)) > 0.99*numpy.linalg.norm(up):
+            # Looking along viewUp: any perpendicular direction will do
+            up = numpy.cross(direction, (1.0, 0.0, 0.0) if abs(direction[0]) < 0.9 else (0.0, 1.0, 0.0))
+        poses.append({'position': position.tolist(), 'focalPoint': focalPoint.tolist(), 'viewUp': up.tolist()})
+    return poses
+
+
+def chunkRanges(count, chunks):
+    """
+    Function to split frames 0..count-1 in at most chunks contiguous (start, stop) ranges
+    of (almost) the same size. Contiguous frames look alike, which keeps the deltas small.
+    """
+    bounds = numpy.linspace(0, count, max(min(chunks, count), 1) + 1).round().astype(int).tolist()
+    return [(start, stop) for start, stop in zip(bounds, bounds[1:]) if stop > start]
+
+
+def chunkName(start):
+    return f'chunk{start:06d}'
+
+
+class FrameSequenceWriter:
+    """
+    Writes the frames of one chunk, starting at frame start, to {outputDir}/chunk{start}.frames.
+    Its index is written to chunk{start}.json on close(), so an interrupted chunk is never merged.
+    """
+
+    def __init__(self, outputDir, start, keyframeInterval=KEYFRAME_INTERVAL, tileSize=64):
+        self.outputDir = outputDir
+        self.start = start
+        self._encoder = TileDeltaEncoder(tileSize, keyframeInterval)
+        self._file = open(os.path.join(outputDir, chunkName(start) + '.frames'), 'wb')
+        self._frames = []
+        self._shape = None
+        self.renderS = 0.0
+        self.encodeS = 0.0
+
+    def write(self, frame):
+        """
+        Function to append a (height, width, 3) uint8 frame.
+        """
+        if self._shape is not None and frame.shape != self._shape:
+            raise ValueError(f"Frame {self.start + len(self._frames)} is {frame.shape}, not {self._shape}")
+        self._shape = frame.shape
+        start = time.perf_counter()
+        packet = self._encoder.encode(frame)
+        self.encodeS += time.perf_counter() - start
+        # The keyframe flag is the 5th byte of the packet header
+        self._frames.append([self._file.tell(), len(packet), bool(packet[4] & 1)])
+        self._file.write(packet)
+
+    def close(self):
+        self._file.close()
+        height, width = self._shape[:2] if self._shape is not None else (0, 0)
+        index = {'file': chunkName(self.start) + '.frames', 'start': self.start, 'width': width, 'height': height,
+                 'frames': self._frames, 'renderS': self.renderS, 'encodeS': self.encodeS}
+        with open(os.path.join(self.outputDir, chunkName(self.start) + '.json'), 'w', encoding='utf-8') as indexFile:
+            json.dump(index, indexFile)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        if excType is None:
+            self.close()
+        else:
+            self._file.close()
+
+
+def renderChunk(render, poses, start, stop, outputDir, keyframeInterval=KEYFRAME_INTERVAL):
+    """
+    Function executed by the workers: renders poses[start:stop] with render(pose), which
+    returns an RGB frame, and writes them with a FrameSequenceWriter.
+    """
+    with FrameSequenceWriter(outputDir, start, keyframeInterval) as writer:
+        for pose in poses[start:stop]:
+            begin = time.perf_counter()
+            frame = render(pose)
+            writer.renderS += time.perf_counter() - begin
+            writer.write(frame)
+
+
+def writePoses(outputDir, poses):
+    os.makedirs(outputDir, exist_ok=True)
+    path = os.path.join(outputDir, POSES_FILE)
+    with open(path, 'w', encoding='utf-8') as posesFile:
+        json.dump(poses, posesFile)
+    return path
+
+
+def readPoses(path):
+    with open(path, encoding='utf-8') as posesFile:
+        return json.load(posesFile)
+
+
+def runChunks(command, ranges, workers, env=None):
+    """
+    Function to run command(start, stop) (an argument list) for each range, at most workers
+    processes at a time. Raises RuntimeError with the end of its output if a worker fails.
+    Returns the seconds taken by each range.
+    """
+    def run(start, stop):
+        begin = time.perf_counter()
+        result = subprocess.run(command(start, stop), stdout=subprocess.PIPE, stderr=subprocess.STDOUT, env=env)
+        if result.returncode != 0:
+            output = result.stdout.decode(errors='replace')[-2000:]
+            raise RuntimeError(f"Worker of frames {start}-{stop - 1} failed ({result.returncode}):\n{output}")
+        return time.perf_counter() - begin
+
+    with concurrent.futures.ThreadPoolExecutor(max(workers, 1), thread_name_prefix='vCastPrerender') as executor:
+        futures = [executor.submit(run, start, stop) for start, stop in ranges]
+        return [future.result() for future in futures]
+
+
+def mergeIndex(outputDir, poses, frameRate=30, metadata=None):
+    """
+    Function to merge the chunk indexes of a sequence in index.json. Raises ValueError
+    if frames are missing. Returns the index.
+    """
+    chunks = []
+    for path in glob.glob(os.path.join(outputDir, 'chunk*.json')):
+        with open(path, encoding='utf-8') as chunkFile:
+            chunks.append(json.load(chunkFile))
+    chunks.sort(key=lambda chunk: chunk['start'])
+    frames = []
+    for chunk in chunks:
+        if chunk['start'] != len(frames):
+            raise ValueError(f"Frames {len(frames)}-{chunk['start'] - 1} are missing in {outputDir}")
+        if (chunk['width'], chunk['height']) != (chunks[0]['width'], chunks[0]['height']):
+            raise ValueError(f"Chunk {chunk['file']} doesn't have the size of the others")
+        for offset, size, keyframe in chunk['frames']:
+            frames.append({'file': chunk['file'], 'offset': offset, 'size': size, 'keyframe': keyframe,
+                           'pose': poses[len(frames)]})
+    if len(frames) != len(poses):
+        raise ValueError(f"{len(poses) - len(frames)} frames are missing in {outputDir}")
+    index = {'format': SEQUENCE_FORMAT, 'width': chunks[0]['width'] if chunks else 0,
+             'height': chunks[0]['height'] if chunks else 0, 'frameRate': frameRate, 'frameCount': len(frames),
+             'renderS': sum(chunk['renderS'] for chunk in chunks), 'encodeS': sum(chunk['encodeS'] for chunk in chunks),
+             'metadata': metadata or {}, 'frames': frames}
+    with open(os.path.join(outputDir, INDEX_FILE), 'w', encoding='utf-8') as indexFile:
+        json.dump(index, indexFile)
+    for chunk in chunks:
+        os.remove(os.path.join(outputDir, chunkName(chunk['start']) + '.json'))
+    return index
+
+
+class FrameSequenceReader:
+    """
+    Reads the frames of a pre-rendered sequence. frame(n) decodes from the last keyframe
+    before n, or goes on from the previous frame when reading in order.
+    """
+
+    def __init__(self, outputDir):
+        self.outputDir = outputDir
+        with open(os.path.join(outputDir, INDEX_FILE), encoding='utf-8') as indexFile:
+            self.index = json.load(indexFile)
+        if self.index.get('format') != SEQUENCE_FORMAT:
+            raise ValueError(f"{outputDir} is not a {SEQUENCE_FORMAT} sequence")
+        self._files = {}
+        self._decoder = None
+        self._current = -1
+
+    def __len__(self):
+        return self.index['frameCount']
+
+    def __iter__(self):
+        for n in range(len(self)):
+            yield self.frame(n)
+
+    def pose(self, n):
+        return self.index['frames'][n]['pose']
+
+    def _packet(self, n):
+        entry = self.index['frames'][n]
+        if entry['file'] not in self._files:
+            self._files[entry['file']] = open(os.path.join(self.outputDir, entry['file']), 'rb')
+        packetFile = self._files[entry['file']]
+        packetFile.seek(entry['offset'])
+        return packetFile.read(entry['size'])
+
+    def frame(self, n):
+        """
+        Function to get frame n as a (height, width, 3) uint8 array (valid until the next call).
+        """
+        frames = self.index['frames']
+        if not 0 <= n < len(frames):
+            raise IndexError(f"No frame {n} in a sequence of {len(frames)}")
+        if self._decoder is None or not self._current < n or frames[n]['keyframe']:
+            start = n
+            while not frames[start]['keyframe']:
+                start -= 1
+            self._decoder = TileDeltaDecoder()
+        else:
+            # Chunks start with a keyframe, so the previous frame is in the same file
+            start = self._current + 1
+            for m in range(start, n + 1):
+                if frames[m]['keyframe']:
+                    start = m
+        for m in range(start, n + 1):
+            frame = self._decoder.decode(self._packet(m))
+        self._current = n
+        return frame
+
+    def close(self):
+        for packetFile in self._files.values():
+            packetFile.close()
+        self._files = {}
+
+
+def writeVideo(outputDir, videoPath, frameRate=None, ffmpeg=None, crf=18):
+    """
+    Function to encode a pre-rendered sequence as an H.264 video with ffmpeg. Raises
+    RuntimeError if ffmpeg can't be found or fails.
+    """
+    ffmpeg = ffmpeg or shutil.which('ffmpeg')
+    if ffmpeg is None:
+        raise RuntimeError("ffmpeg is needed to write a video, the frame sequence is in " + outputDir)
+    reader = FrameSequenceReader(outputDir)
+    index = reader.index
+    # H.264 in yuv420p needs even dimensions
+    width, height = index['width'] - index['width'] % 2, index['height'] - index['height'] % 2
+    command = [ffmpeg, '-y', '-loglevel', 'error', '-f', 'rawvideo', '-pix_fmt', 'rgb24',
+               '-s', f'{width}x{height}', '-r', str(frameRate or index['frameRate']), '-i', '-',
+               '-c:v', 'libx264', '-pix_fmt', 'yuv420p', '-crf', str(crf), videoPath]
+    process = subprocess.Popen(command, stdin=subprocess.PIPE, stderr=subprocess.PIPE)
+    try:
+        for frame in reader:
+            process.stdin.write(numpy.ascontiguousarray(frame[:height, :width]).tobytes())
+        process.stdin.close()
+        error = process.stderr.read().decode(errors='replace')
+    finally:
+        reader.close()
+        returnCode = process.wait()
+    if returnCode != 0:
+        raise RuntimeError(f"ffmpeg failed ({returnCode}): {error}")
+    return videoPath
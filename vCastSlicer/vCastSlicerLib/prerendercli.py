@@ -0,0 +1,105 @@
+import argparse
+import os
+import sys
+import time
+
+#
+# Command-line pre-rendering of turntables and fly-throughs, for playback on the boards.
+# Loads a scene in a Slicer without main window, computes the camera poses and renders them
+# offscreen in parallel: the poses are split between --workers Slicer processes started
+# with this same script (--chunk), which write their frames to the output directory. The
+# result is a frame sequence with an index (see vCastSlicerLib.prerender) and, if ffmpeg is
+# installed, an optional MP4 video. The script lives in vCastSlicerLib so that Slicer doesn't
+# load it as a module at startup.
+#
+#   Slicer --no-splash --no-main-window --python-script vCastSlicerLib/prerendercli.py scene.mrb
+#       --output turntable [--poses turntable|path] [--path Trajectory] [--count 360]
+#       [--size 1280x720] [--workers 4] [--frame-rate 30] [--video turntable.mp4]
+#
+# On Linux servers without a display, run it under xvfb-run.
+#
+
+# Directory of the module, for vCastSlicer and vCastSlicerLib
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from vCastSlicerLib.prerender import (chunkRanges, mergeIndex, readPoses, renderChunk, runChunks, writePoses,
+                                      writeVideo)
+
+
+def parseArguments(argv):
+    parser = argparse.ArgumentParser(description="Pre-render camera sequences of a Slicer scene.")
+    parser.add_argument('scene', help="Scene to load (.mrb or .mrml)")
+    parser.add_argument('--output', required=True, help="Directory of the frame sequence")
+    parser.add_argument('--poses', choices=('turntable', 'path'), default='turntable')
+    parser.add_argument('--path', help="Markups node whose points the camera flies along (--poses path)")
+    parser.add_argument('--look-ahead', type=float, default=None, help="Distance to the focal point along the path (mm)")
+    parser.add_argument('--elevation', type=float, default=15.0, help="Angle of the turntable cameras (degrees)")
+    parser.add_argument('--count', type=int, default=360, help="Number of frames")
+    parser.add_argument('--size', default='1280x720', help="Frame size, WIDTHxHEIGHT")
+    parser.add_argument('--workers', type=int, default=max((os.cpu_count() or 2)//2, 1),
+                        help="Slicer processes rendering in parallel")
+    parser.add_argument('--frame-rate', type=float, default=30)
+    parser.add_argument('--video', help="Also encode the sequence to this MP4 file (needs ffmpeg)")
+    # Internal: render frames START to STOP-1 of the poses in --poses-file
+    parser.add_argument('--chunk', type=int, nargs=2, metavar=('START', 'STOP'), help=argparse.SUPPRESS)
+    parser.add_argument('--poses-file', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    args.width, args.height = (int(n) for n in args.size.lower().split('x'))
+    return args
+
+
+def workerCommand(args, posesFile):
+    """
+    Function to get the command of the Slicer process rendering a range of frames.
+    """
+    import slicer
+    launcher = getattr(slicer.app, 'launcherExecutableFilePath', '') or slicer.app.applicationFilePath()
+    return lambda start, stop: [launcher, '--no-splash', '--no-main-window', '--python-script',
+                                os.path.abspath(__file__), args.scene, '--output', args.output, '--size', args.size,
+                                '--poses-file', posesFile, '--chunk', str(start), str(stop)]
+
+
+def main(argv):
+    import slicer
+    from vCastSlicer import vCastSlicerLogic
+    args = parseArguments(argv)
+    start = time.perf_counter()
+    slicer.util.loadScene(args.scene)
+    logic = vCastSlicerLogic()
+    viewWidget = logic.createOffscreenView(args.width, args.height)
+    if args.chunk:
+        renderChunk(lambda pose: logic.renderPose(viewWidget, pose), readPoses(args.poses_file), *args.chunk,
+                    args.output)
+        return 0
+    if args.poses == 'path':
+        if not args.path:
+            print("--poses path needs --path", file=sys.stderr)
+            return 2
+        poses = logic.pathForMarkups(slicer.util.getNode(args.path), args.count, args.look_ahead)
+    else:
+        poses = logic.turntableForView(viewWidget, args.count, args.elevation)
+    posesFile = writePoses(args.output, poses)
+    ranges = chunkRanges(len(poses), args.workers)
+    runChunks(workerCommand(args, posesFile), ranges, args.workers)
+    index = mergeIndex(args.output, poses, args.frame_rate,
+                       {'scene': os.path.abspath(args.scene), 'poses': args.poses, 'workers': len(ranges)})
+    seconds = time.perf_counter() - start
+    print(f"{index['frameCount']} frames rendered in {seconds:.1f} s ({index['frameCount']/seconds:.1f} frames/s)"
+          f" by {len(ranges)} workers to {args.output}")
+    if args.video:
+        writeVideo(args.output, args.video, args.frame_rate)
+        print(f"Video written to {args.video}")
+    return 0
+
+
+if __name__ == '__main__':
+    import slicer
+    try:
+        exitCode = main(sys.argv[1:])
+    except SystemExit as e:
+        # From argparse: usage errors and --help
+        exitCode = e.code
+    except Exception:
+        import traceback
+        traceback.print_exc()
+        exitCode = 1
+    slicer.util.exit(exitCode)
@@ -0,0 +1,176 @@
+import os
+import subprocess
+import sys
+import time
+
+#
+# Supervisor of the vCastSender child process.
+# The supervisor starts the sender without a shell, reuses the running instance instead
+# of starting a duplicate, restarts it with exponential backoff when it crashes and records
+# the time between the launch and the moment the sender is ready. poll() never blocks, so
+# it can be driven by a Qt timer on the main thread.
+#
+
+# Supervisor states
+STOPPED = 'stopped'
+STARTING = 'starting'
+READY = 'ready'
+RESTARTING = 'restarting'
+FAILED = 'failed'
+
+
+def hasVisibleWindow(pid):
+    """
+    Function to know if a process shows a top-level window (Windows only).
+    """
+    import ctypes
+    from ctypes import wintypes
+    user32 = ctypes.windll.user32
+    found = []
+
+    @ctypes.WINFUNCTYPE(wintypes.BOOL, wintypes.HWND, wintypes.LPARAM)
+    def callback(hwnd, lParam):
+        windowPid = wintypes.DWORD()
+        user32.GetWindowThreadProcessId(hwnd, ctypes.byref(windowPid))
+        if windowPid.value == pid and user32.IsWindowVisible(hwnd):
+            found.append(hwnd)
+            return False
+        return True
+
+    user32.EnumWindows(callback, 0)
+    return bool(found)
+
+
+def defaultReadyProbe(process):
+    """
+    The sender is ready once its window is shown. On other platforms there is no
+    window to look for, so a running process is considered ready.
+    """
+    if sys.platform == 'win32':
+        return hasVisibleWindow(process.pid)
+    return True
+
+
+class ProcessSupervisor:
+    """
+    Owns one child process started from command (a list of arguments, no shell).
+    """
+
+    def __init__(self, command, readyProbe=defaultReadyProbe, maxRestarts=5, backoff=1.0,
+                 maxBackoff=30.0, stableTime=60.0, clock=time.monotonic):
+        self.command = list(command)
+        self.readyProbe = readyProbe
+        # Consecutive crashes tolerated before giving up
+        self.maxRestarts = maxRestarts
+        # Seconds before the first restart, doubled after each crash up to maxBackoff
+        self.backoff = backoff
+        self.maxBackoff = maxBackoff
+        # A process that stays ready this long resets the crash counter
+        self.stableTime = stableTime
+        self.clock = clock
+        self.state = STOPPED
+        self.restarts = 0
+        self.launchLatencies = []
+        self.lastExitCode = None
+        self._process = None
+        self._launchTime = None
+        self._readyTime = None
+        self._crashes = 0
+        self._restartAt = None
+
+    @property
+    def pid(self):
+        return self._process.pid if self._process is not None else None
+
+    @property
+    def isRunning(self):
+        return self._process is not None and self._process.poll() is None
+
+    @property
+    def lastLaunchLatency(self):
+        return self.launchLatencies[-1] if self.launchLatencies else None
+
+    def setCommand(self, command):
+        """
+        Function to change the command used by the next launch (e.g. a new vCastSender path).
+        """
+        self.command = list(command)
+
+    def start(self):
+        """
+        Function to start the process, or reuse it if it is already running.
+        Returns 'reused' or 'started'. Raises OSError if the executable can't be started.
+        """
+        if self.isRunning:
+            return 'reused'
+        self._crashes = 0
+        self._launch()
+        return 'started'
+
+    def stop(self, timeout=5.0):
+        """
+        Function to terminate the process (killed if it doesn't exit within timeout).
+        """
+        self.state = STOPPED
+        self._restartAt = None
+        process, self._process = self._process, None
+        if process is None or process.poll() is not None:
+            return
+        process.terminate()
+        try:
+            process.wait(timeout)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+
+    def poll(self):
+        """
+        Function to update the state of the supervisor. Must be called periodically.
+        """
+        now = self.clock()
+        if self.state == RESTARTING:
+            if now >= self._restartAt:
+                self.restarts += 1
+                try:
+                    self._launch()
+                except OSError:
+                    self._scheduleRestart(now)
+            return self.state
+        if self.state not in (STARTING, READY):
+            return self.state
+        exitCode = self._process.poll()
+        if exitCode is not None:
+            self.lastExitCode = exitCode
+            self._process = None
+            if exitCode == 0:
+                # Closed by the user: nothing to restart
+                self.state = STOPPED
+            else:
+                self._scheduleRestart(now)
+            return self.state
+        if self.state == STARTING and self.readyProbe(self._process):
+            self.state = READY
+            self._readyTime = now
+            self.launchLatencies.append(now - self._launchTime)
+        elif self.state == READY and self._crashes and now - self._readyTime >= self.stableTime:
+            self._crashes = 0
+        return self.state
+
+    def _launch(self):
+        kwargs = {}
+        if sys.platform == 'win32':
+            # Don't open a console window next to the sender
+            kwargs['creationflags'] = subprocess.CREATE_NO_WINDOW
+        self._process = subprocess.Popen(self.command, stdin=subprocess.DEVNULL,
+                                         cwd=os.path.dirname(self.command[0]) or None, **kwargs)
+        self._launchTime = self.clock()
+        self._restartAt = None
+        self.state = STARTING
+
+    def _scheduleRestart(self, now):
+        self._crashes += 1
+        if self._crashes > self.maxRestarts:
+            self.state = FAILED
+            return
+        self.state = RESTARTING
+        self._restartAt = now + min(self.backoff*2**(self._crashes - 1), self.maxBackoff)
@@ -0,0 +1,236 @@
+import collections
+import math
+import threading
+import time
+
+#
+# Adaptive resolution, quality and frame rate of every casting device.
+# Each device gets a RateController walking a ladder of levels (scale, JPEG quality, frame
+# rate), from the configured ceilings down to the floors. The controller watches what the
+# device tells about its link:
+#   - acknowledgements: delivered throughput and round-trip time (queueing delay above the
+#     minimum RTT means the link is saturated),
+#   - dropped frames: the device can't keep up (the only signal of viewers that don't ack).
+# On overuse it steps down at once to the level the measured throughput can carry; it only
+# probes the next level up after the link stayed clean for a while. A level that failed is
+# only retried after a wait doubling with each failure, so the controller doesn't oscillate
+# around the capacity; the wait before new levels halves after each probe that succeeded,
+# so it climbs quickly when the link gets faster.
+#
+
+# Notches of each knob, from best to cheapest (filtered by the limits)
+SCALES = (1.0, 0.75, 0.5, 0.375, 0.25)
+QUALITIES = (90, 75, 60, 45, 30)
+FRAME_RATES = (60, 30, 24, 15, 10, 5)
+
+
+class RateLimits:
+    """
+    Floors and ceilings of the adaptation.
+    """
+
+    def __init__(self, minScale=0.25, maxScale=1.0, minQuality=30, maxQuality=90, minFrameRate=5, maxFrameRate=30):
+        self.minScale = minScale
+        self.maxScale = maxScale
+        self.minQuality = minQuality
+        self.maxQuality = maxQuality
+        self.minFrameRate = minFrameRate
+        self.maxFrameRate = maxFrameRate
+
+
+class Level:
+
+    def __init__(self, scale, quality, frameRate):
+        self.scale = scale
+        self.quality = quality
+        self.frameRate = frameRate
+
+    @property
+    def cost(self):
+        """
+        Relative bytes per second of the level (1.0 for a full resolution frame at quality 100, 1 fps).
+        """
+        return self.scale**2*qualityFactor(self.quality)*self.frameRate
+
+    def __repr__(self):
+        return f'Level({self.scale}, {self.quality}, {self.frameRate})'
+
+
+def qualityFactor(quality):
+    """
+    Approximate size of a JPEG frame at quality, relative to quality 100.
+    """
+    return 0.2 + 0.8*(quality/100)**2
+
+
+def _notches(values, low, high):
+    inside = [value for value in values if low <= value <= high]
+    # The limits themselves are always notches
+    return sorted(set(inside) | {low, high}, reverse=True)
+
+
+def buildLadder(limits):
+    """
+    Function to list the levels from the best to the cheapest. Each step lowers one knob by
+    one notch, quality first, then frame rate, then resolution, in turn.
+    """
+    notches = {
+        'quality': _notches(QUALITIES, limits.minQuality, limits.maxQuality),
+        'frameRate': _notches(FRAME_RATES, limits.minFrameRate, limits.maxFrameRate),
+        'scale': _notches(SCALES, limits.minScale, limits.maxScale),
+    }
+    position = {knob: 0 for knob in notches}
+    ladder = [Level(notches['scale'][0], notches['quality'][0], notches['frameRate'][0])]
+    while True:
+        stepped = False
+        for knob in ('quality', 'frameRate', 'scale'):
+            if position[knob] + 1 < len(notches[knob]):
+                position[knob] += 1
+                ladder.append(Level(notches['scale'][position['scale']], notches['quality'][position['quality']],
+                                    notches['frameRate'][position['frameRate']]))
+                stepped = True
+        if not stepped:
+            return ladder
+
+
+class RateController:
+    """
+    Chooses the level of one device from its acknowledgements and drops.
+    All the methods can be called from any thread; now defaults to clock().
+    """
+
+    def __init__(self, limits=None, window=1.0, delayThreshold=0.08, downHold=0.5, upHold=2.0, minUpHold=0.5,
+                 maxUpHold=16.0, clock=time.monotonic):
+        self.ladder = buildLadder(limits or RateLimits())
+        self.index = 0
+        # Seconds of acknowledgements used for the throughput
+        self.window = window
+        # Queueing delay (RTT above the minimum) meaning that the link is saturated
+        self.delayThreshold = delayThreshold
+        # Seconds between two steps down, and before probing a step up (adapted between
+        # minUpHold and maxUpHold)
+        self.downHold = downHold
+        self.upHold = upHold
+        self.minUpHold = minUpHold
+        self.maxUpHold = maxUpHold
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._holdUp = upHold
+        self._lastChange = -math.inf
+        self._lastProbe = None
+        # {level index: seconds to wait before retrying it} of the levels that failed
+        self._retryHolds = {}
+        self._lastFrame = -math.inf
+        self._acks = collections.deque()
+        self._dropsSinceCheck = 0
+        self._minRtt = None
+        self._smoothedRtt = None
+        # Bytes of a frame at cost 1 (see Level.cost), learned from the sent frames
+        self._bytesPerCost = None
+        # (time, level index) of every change, for reporting
+        self.changes = []
+
+    @property
+    def level(self):
+        return self.ladder[self.index]
+
+    def wantsFrame(self, now=None):
+        """
+        Function to know if a new frame must be sent to the device (frame rate of the level).
+        """
+        now = self._clock() if now is None else now
+        with self._lock:
+            self._update(now)
+            # Some tolerance so that a capture slightly early is not skipped
+            if now - self._lastFrame < 0.9/self.level.frameRate:
+                return False
+            self._lastFrame = now
+            return True
+
+    def onFrameSent(self, size, now=None):
+        now = self._clock() if now is None else now
+        with self._lock:
+            level = self.level
+            bytesPerCost = size/(level.scale**2*qualityFactor(level.quality))
+            self._bytesPerCost = bytesPerCost if self._bytesPerCost is None else (
+                0.9*self._bytesPerCost + 0.1*bytesPerCost)
+
+    def onAck(self, size, rtt, now=None):
+        """
+        Function to record that the device displayed a frame of size bytes, rtt seconds after it was sent.
+        """
+        now = self._clock() if now is None else now
+        with self._lock:
+            self._acks.append((now, size))
+            self._minRtt = rtt if self._minRtt is None else min(self._minRtt, rtt)
+            # Frames sent before the last change only tell about the queue of the previous level
+            if now - rtt >= self._lastChange:
+                self._smoothedRtt = rtt if self._smoothedRtt is None else 0.875*self._smoothedRtt + 0.125*rtt
+            self._update(now)
+
+    def onDrop(self, now=None):
+        now = self._clock() if now is None else now
+        with self._lock:
+            self._dropsSinceCheck += 1
+            self._update(now)
+
+    def throughput(self, now=None):
+        """
+        Function to get the delivered bytes per second (None without acknowledgements).
+        """
+        now = self._clock() if now is None else now
+        with self._lock:
+            return self._throughput(now)
+
+    def _throughput(self, now):
+        while self._acks and self._acks[0][0] < now - self.window:
+            self._acks.popleft()
+        if len(self._acks) < 2:
+            return None
+        return sum(size for _, size in self._acks)/self.window
+
+    def _predictedRate(self, level):
+        if self._bytesPerCost is None:
+            return None
+        return self._bytesPerCost*level.cost
+
+    def _update(self, now):
+        queueDelay = self._smoothedRtt - self._minRtt if self._smoothedRtt is not None else 0.0
+        overuse = self._dropsSinceCheck > 0 or queueDelay > self.delayThreshold
+        self._dropsSinceCheck = 0
+        if overuse:
+            if now - self._lastChange < self.downHold or self.index == len(self.ladder) - 1:
+                return
+            # The current level failed: wait longer before retrying it
+            self._retryHolds[self.index] = min(2*self._retryHolds.get(self.index, self.upHold/2), self.maxUpHold)
+            self._holdUp = self.upHold
+            self._lastProbe = None
+            target = self.index + 1
+            throughput = self._throughput(now)
+            if throughput is not None and self._bytesPerCost is not None:
+                # Straight to the best level the measured throughput carries, with some headroom
+                while target < len(self.ladder) - 1 and self._predictedRate(self.ladder[target]) > 0.85*throughput:
+                    target += 1
+            self._setIndex(target, now)
+            # The queue built by the previous level has to drain before the RTT means something again
+            self._smoothedRtt = self._minRtt
+        elif self.index > 0 and queueDelay < self.delayThreshold/2:
+            hold = self._retryHolds.get(self.index - 1, self._holdUp)
+            if now - self._lastChange < hold:
+                return
+            if self._lastProbe is not None:
+                # The last probe succeeded: the link may have more room. The levels up to this
+                # one are fine again and the failures of the others matter less.
+                self._holdUp = max(self._holdUp/2, self.minUpHold)
+                for index in list(self._retryHolds):
+                    if index >= self.index:
+                        del self._retryHolds[index]
+                    elif index != self.index - 1:
+                        self._retryHolds[index] = max(self._retryHolds[index]/2, self.minUpHold)
+            self._setIndex(self.index - 1, now)
+            self._lastProbe = now
+
+    def _setIndex(self, index, now):
+        self.index = index
+        self._lastChange = now
+        self.changes.append((now, index))
@@ -0,0 +1,258 @@
+import bisect
+import os
+import struct
+import time
+from vCastSlicerLib.statesync import StateSyncEncoder, StateSyncReceiver
+
+#
+# Recording of review sessions as scene-state events instead of pixels.
+# The recorder appends the state packets of vCastSlicerLib.statesync (cameras, slice offsets,
+# display visibility/opacity, linear transforms) to a binary log, with a keyframe (snapshot
+# of the whole state) every keyframeInterval seconds of activity. The time and offset of
+# every keyframe are appended to an index file next to the log, so seeking to any time only
+# applies one keyframe and the few seconds of deltas after it. Both files are append-only:
+# after a crash the log is read up to its last complete record and the index is completed
+# by scanning the log from the last indexed keyframe.
+#
+#   log:    header (magic 'VCRC', version, start time), then records:
+#           kind (u8), time since the start (d), length (u32), state packet
+#   index:  one (time (d), offset (u64)) entry per keyframe
+#
+# Replay applies the packets to the scene, so the views being cast simply change as they did.
+#
+
+MAGIC = b'VCRC'
+VERSION = 1
+HEADER = struct.Struct('<4sBd')
+RECORD = struct.Struct('<BdI')
+INDEX_ENTRY = struct.Struct('<dQ')
+INDEX_SUFFIX = '.idx'
+DELTA, KEYFRAME = range(2)
+# Seconds between keyframes (while the scene changes)
+KEYFRAME_INTERVAL = 10.0
+
+
+def snapshotOf(receiver):
+    """
+    Function to get a snapshot packet with the state of a StateSyncReceiver.
+    """
+    encoder = StateSyncEncoder(tolerance=0.0)
+    for name, camera in receiver.cameras.items():
+        encoder.setCamera(name, camera['position'], camera['focalPoint'], camera['viewUp'], camera['viewAngle'])
+    for name, offset in receiver.sliceOffsets.items():
+        encoder.setSliceOffset(name, offset)
+    for name, display in receiver.displays.items():
+        encoder.setDisplay(name, display['visible'], display['opacity'])
+    for name, matrix in receiver.transforms.items():
+        encoder.setTransform(name, matrix)
+    return encoder.snapshot()
+
+
+class SessionRecorder:
+    """
+    Appends the changes of a StateSyncEncoder to a session log. The encoder setters are called
+    by the MRML observers, record() at most once per display frame (e.g. by a CaptureScheduler).
+    """
+
+    def __init__(self, path, keyframeInterval=KEYFRAME_INTERVAL, encoder=None, clock=time.monotonic):
+        self.path = path
+        self.keyframeInterval = keyframeInterval
+        self.encoder = encoder if encoder is not None else StateSyncEncoder()
+        self._clock = clock
+        self._file = open(path, 'wb')
+        self._file.write(HEADER.pack(MAGIC, VERSION, time.time()))
+        self._index = open(path + INDEX_SUFFIX, 'wb')
+        self._start = clock()
+        self._lastKeyframe = None
+        self.deltaCount = 0
+        self.keyframeCount = 0
+        self.bytesWritten = HEADER.size
+
+    @property
+    def duration(self):
+        return self._clock() - self._start
+
+    def record(self):
+        """
+        Function to append the changes since the last call, as a keyframe if one is due.
+        Returns the number of bytes written.
+        """
+        now = self._clock() - self._start
+        packet = self.encoder.flush()
+        if packet is None:
+            return 0
+        if self._lastKeyframe is not None and now - self._lastKeyframe < self.keyframeInterval:
+            self.deltaCount += 1
+            return self._write(DELTA, now, packet)
+        # The keyframe holds the changes too: the delta is not needed
+        self._index.write(INDEX_ENTRY.pack(now, self._file.tell()))
+        self._index.flush()
+        self.bytesWritten += INDEX_ENTRY.size
+        self._lastKeyframe = now
+        self.keyframeCount += 1
+        return self._write(KEYFRAME, now, self.encoder.snapshot())
+
+    def _write(self, kind, now, packet):
+        self._file.write(RECORD.pack(kind, now, len(packet)) + packet)
+        self._file.flush()
+        self.bytesWritten += RECORD.size + len(packet)
+        return RECORD.size + len(packet)
+
+    def close(self):
+        if not self._file.closed:
+            self.record()
+            self._file.close()
+            self._index.close()
+
+
+class SessionReader:
+    """
+    Reads a session log. stateAt(t) rebuilds the state at any time from the keyframe before it.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+        header = self._file.read(HEADER.size)
+        if len(header) < HEADER.size or HEADER.unpack(header)[:2] != (MAGIC, VERSION):
+            self._file.close()
+            raise ValueError(f"{path} is not a vCast session recording")
+        self.startTime = HEADER.unpack(header)[2]
+        size = os.fstat(self._file.fileno()).st_size
+        self.keyframes = []
+        try:
+            with open(path + INDEX_SUFFIX, 'rb') as indexFile:
+                entries = indexFile.read()
+            for n in range(len(entries)//INDEX_ENTRY.size):
+                entry = INDEX_ENTRY.unpack_from(entries, n*INDEX_ENTRY.size)
+                if entry[1] + RECORD.size > size:
+                    break
+                self.keyframes.append(entry)
+        except OSError:
+            pass
+        # Records after the last indexed keyframe: the end of the log, and keyframes written
+        # after the index was (interrupted recording)
+        self.duration = 0.0
+        self.end = self.keyframes[-1][1] if self.keyframes else HEADER.size
+        for offset, kind, timestamp, packet in self.records(self.end, size):
+            if kind == KEYFRAME and (not self.keyframes or offset > self.keyframes[-1][1]):
+                self.keyframes.append((timestamp, offset))
+            self.duration = timestamp
+            self.end = offset + RECORD.size + len(packet)
+        self._times = [timestamp for timestamp, _ in self.keyframes]
+
+    def records(self, offset=HEADER.size, end=None):
+        """
+        Function to iterate over the complete records from offset, as (offset, kind, time, packet).
+        """
+        end = self.end if end is None else end
+        while offset + RECORD.size <= end:
+            self._file.seek(offset)
+            kind, timestamp, length = RECORD.unpack(self._file.read(RECORD.size))
+            if offset + RECORD.size + length > end:
+                return
+            packet = self._file.read(length)
+            yield offset, kind, timestamp, packet
+            offset += RECORD.size + length
+
+    def stateAt(self, position):
+        """
+        Function to rebuild the state at position (seconds since the start). Returns
+        (StateSyncReceiver, offset of the first record after position).
+        """
+        receiver = StateSyncReceiver()
+        n = bisect.bisect_right(self._times, position) - 1
+        offset = self.keyframes[n][1] if n >= 0 else HEADER.size
+        for offset, kind, timestamp, packet in self.records(offset):
+            if timestamp > position:
+                return receiver, offset
+            receiver.apply(packet)
+        return receiver, self.end
+
+    def snapshotAt(self, position):
+        """
+        Function to get the state at position as a snapshot packet, and the offset of the next record.
+        """
+        receiver, offset = self.stateAt(position)
+        return snapshotOf(receiver), offset
+
+    def close(self):
+        self._file.close()
+
+
+class SessionPlayer:
+    """
+    Replays a session log: poll(), called by a timer on the main thread, hands the packets
+    due at the current position to apply(packet). Never blocks, and doesn't depend on the
+    timer period (late packets are applied together).
+    """
+
+    def __init__(self, reader, apply, speed=1.0, clock=time.monotonic):
+        self.reader = reader
+        self._apply = apply
+        self._speed = speed
+        self._clock = clock
+        self._anchorPosition = 0.0
+        self._anchorTime = clock()
+        self._records = None
+        self._next = None
+        self.playing = False
+
+    @property
+    def position(self):
+        if not self.playing:
+            return self._anchorPosition
+        return min(self._anchorPosition + (self._clock() - self._anchorTime)*self._speed, self.reader.duration)
+
+    @property
+    def speed(self):
+        return self._speed
+
+    @speed.setter
+    def speed(self, value):
+        self._anchorPosition = self.position
+        self._anchorTime = self._clock()
+        self._speed = value
+
+    @property
+    def finished(self):
+        return self._next is None and self._records is not None
+
+    def seek(self, position):
+        """
+        Function to jump to position: applies the state at that time as a snapshot.
+        """
+        position = max(0.0, min(position, self.reader.duration))
+        packet, offset = self.reader.snapshotAt(position)
+        self._apply(packet)
+        self._records = self.reader.records(offset)
+        self._next = next(self._records, None)
+        self._anchorPosition = position
+        self._anchorTime = self._clock()
+
+    def play(self, position=None):
+        if position is not None or self._records is None:
+            self.seek(self._anchorPosition if position is None else position)
+        self._anchorTime = self._clock()
+        self.playing = True
+
+    def pause(self):
+        self._anchorPosition = self.position
+        self.playing = False
+
+    def poll(self):
+        """
+        Function to apply the packets due. Returns the number of packets applied.
+        """
+        if not self.playing:
+            return 0
+        position = self.position
+        applied = 0
+        while self._next is not None and self._next[2] <= position:
+            self._apply(self._next[3])
+            applied += 1
+            self._next = next(self._records, None)
+        if self._next is None:
+            self._anchorPosition = self.reader.duration
+            self.playing = False
+        return applied
@@ -0,0 +1,90 @@
+import time
+
+#
+# Damage-driven capture scheduling.
+# Instead of grabbing the views at a fixed rate, a capture is requested whenever something
+# that can change the pixels happens (MRML node modified, camera moved, render finished).
+# Requests arriving before the next display frame are coalesced into a single capture, and
+# when nothing changes no capture is done at all.
+#
+
+
+class CaptureScheduler:
+    """
+    Coalesces capture requests into at most one capture per display frame.
+    """
+
+    def __init__(self, capture, schedule, frameRate=60, wantsFrames=None, clock=time.monotonic):
+        """
+        capture: callable doing the actual capture.
+        schedule: callable (delaySeconds, callback) running callback later on the main thread,
+          e.g. lambda delay, callback: qt.QTimer.singleShot(int(1000*delay), callback)
+        wantsFrames: callable telling if anybody consumes frames right now (defaults to always).
+        """
+        self._capture = capture
+        self._schedule = schedule
+        self.frameRate = frameRate
+        self._wantsFrames = wantsFrames if wantsFrames is not None else (lambda: True)
+        self._clock = clock
+        self._lastCapture = None
+        self._pending = False
+        # Incremented by stop() so that callbacks scheduled before are ignored
+        self._generation = 0
+        # True when changes happened while nobody was consuming frames
+        self.stale = False
+        self.resetCounters()
+
+    def resetCounters(self):
+        # Capture requests received (damage events)
+        self.requested = 0
+        # Requests merged into an already scheduled capture
+        self.coalesced = 0
+        # Captures done
+        self.captured = 0
+        # Scheduled captures dropped because nobody consumes frames
+        self.skipped = 0
+
+    def counters(self):
+        return {'requested': self.requested, 'coalesced': self.coalesced,
+                'captured': self.captured, 'skipped': self.skipped}
+
+    @property
+    def isPending(self):
+        return self._pending
+
+    def requestCapture(self, *args):
+        """
+        Function to signal that the views may have changed. The arguments are ignored, so it
+        can be used directly as a VTK observer or Qt slot.
+        """
+        self.requested += 1
+        if self._pending:
+            self.coalesced += 1
+            return
+        self._pending = True
+        delay = 0.0
+        if self._lastCapture is not None:
+            # Wait for the next display frame after the last capture
+            delay = max(0.0, self._lastCapture + 1.0/self.frameRate - self._clock())
+        generation = self._generation
+        self._schedule(delay, lambda: self._onScheduled(generation))
+
+    def stop(self):
+        """
+        Function to cancel the scheduled capture, if any.
+        """
+        self._generation += 1
+        self._pending = False
+
+    def _onScheduled(self, generation):
+        if generation != self._generation:
+            return
+        self._pending = False
+        if not self._wantsFrames():
+            self.skipped += 1
+            self.stale = True
+            return
+        self.stale = False
+        self._lastCapture = self._clock()
+        self.captured += 1
+        self._capture()
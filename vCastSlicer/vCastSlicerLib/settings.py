@@ -0,0 +1,174 @@
+import contextlib
+import copy
+import json
+import os
+import re
+import tempfile
+import time
+
+#
+# Persistent settings of the vCastSlicer module (path to vCastSender, device profiles).
+# Settings are kept in a small JSON file. Reads are served from memory; writes are done
+# under a lock file (shared by all the Slicer instances) and replace the file atomically,
+# so a crash or a concurrent Apply can never leave a half-written file behind.
+#
+
+# Line where the versions before the settings store saved the vCastSender path: in the
+# vCastSlicer.py file of the module itself
+LEGACY_PATH_PATTERN = re.compile(r'self\._dir_chosen = "([^"]+)"')
+
+
+def findLegacyVCastSenderPath(scriptPaths):
+    """
+    Function to get the vCastSender path saved in the vCastSlicer.py files of older versions
+    of the module, trying the most recently modified file first. Returns None if none has one.
+    """
+    def modified(path):
+        try:
+            return os.path.getmtime(path)
+        except OSError:
+            return 0
+    for path in sorted(scriptPaths, key=modified, reverse=True):
+        try:
+            with open(path, encoding='utf-8', errors='replace') as script:
+                match = LEGACY_PATH_PATTERN.search(script.read())
+        except OSError:
+            continue
+        if match:
+            return match.group(1)
+    return None
+
+
+class SettingsLockTimeout(RuntimeError):
+    """
+    Raised when the lock of the settings file can't be acquired in time.
+    """
+
+
+class SettingsStore:
+    """
+    JSON backed key/value store with atomic writes and in-memory cached reads.
+    """
+
+    def __init__(self, path, lockTimeout=5.0, staleLockAge=30.0):
+        self.path = path
+        self.lockPath = path + '.lock'
+        # Seconds to wait for another instance to release the lock
+        self.lockTimeout = lockTimeout
+        # A lock older than this is considered left behind by a crashed instance
+        self.staleLockAge = staleLockAge
+        self._values = {}
+        self._mtime = None
+        self.reload()
+
+    def reload(self):
+        """
+        Function to read the file again. A missing or unreadable file gives empty settings.
+        """
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+            with open(self.path, encoding='utf-8') as settingsFile:
+                values = json.load(settingsFile)
+        except (OSError, ValueError):
+            mtime, values = None, {}
+        self._values = values if isinstance(values, dict) else {}
+        self._mtime = mtime
+
+    def get(self, key, default=None):
+        """
+        Function to read a value from the in-memory copy of the settings.
+        """
+        return copy.deepcopy(self._values.get(key, default))
+
+    def set(self, key, value):
+        self.update({key: value})
+
+    def update(self, values):
+        """
+        Function to change several values with a single write of the file.
+        """
+        with self._lock():
+            # Another instance may have written the file since we read it
+            self._reloadIfChanged()
+            self._values.update(copy.deepcopy(values))
+            self._write()
+
+    def remove(self, key):
+        with self._lock():
+            self._reloadIfChanged()
+            if self._values.pop(key, None) is not None:
+                self._write()
+
+    def getProfile(self, device, default=None):
+        """
+        Function to read the profile (path, resolution, frame rate...) of a device.
+        """
+        return copy.deepcopy(self._values.get('profiles', {}).get(device, default))
+
+    def setProfile(self, device, profile):
+        """
+        Function to save the whole profile of a device. Costs one write, like set().
+        """
+        with self._lock():
+            self._reloadIfChanged()
+            self._values.setdefault('profiles', {})[device] = copy.deepcopy(profile)
+            self._write()
+
+    def profiles(self):
+        return sorted(self._values.get('profiles', {}))
+
+    def _reloadIfChanged(self):
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except OSError:
+            mtime = None
+        if mtime != self._mtime:
+            self.reload()
+
+    def _write(self):
+        """
+        Function to write the settings to a temporary file and move it over the old one.
+        """
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        fh, tmpPath = tempfile.mkstemp(prefix='.vCastSlicer', suffix='.tmp', dir=directory)
+        try:
+            with os.fdopen(fh, 'w', encoding='utf-8') as tmpFile:
+                json.dump(self._values, tmpFile, indent=2, sort_keys=True)
+                tmpFile.flush()
+                os.fsync(tmpFile.fileno())
+            os.replace(tmpPath, self.path)
+        except BaseException:
+            with contextlib.suppress(OSError):
+                os.remove(tmpPath)
+            raise
+        self._mtime = os.stat(self.path).st_mtime_ns
+
+    @contextlib.contextmanager
+    def _lock(self):
+        """
+        Lock file shared by all the processes using the same settings file.
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(self.lockPath)), exist_ok=True)
+        deadline = time.monotonic() + self.lockTimeout
+        while True:
+            try:
+                fd = os.open(self.lockPath, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                break
+            except FileExistsError:
+                self._removeStaleLock()
+                if time.monotonic() > deadline:
+                    raise SettingsLockTimeout(f"Could not lock {self.path}")
+                time.sleep(0.01)
+        try:
+            os.write(fd, str(os.getpid()).encode())
+            os.close(fd)
+            yield
+        finally:
+            with contextlib.suppress(OSError):
+                os.remove(self.lockPath)
+
+    def _removeStaleLock(self):
+        with contextlib.suppress(OSError):
+            if time.time() - os.stat(self.lockPath).st_mtime > self.staleLockAge:
+                os.remove(self.lockPath)
@@ -0,0 +1,318 @@
+import math
+import socket
+import socketserver
+import struct
+import threading
+import time
+from vCastSlicerLib.fanout import FanoutClient
+from vCastSlicerLib.network import LOCAL_HOST
+
+#
+# Scene-state synchronization for remote renderers (VR, HoloLens).
+# Instead of pixels, the receiver gets the camera poses, slice offsets, visibility/opacity of
+# the displayable nodes and the linear transforms, as compact binary deltas: only what changed
+# since the last packet is sent. A client joining (or falling behind) gets a full snapshot.
+#
+# Packet (little endian): header followed by `count` messages, each starting with its type.
+#   header:    magic 'VCSS', version, flags, sequence, timestamp, count (u32)
+#   DEFINE:    id (u32), name length (u8), utf-8 name   -> compact id of an MRML node ID
+#   CAMERA:    id, position (3f), focal point (3f), view up (3f), view angle (f)
+#   SLICE:     id, offset (f)
+#   DISPLAY:   id, visibility (u8), opacity (f)
+#   TRANSFORM: id, 4x4 matrix to parent, row major (16f)
+# Packets are sent over TCP prefixed by their length (u32).
+# Version 1 packets (u16 ids and count, e.g. in older session recordings) are still read.
+#
+
+MAGIC = b'VCSS'
+VERSION = 2
+FLAG_SNAPSHOT = 1
+LENGTH = struct.Struct('<I')
+# Magic and version, common to all the versions of the header
+PREFIX = struct.Struct('<4sB')
+
+DEFINE, CAMERA, SLICE, DISPLAY, TRANSFORM = range(5)
+
+
+def packetFormats(integerFormat):
+    """
+    Function to get the (header, DEFINE header, messages) structures for the struct format of
+    the node ids and message count of a version.
+    """
+    return (struct.Struct(f'<4sBBId{integerFormat}'), struct.Struct(f'<B{integerFormat}B'), {
+        CAMERA: struct.Struct(f'<B{integerFormat}10f'),
+        SLICE: struct.Struct(f'<B{integerFormat}f'),
+        DISPLAY: struct.Struct(f'<B{integerFormat}Bf'),
+        TRANSFORM: struct.Struct(f'<B{integerFormat}16f'),
+    })
+
+
+FORMATS = {1: packetFormats('H'), 2: packetFormats('I')}
+HEADER, DEFINE_HEADER, MESSAGES = FORMATS[VERSION]
+
+
+class StateSyncEncoder:
+    """
+    Keeps the last state sent of every node and produces delta and snapshot packets.
+    Setters are called from the main thread (MRML observers); snapshot() may be called from
+    the server threads, so the state is protected by a lock.
+    """
+
+    def __init__(self, tolerance=1e-4):
+        # Changes smaller than this are not sent
+        self.tolerance = tolerance
+        # Compact ids of the node names, and names already defined in the deltas
+        self._ids = {}
+        self._announced = set()
+        self._state = {}
+        self._dirty = set()
+        self._sequence = 0
+        self._lock = threading.Lock()
+
+    def setCamera(self, name, position, focalPoint, viewUp, viewAngle):
+        self._set(CAMERA, name, (*position, *focalPoint, *viewUp, viewAngle))
+
+    def setSliceOffset(self, name, offset):
+        self._set(SLICE, name, (offset,))
+
+    def setDisplay(self, name, visible, opacity):
+        self._set(DISPLAY, name, (int(bool(visible)), opacity))
+
+    def setTransform(self, name, matrix):
+        """
+        matrix: 16 values, row major.
+        """
+        self._set(TRANSFORM, name, tuple(matrix))
+
+    @property
+    def hasChanges(self):
+        return bool(self._dirty)
+
+    def _set(self, kind, name, values):
+        key = (kind, name)
+        with self._lock:
+            previous = self._state.get(key)
+            if previous is not None and all(math.isclose(a, b, abs_tol=self.tolerance) for a, b in zip(previous, values)):
+                return
+            self._state[key] = values
+            self._dirty.add(key)
+
+    def _nodeId(self, name):
+        if name not in self._ids:
+            self._ids[name] = len(self._ids)
+        return self._ids[name]
+
+    def _define(self, name):
+        encoded = name.encode('utf-8')[:255]
+        return DEFINE_HEADER.pack(DEFINE, self._nodeId(name), len(encoded)) + encoded
+
+    def flush(self):
+        """
+        Function to get the packet with the changes since the last flush (None if nothing changed).
+        """
+        with self._lock:
+            if not self._dirty:
+                return None
+            messages = []
+            for kind, name in sorted(self._dirty):
+                # Names are defined in the first delta that uses them
+                if name not in self._announced:
+                    messages.append(self._define(name))
+                    self._announced.add(name)
+                messages.append(MESSAGES[kind].pack(kind, self._nodeId(name), *self._state[(kind, name)]))
+            self._dirty.clear()
+            self._sequence += 1
+            return HEADER.pack(MAGIC, VERSION, 0, self._sequence, time.time(), len(messages)) + b''.join(messages)
+
+    def snapshot(self):
+        """
+        Function to get a packet with the whole state (for clients joining the session).
+        """
+        with self._lock:
+            messages = [self._define(name) for name in sorted({name for _, name in self._state})]
+            for kind, name in sorted(self._state):
+                messages.append(MESSAGES[kind].pack(kind, self._nodeId(name), *self._state[(kind, name)]))
+            return HEADER.pack(MAGIC, VERSION, FLAG_SNAPSHOT, self._sequence, time.time(), len(messages)) + b''.join(messages)
+
+
+class StateSyncReceiver:
+    """
+    Reference receiver: applies the packets to a plain dictionary state, like a remote
+    renderer would apply them to its own scene. listener(kind, name, values), if given, is
+    called for every state message applied.
+    """
+
+    def __init__(self, listener=None):
+        self.listener = listener
+        self.cameras = {}
+        self.sliceOffsets = {}
+        self.displays = {}
+        self.transforms = {}
+        self.sequence = None
+        self.latencies = []
+        self._names = {}
+
+    def apply(self, packet):
+        """
+        Function to apply a packet. Returns the number of state messages applied.
+        """
+        magic, version = PREFIX.unpack_from(packet, 0)
+        if magic != MAGIC or version not in FORMATS:
+            raise ValueError("Not a vCast state packet")
+        header, defineHeader, messages = FORMATS[version]
+        _, _, flags, sequence, timestamp, count = header.unpack_from(packet, 0)
+        if flags & FLAG_SNAPSHOT:
+            self.cameras, self.sliceOffsets, self.displays, self.transforms = {}, {}, {}, {}
+        offset = header.size
+        applied = 0
+        for _ in range(count):
+            kind = packet[offset]
+            if kind == DEFINE:
+                _, nodeId, length = defineHeader.unpack_from(packet, offset)
+                offset += defineHeader.size
+                self._names[nodeId] = packet[offset:offset + length].decode('utf-8')
+                offset += length
+                continue
+            message = messages[kind]
+            _, nodeId, *values = message.unpack_from(packet, offset)
+            offset += message.size
+            name = self._names[nodeId]
+            if kind == CAMERA:
+                self.cameras[name] = {'position': values[0:3], 'focalPoint': values[3:6],
+                                      'viewUp': values[6:9], 'viewAngle': values[9]}
+            elif kind == SLICE:
+                self.sliceOffsets[name] = values[0]
+            elif kind == DISPLAY:
+                self.displays[name] = {'visible': bool(values[0]), 'opacity': values[1]}
+            elif kind == TRANSFORM:
+                self.transforms[name] = values
+            if self.listener is not None:
+                self.listener(kind, name, values)
+            applied += 1
+        self.sequence = sequence
+        self.latencies.append(time.time() - timestamp)
+        return applied
+
+
+class _StateSyncHandler(socketserver.BaseRequestHandler):
+    """
+    Sends a snapshot to the new client, then the deltas (a new snapshot if it fell behind).
+    """
+
+    def handle(self):
+        server = self.server.sync
+        client = server._addClient(f'{self.client_address[0]}:{self.client_address[1]}')
+        try:
+            self._send(server.encoder.snapshot())
+            dropped = 0
+            while server.isRunning and not client.closed:
+                item = client.get(timeout=1.0)
+                if item is None:
+                    continue
+                if client.dropped != dropped:
+                    # Deltas were lost: start again from the whole state
+                    dropped = client.dropped
+                    self._send(server.encoder.snapshot())
+                    continue
+                self._send(item[1])
+        except OSError:
+            # The client closed the connection
+            pass
+        finally:
+            server._removeClient(client)
+
+    def _send(self, packet):
+        self.request.sendall(LENGTH.pack(len(packet)) + packet)
+
+
+class StateSyncServer:
+    """
+    TCP server fanning the state packets out to the remote renderers.
+    """
+
+    def __init__(self, encoder=None, host=LOCAL_HOST, port=8091, clientQueueSize=64):
+        self.encoder = encoder if encoder is not None else StateSyncEncoder()
+        self.host = host
+        self.port = port
+        self.clientQueueSize = clientQueueSize
+        self.bytesSent = 0
+        self._clients = []
+        self._clientsLock = threading.Lock()
+        self._server = None
+        self._thread = None
+        self._running = False
+
+    @property
+    def isRunning(self):
+        return self._running
+
+    @property
+    def clientCount(self):
+        with self._clientsLock:
+            return len(self._clients)
+
+    def start(self):
+        if self._running:
+            return
+        self._server = socketserver.ThreadingTCPServer((self.host, self.port), _StateSyncHandler)
+        self._server.daemon_threads = True
+        self._server.sync = self
+        self.port = self._server.server_address[1]
+        self._running = True
+        self._thread = threading.Thread(target=self._server.serve_forever, name='vCastStateSync', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if not self._running:
+            return
+        self._running = False
+        for client in self._clientList():
+            client.close()
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join(timeout=2.0)
+        self._server = None
+        self._thread = None
+
+    def flush(self):
+        """
+        Function to send the pending changes to all the clients. Returns the packet size.
+        """
+        packet = self.encoder.flush()
+        if packet is None:
+            return 0
+        item = (None, packet, time.time())
+        for client in self._clientList():
+            client.put(item)
+            self.bytesSent += len(packet)
+        return len(packet)
+
+    def _clientList(self):
+        with self._clientsLock:
+            return list(self._clients)
+
+    def _addClient(self, name):
+        client = FanoutClient(name, 'state', self.clientQueueSize)
+        with self._clientsLock:
+            self._clients.append(client)
+        return client
+
+    def _removeClient(self, client):
+        client.close()
+        with self._clientsLock:
+            if client in self._clients:
+                self._clients.remove(client)
+
+
+def iterPackets(host, port, timeout=5.0):
+    """
+    Reference client: yields the packets sent by a StateSyncServer.
+    """
+    with socket.create_connection((host, port), timeout=timeout) as connection:
+        stream = connection.makefile('rb')
+        while True:
+            header = stream.read(LENGTH.size)
+            if len(header) < LENGTH.size:
+                return
+            (length,) = LENGTH.unpack(header)
+            yield stream.read(length)
@@ -0,0 +1,394 @@
+import json
+import socket
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy
+from vCastSlicerLib.fanout import FanoutHub, Tier
+from vCastSlicerLib.network import LOCAL_HOST, reachableHost
+from vCastSlicerLib.telemetry import Telemetry
+
+#
+# In-process streaming of the rendered Slicer views.
+# Frames are grabbed from the VTK render windows on the Qt main thread and handed
+# over to a StreamServer, which encodes and serves them as MJPEG over HTTP from
+# background threads. Any number of viewers can open http://<host>:<port>/stream.mjpg
+#
+# Viewers may acknowledge the frames they displayed with /ack?client=<id>&index=<n>, using
+# the X-Client-Id header of the stream, so that the display latency and round-trip time are
+# measured. The telemetry of the server is served as JSON on /metrics.
+# Viewers of a delta tier (see vCastSlicerLib.deltacodec) may ask for a full frame with
+# /keyframe?client=<id>, e.g. after they missed a frame.
+# With rate limits, the acknowledgements (and the dropped frames) of every viewer also drive
+# the resolution, quality and frame rate of its frames (see vCastSlicerLib.ratecontrol).
+#
+
+# Boundary used to separate the JPEG parts of the multipart stream
+BOUNDARY = "vcastframe"
+
+
+class ViewCapture:
+    """
+    Grabs the rendered content of a set of VTK render windows as one RGB NumPy frame.
+    """
+
+    def __init__(self, views):
+        """
+        views: callable returning a list of (renderWindow, (x, y)) tuples, where (x, y) is
+        the top-left position of the view in the composed frame. A callable is used so
+        that layout changes in Slicer are picked up on every capture.
+        """
+        self._views = views
+        # One vtkWindowToImageFilter per render window, created on first use
+        self._grabbers = {}
+
+    def _grabber(self, renderWindow):
+        """
+        Function to get (or create) the image filter attached to a render window.
+        """
+        import vtk
+        if renderWindow not in self._grabbers:
+            grabber = vtk.vtkWindowToImageFilter()
+            grabber.SetInput(renderWindow)
+            grabber.SetInputBufferTypeToRGB()
+            # Read the last rendered image instead of forcing a new render
+            grabber.ShouldRerenderOff()
+            grabber.ReadFrontBufferOff()
+            self._grabbers[renderWindow] = grabber
+        return self._grabbers[renderWindow]
+
+    def grabWindow(self, renderWindow):
+        """
+        Function to read the pixels of one render window as an (height, width, 3) array.
+        """
+        from vtk.util.numpy_support import vtk_to_numpy
+        grabber = self._grabber(renderWindow)
+        grabber.Modified()
+        grabber.Update()
+        image = grabber.GetOutput()
+        width, height, _ = image.GetDimensions()
+        pixels = vtk_to_numpy(image.GetPointData().GetScalars())
+        # VTK images start at the bottom-left corner
+        return numpy.flipud(pixels.reshape(height, width, -1)[:, :, :3])
+
+    def capture(self):
+        """
+        Function to compose all the views in a single frame. Returns None if there are no views.
+        """
+        views = list(self._views())
+        if not views:
+            return None
+        tiles = [(self.grabWindow(renderWindow), position) for renderWindow, position in views]
+        # Size of the canvas that holds all the views
+        height = max(y + tile.shape[0] for tile, (x, y) in tiles)
+        width = max(x + tile.shape[1] for tile, (x, y) in tiles)
+        frame = numpy.zeros((height, width, 3), dtype=numpy.uint8)
+        for tile, (x, y) in tiles:
+            frame[y:y + tile.shape[0], x:x + tile.shape[1]] = tile
+        return frame
+
+    def reset(self):
+        """
+        Function to release the image filters (e.g. when the layout changes).
+        """
+        self._grabbers = {}
+
+
+class JPEGEncoder:
+    """
+    Encodes RGB NumPy frames as JPEG using the VTK writer available in every Slicer install.
+    """
+
+    def __init__(self, quality=75):
+        self.quality = quality
+
+    def __call__(self, frame):
+        import vtk
+        from vtk.util.numpy_support import numpy_to_vtk
+        height, width, _ = frame.shape
+        image = vtk.vtkImageData()
+        image.SetDimensions(width, height, 1)
+        # VTK expects the first row at the bottom of the image
+        scalars = numpy_to_vtk(numpy.ascontiguousarray(numpy.flipud(frame)).reshape(-1, 3), deep=True)
+        image.GetPointData().SetScalars(scalars)
+        writer = vtk.vtkJPEGWriter()
+        writer.SetQuality(int(self.quality))
+        writer.WriteToMemoryOn()
+        writer.SetInputData(image)
+        writer.Write()
+        result = writer.GetResult()
+        return bytes(memoryview(result))
+
+
+class _StreamRequestHandler(BaseHTTPRequestHandler):
+    """
+    Serves the encoded frames of the StreamServer that owns the HTTP server.
+    Each request registers its own client in the fan-out hub; '?tier=<name>' selects the
+    quality tier (the default tier otherwise).
+    """
+
+    def log_message(self, format, *args):
+        # Keep the Slicer python console clean
+        pass
+
+    def setup(self):
+        super().setup()
+        # Small send buffer: frames for a slow viewer wait (and get dropped) in its queue
+        # instead of piling up, stale, in the socket buffer
+        self.connection.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, self.server.stream.sendBufferSize)
+
+    def do_GET(self):
+        stream = self.server.stream
+        url = urllib.parse.urlsplit(self.path)
+        tier = urllib.parse.parse_qs(url.query).get('tier', [None])[0]
+        if url.path == '/ack':
+            self._acknowledge(stream, urllib.parse.parse_qs(url.query))
+            return
+        if url.path == '/keyframe':
+            self._requestKeyframe(stream, urllib.parse.parse_qs(url.query))
+            return
+        if url.path == '/metrics':
+            self._sendMetrics(stream)
+            return
+        if url.path not in ('/stream.mjpg', '/frame.jpg'):
+            self.send_error(404)
+            return
+        try:
+            client = stream.hub.addClient(f'{self.client_address[0]}:{self.client_address[1]}', tier,
+                                          stream.clientQueueSize, device=self.client_address[0])
+        except KeyError:
+            self.send_error(404, f"Unknown tier {tier}")
+            return
+        try:
+            contentType = stream.contentTypeOf(client.tier)
+            if url.path == '/stream.mjpg':
+                self._sendStream(stream, client, contentType)
+            else:
+                self._sendFrame(stream, client, contentType)
+        except (BrokenPipeError, ConnectionResetError):
+            # The viewer closed the connection
+            pass
+        finally:
+            stream.hub.removeClient(client)
+
+    def _acknowledge(self, stream, query):
+        """
+        Function to record that a client displayed a frame.
+        """
+        try:
+            client = stream.hub.findClient(query['client'][0])
+            index = int(query['index'][0])
+        except (KeyError, ValueError):
+            self.send_error(400, "client and index are required")
+            return
+        sent = client.acknowledge(index) if client is not None else None
+        if sent is not None:
+            sentAt, size, timestamp = sent
+            stream.telemetry.observe('ack', time.time() - timestamp, client.device)
+            rtt = time.monotonic() - sentAt
+            stream.telemetry.observe('rtt', rtt, client.device)
+            if client.controller is not None:
+                client.controller.onAck(size, rtt)
+        self.send_response(204)
+        self.end_headers()
+
+    def _requestKeyframe(self, stream, query):
+        """
+        Function to send a full frame to a client of a stateful tier.
+        """
+        client = stream.hub.findClient(query.get('client', [''])[0])
+        if client is None:
+            self.send_error(404, "Unknown client")
+            return
+        stream.hub.requestKeyframe(client)
+        self.send_response(204)
+        self.end_headers()
+
+    def _sendMetrics(self, stream):
+        data = json.dumps(stream.telemetry.snapshot()).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _sendFrame(self, stream, client, contentType):
+        """
+        Function to send the next frame as a single image.
+        """
+        item = client.get(timeout=stream.clientTimeout)
+        if item is None:
+            self.send_error(503, "No frame available")
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', contentType)
+        self.send_header('Content-Length', str(len(item[1])))
+        self.end_headers()
+        self.wfile.write(item[1])
+
+    def _sendStream(self, stream, client, contentType):
+        """
+        Function to push every new frame to the client until it disconnects or the server stops.
+        """
+        self.send_response(200)
+        self.send_header('Cache-Control', 'no-cache, private')
+        self.send_header('Pragma', 'no-cache')
+        self.send_header('Content-Type', f'multipart/x-mixed-replace; boundary={BOUNDARY}')
+        self.send_header('X-Client-Id', client.name)
+        self.end_headers()
+        telemetry = stream.telemetry
+        while stream.isRunning and not client.closed:
+            item = client.get(timeout=stream.clientTimeout)
+            if item is None:
+                continue
+            index, data, timestamp = item
+            start = time.perf_counter()
+            self.wfile.write(f'--{BOUNDARY}\r\n'.encode())
+            self.wfile.write(f'Content-Type: {contentType}\r\n'.encode())
+            self.wfile.write(f'Content-Length: {len(data)}\r\n'.encode())
+            self.wfile.write(f'X-Frame-Index: {index}\r\n'.encode())
+            self.wfile.write(f'X-Timestamp: {timestamp:.6f}\r\n\r\n'.encode())
+            self.wfile.write(data)
+            self.wfile.write(b'\r\n')
+            client.markSent(index, len(data), timestamp)
+            if client.controller is not None:
+                client.controller.onFrameSent(len(data))
+            telemetry.observe('send', time.perf_counter() - start, client.device)
+            telemetry.increment('framesSent', client.device)
+            telemetry.addBytes(client.device, len(data))
+
+
+class StreamServer:
+    """
+    MJPEG over HTTP server for the frames published by the Qt main thread.
+    publish() only hands the raw frame over to a FanoutHub: encoding happens in a worker
+    thread (once per quality tier) and each viewer is served by its own thread with its own
+    bounded queue, so neither the GUI nor the other viewers wait for a slow viewer.
+    """
+
+    def __init__(self, host=LOCAL_HOST, port=8090, frameRate=15, quality=75, encoder=None, tiers=None,
+                 clientQueueSize=2, telemetry=None, rateLimits=None):
+        self.host = host
+        self.port = port
+        self.frameRate = frameRate
+        if tiers is None:
+            tiers = [Tier('full', encoder if encoder is not None else JPEGEncoder(quality))]
+        self.telemetry = telemetry if telemetry is not None else Telemetry()
+        # rateLimits (vCastSlicerLib.ratecontrol.RateLimits) enables the adaptation to each viewer
+        self.hub = FanoutHub(tiers, telemetry=self.telemetry, rateLimits=rateLimits)
+        # Frames queued per viewer before the oldest ones are dropped
+        self.clientQueueSize = clientQueueSize
+        # Bytes of the socket send buffer of every viewer
+        self.sendBufferSize = 256*1024
+        # Seconds a viewer waits for a new frame before checking if the server is still running
+        self.clientTimeout = 1.0
+        self._httpServer = None
+        self._thread = None
+        self._running = False
+
+    @property
+    def encoder(self):
+        return self.hub.tiers[self.hub.defaultTier].encoder
+
+    @property
+    def quality(self):
+        return getattr(self.encoder, 'quality', None)
+
+    @quality.setter
+    def quality(self, value):
+        if hasattr(self.encoder, 'quality'):
+            self.encoder.quality = value
+
+    @property
+    def isRunning(self):
+        return self._running
+
+    @property
+    def clientCount(self):
+        return self.hub.clientCount
+
+    @property
+    def url(self):
+        return f'http://{reachableHost(self.host)}:{self.port}/stream.mjpg'
+
+    def contentTypeOf(self, tier):
+        return getattr(self.hub.tiers[tier].encoder, 'contentType', 'image/jpeg')
+
+    def start(self):
+        """
+        Function to open the socket and start the encoder and HTTP threads.
+        """
+        if self._running:
+            return
+        self._httpServer = ThreadingHTTPServer((self.host, self.port), _StreamRequestHandler)
+        self._httpServer.daemon_threads = True
+        self._httpServer.stream = self
+        # Port 0 lets the OS choose a free port
+        self.port = self._httpServer.server_address[1]
+        self._running = True
+        self.hub.start()
+        self._thread = threading.Thread(target=self._httpServer.serve_forever, name='vCastHTTP', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Function to close the socket and wait for the background threads.
+        """
+        if not self._running:
+            return
+        self._running = False
+        self.hub.stop()
+        self._httpServer.shutdown()
+        self._httpServer.server_close()
+        self._thread.join(timeout=2.0)
+        self._thread = None
+        self._httpServer = None
+
+    def publish(self, frame, timestamp=None):
+        """
+        Function to hand over a new RGB frame. Returns immediately.
+        """
+        if self._running:
+            self.hub.publish(frame, timestamp)
+
+
+def iterStream(url, timeout=5.0, acknowledge=False):
+    """
+    Reference client: yields (index, timestamp, bytes) for every part of an MJPEG stream.
+    With acknowledge, each frame is acknowledged once the caller is done with it (asks for the next one).
+    """
+    import urllib.request
+    with urllib.request.urlopen(url, timeout=timeout) as response:
+        ackUrl = urllib.parse.urljoin(url, f"/ack?client={urllib.parse.quote(response.headers.get('X-Client-Id', ''))}")
+        while True:
+            line = response.readline()
+            if not line:
+                return
+            if line.strip() != f'--{BOUNDARY}'.encode():
+                continue
+            headers = {}
+            while True:
+                line = response.readline().strip()
+                if not line:
+                    break
+                name, _, value = line.decode().partition(':')
+                headers[name.strip().lower()] = value.strip()
+            data = response.read(int(headers['content-length']))
+            index = int(headers.get('x-frame-index', -1))
+            yield index, float(headers.get('x-timestamp', 0.0)), data
+            if acknowledge:
+                urllib.request.urlopen(f'{ackUrl}&index={index}', timeout=timeout).close()
+
+
+def readFrames(url, count, timeout=5.0):
+    """
+    Reads count parts from an MJPEG stream and returns them as a list of (index, bytes)
+    tuples. Used to check that frames arrive without a browser.
+    """
+    frames = []
+    for index, timestamp, data in iterStream(url, timeout):
+        frames.append((index, data))
+        if len(frames) == count:
+            break
+    return frames
@@ -0,0 +1,361 @@
+import bisect
+import collections
+import csv
+import io
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from vCastSlicerLib.network import LOCAL_HOST, reachableHost
+
+#
+# Performance telemetry of the casting pipeline.
+# Latencies (capture, encode, send, display acknowledgement) go to fixed-bucket histograms,
+# so recording a value is a binary search and an increment, whatever the number of values.
+# Counters (frames sent/dropped, restarts) and byte rates are kept per device. A snapshot of
+# everything can be shown in the widget, served on /metrics (by the stream server, or by a
+# MetricsServer whether streaming or not) or appended to a rolling file.
+#
+
+# Bucket upper bounds, in seconds: 0.1 ms to ~13 s, 4 buckets per doubling
+BUCKET_BOUNDS = tuple(0.0001*2**(i/4) for i in range(69))
+
+
+class LatencyHistogram:
+    """
+    Histogram of durations in seconds, with approximate percentiles.
+    """
+
+    def __init__(self, bounds=BUCKET_BOUNDS):
+        self.bounds = bounds
+        # Last bucket counts the values above the last bound
+        self.counts = [0]*(len(bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        bucket = bisect.bisect_left(self.bounds, seconds)
+        with self._lock:
+            self.counts[bucket] += 1
+            self.count += 1
+            self.total += seconds
+            if self.min is None or seconds < self.min:
+                self.min = seconds
+            if self.max is None or seconds > self.max:
+                self.max = seconds
+
+    def percentile(self, percent):
+        """
+        Function to get the upper bound of the bucket holding the given percentile (None if empty).
+        """
+        with self._lock:
+            if not self.count:
+                return None
+            rank = percent/100*self.count
+            seen = 0
+            for bucket, count in enumerate(self.counts):
+                seen += count
+                if seen >= rank and count:
+                    return min(self.bounds[bucket], self.max) if bucket < len(self.bounds) else self.max
+            return self.max
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'meanMs': 1000*self.total/self.count if self.count else None,
+            'p50Ms': _ms(self.percentile(50)),
+            'p95Ms': _ms(self.percentile(95)),
+            'p99Ms': _ms(self.percentile(99)),
+            'maxMs': _ms(self.max),
+        }
+
+
+def _ms(seconds):
+    return 1000*seconds if seconds is not None else None
+
+
+class RateMeter:
+    """
+    Sum of the values recorded in the last `window` seconds, in one-second slots.
+    """
+
+    def __init__(self, window=5, clock=time.monotonic):
+        self.window = window
+        self.total = 0
+        self._clock = clock
+        self._slots = collections.deque()
+        self._lock = threading.Lock()
+
+    def add(self, value):
+        second = int(self._clock())
+        with self._lock:
+            self.total += value
+            if self._slots and self._slots[-1][0] == second:
+                self._slots[-1][1] += value
+            else:
+                self._slots.append([second, value])
+                self._expire(second)
+
+    def perSecond(self):
+        second = int(self._clock())
+        with self._lock:
+            self._expire(second)
+            return sum(value for slot, value in self._slots if slot < second)/self.window
+
+    def _expire(self, second):
+        while self._slots and self._slots[0][0] < second - self.window:
+            self._slots.popleft()
+
+
+class Telemetry:
+    """
+    Registry of the histograms, counters and rates, optionally per device.
+    All the methods can be called from any thread.
+    """
+
+    def __init__(self, clock=time.monotonic):
+        self._clock = clock
+        self._histograms = {}
+        self._counters = collections.Counter()
+        self._rates = {}
+        self._lock = threading.Lock()
+        self.startTime = time.time()
+
+    def histogram(self, name, device=None):
+        key = (name, device)
+        histogram = self._histograms.get(key)
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.setdefault(key, LatencyHistogram())
+        return histogram
+
+    def observe(self, name, seconds, device=None):
+        """
+        Function to record a duration (e.g. observe('encode', 0.004, 'full')).
+        """
+        self.histogram(name, device).record(seconds)
+
+    def increment(self, name, device=None, value=1):
+        with self._lock:
+            self._counters[(name, device)] += value
+
+    def addBytes(self, device, count):
+        rate = self._rates.get(device)
+        if rate is None:
+            with self._lock:
+                rate = self._rates.setdefault(device, RateMeter(clock=self._clock))
+        rate.add(count)
+
+    def counter(self, name, device=None):
+        with self._lock:
+            return self._counters[(name, device)]
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+            self._rates.clear()
+        self.startTime = time.time()
+
+    def snapshot(self):
+        """
+        Function to get all the values as a JSON-serializable dictionary.
+        """
+        with self._lock:
+            histograms = dict(self._histograms)
+            counters = dict(self._counters)
+            rates = dict(self._rates)
+        devices = collections.defaultdict(dict)
+        latencies = {}
+        for (name, device), histogram in sorted(histograms.items(), key=lambda item: str(item[0])):
+            if device is None:
+                latencies[name] = histogram.summary()
+            else:
+                devices[device].setdefault('latencies', {})[name] = histogram.summary()
+        totals = {}
+        for (name, device), value in counters.items():
+            if device is None:
+                totals[name] = value
+            else:
+                devices[device][name] = value
+        for device, rate in rates.items():
+            devices[device]['bytes'] = rate.total
+            devices[device]['bytesPerSecond'] = rate.perSecond()
+        return {'time': time.time(), 'uptime': time.time() - self.startTime, 'latencies': latencies,
+                'counters': totals, 'devices': dict(devices)}
+
+
+def formatSnapshot(snapshot):
+    """
+    Function to turn a snapshot into a few lines of text (for the module panel).
+    """
+    def latency(summary):
+        if not summary['count']:
+            return '-'
+        return f"p50 {summary['p50Ms']:.1f} / p95 {summary['p95Ms']:.1f} ms"
+
+    lines = [f"{name}: {latency(summary)}" for name, summary in snapshot['latencies'].items()]
+    lines += [f"{name}: {value}" for name, value in sorted(snapshot['counters'].items())]
+    for device, values in sorted(snapshot['devices'].items()):
+        line = f"{device}: {values.get('framesSent', 0)} sent, {values.get('framesDropped', 0)} dropped"
+        if 'bytesPerSecond' in values:
+            line += f", {values['bytesPerSecond']/1e6:.2f} MB/s"
+        ack = values.get('latencies', {}).get('ack')
+        if ack is not None:
+            line += f", ack {latency(ack)}"
+        lines.append(line)
+    return '\n'.join(lines) if lines else 'No data yet'
+
+
+def snapshotRows(snapshot):
+    """
+    Function to flatten a snapshot into (time, device, metric, value) rows (for CSV).
+    """
+    rows = []
+    for name, summary in snapshot['latencies'].items():
+        rows += [(snapshot['time'], '', f'{name}.{key}', value) for key, value in summary.items()]
+    rows += [(snapshot['time'], '', name, value) for name, value in snapshot['counters'].items()]
+    for device, values in snapshot['devices'].items():
+        for name, value in values.items():
+            if name == 'latencies':
+                for latencyName, summary in value.items():
+                    rows += [(snapshot['time'], device, f'{latencyName}.{key}', v) for key, v in summary.items()]
+            else:
+                rows.append((snapshot['time'], device, name, value))
+    return rows
+
+
+class TelemetryExporter:
+    """
+    Appends a snapshot every `interval` seconds to a JSON-lines or CSV file from a background
+    thread. The file is rolled over (path.1, path.2...) when it gets bigger than maxBytes.
+    """
+
+    def __init__(self, telemetry, path, interval=5.0, maxBytes=1024*1024, backupCount=3):
+        self.telemetry = telemetry
+        self.path = path
+        self.format = 'csv' if path.endswith('.csv') else 'json'
+        self.interval = interval
+        self.maxBytes = maxBytes
+        self.backupCount = backupCount
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='vCastTelemetry', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join(timeout=2.0)
+        self._thread = None
+        # Last values, so that short sessions are exported too
+        self.export()
+
+    def export(self):
+        """
+        Function to append the current snapshot to the file.
+        """
+        snapshot = self.telemetry.snapshot()
+        if self.format == 'csv':
+            text = io.StringIO()
+            csv.writer(text, lineterminator='\n').writerows(snapshotRows(snapshot))
+            data = text.getvalue()
+        else:
+            data = json.dumps(snapshot) + '\n'
+        self._rollover(len(data))
+        if self.format == 'csv' and (not os.path.exists(self.path) or os.path.getsize(self.path) == 0):
+            # Every file of the rotation starts with the header
+            data = 'time,device,metric,value\n' + data
+        with open(self.path, 'a') as f:
+            f.write(data)
+
+    def _rollover(self, size):
+        if not os.path.exists(self.path) or os.path.getsize(self.path) + size <= self.maxBytes:
+            return
+        for i in range(self.backupCount - 1, 0, -1):
+            if os.path.exists(f'{self.path}.{i}'):
+                os.replace(f'{self.path}.{i}', f'{self.path}.{i + 1}')
+        if self.backupCount:
+            os.replace(self.path, f'{self.path}.1')
+        else:
+            os.remove(self.path)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.export()
+            except OSError:
+                # Disk full or file locked: try again at the next interval
+                pass
+
+
+class _MetricsRequestHandler(BaseHTTPRequestHandler):
+    """
+    Serves the snapshot of the telemetry of the MetricsServer as JSON on /metrics.
+    """
+
+    def log_message(self, format, *args):
+        # Keep the Slicer python console clean
+        pass
+
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        data = json.dumps(self.server.telemetry.snapshot()).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class MetricsServer:
+    """
+    HTTP server of /metrics alone, so that the measurements (e.g. of the vCastSender
+    supervisor and the capture) can be collected while nothing is streamed.
+    """
+
+    def __init__(self, telemetry, host=LOCAL_HOST, port=8092):
+        self.telemetry = telemetry
+        self.host = host
+        self.port = port
+        self._httpServer = None
+        self._thread = None
+
+    @property
+    def url(self):
+        return f'http://{reachableHost(self.host)}:{self.port}/metrics'
+
+    def start(self):
+        """
+        Function to open the socket (OSError if the port is taken) and serve from a background thread.
+        """
+        if self._httpServer is not None:
+            return
+        self._httpServer = ThreadingHTTPServer((self.host, self.port), _MetricsRequestHandler)
+        self._httpServer.daemon_threads = True
+        self._httpServer.telemetry = self.telemetry
+        # Port 0 lets the OS choose a free port
+        self.port = self._httpServer.server_address[1]
+        self._thread = threading.Thread(target=self._httpServer.serve_forever, name='vCastMetrics', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._httpServer is None:
+            return
+        self._httpServer.shutdown()
+        self._httpServer.server_close()
+        self._thread.join(timeout=2.0)
+        self._httpServer = None
+        self._thread = None
@@ -0,0 +1,108 @@
+import json
+import os
+import re
+import numpy
+
+#
+# Labeling of SEEG contacts with the brain zone (parcel) they are in.
+# All the contacts are converted from RAS to IJK with a single matrix product and the label
+# volume is sampled with one fancy-indexing pass. Label values are then turned into names
+# through lookup arrays indexed by the label value, so there is no per-point Python code.
+#
+# Zone names come from Resources/parc_shortnames.json and parc_fullnames.json, which hold,
+# for each atlas (parc2009, parc68, subCtx), the list of names in the same order. The label
+# values are found by matching these names with the color table of the label volume
+# (e.g. 'ctx_lh_G_cuneus', 'ctx-rh-insula' or 'Left-Hippocampus' in FreeSurferColorLUT).
+#
+
+ATLASES = ('parc2009', 'parc68', 'subCtx')
+# Names of the zone tables that differ from the FreeSurfer color names
+ALIASES = {
+    'White-Matter': ('Cerebral-White-Matter', 'White-Matter'),
+    'Talamus': ('Thalamus', 'Thalamus-Proper'),
+}
+# Hemisphere prefixes of the FreeSurfer color names
+HEMISPHERE_PATTERN = re.compile(r'^(?:ctx[_-](lh|rh)[_-]|(Left|Right)-)')
+# Returned for the contacts outside of the volume or in unlabeled voxels
+UNKNOWN = ('', '')
+
+
+def loadZoneNames(resourcesDir):
+    """
+    Function to read the zone tables. Returns {atlas: [(shortName, fullName), ...]}.
+    """
+    with open(os.path.join(resourcesDir, 'parc_shortnames.json')) as f:
+        shortNames = json.load(f)
+    with open(os.path.join(resourcesDir, 'parc_fullnames.json')) as f:
+        fullNames = json.load(f)
+    return {atlas: list(zip(shortNames[atlas], fullNames[atlas])) for atlas in ATLASES}
+
+
+def labelTable(colorNames, zoneNames, atlases=ATLASES):
+    """
+    Function to match the color names of a label volume ({labelValue: colorName}) with the
+    zone tables. Returns {labelValue: (shortName, fullName)} for the matched labels; the
+    hemisphere is added to the short names ('L ' or 'R ').
+    """
+    byName = {}
+    for atlas in atlases:
+        for shortName, fullName in zoneNames[atlas]:
+            for name in ALIASES.get(fullName, (fullName,)):
+                byName.setdefault(name.lower(), (shortName, fullName))
+    table = {}
+    for value, colorName in colorNames.items():
+        match = HEMISPHERE_PATTERN.match(colorName)
+        hemisphere = ''
+        if match:
+            hemisphere = 'L ' if (match.group(1) or match.group(2)) in ('lh', 'Left') else 'R '
+            colorName = colorName[match.end():]
+        names = byName.get(colorName.lower())
+        if names is not None:
+            table[value] = (hemisphere + names[0], names[1])
+    return table
+
+
+class ZoneLabeler:
+    """
+    Vectorized lookup of the zone of many RAS points in a label volume.
+    """
+
+    def __init__(self, labels, rasToIjk, table):
+        """
+        labels: label volume as a (k, j, i) array (as returned by slicer.util.arrayFromVolume).
+        rasToIjk: 4x4 matrix from RAS (world) coordinates to voxel indices.
+        table: {labelValue: (shortName, fullName)}, see labelTable.
+        """
+        self.labels = labels
+        self.rasToIjk = numpy.asarray(rasToIjk, dtype=numpy.float64).reshape(4, 4)
+        # Row 0 of the name arrays is UNKNOWN; _rows maps a label value to its row
+        values = sorted(value for value in table if value >= 0)
+        size = max(int(labels.max()) if labels.size else 0, values[-1] if values else 0) + 1
+        self._rows = numpy.zeros(size, dtype=numpy.intp)
+        self._rows[values] = numpy.arange(1, len(values) + 1)
+        self.shortNames = numpy.array([UNKNOWN[0]] + [table[value][0] for value in values], dtype=object)
+        self.fullNames = numpy.array([UNKNOWN[1]] + [table[value][1] for value in values], dtype=object)
+
+    def labelValues(self, points):
+        """
+        Function to get the label value at each (x, y, z) RAS point, -1 outside of the volume.
+        """
+        points = numpy.asarray(points, dtype=numpy.float64).reshape(-1, 3)
+        ijk = numpy.rint(points @ self.rasToIjk[:3, :3].T + self.rasToIjk[:3, 3]).astype(numpy.intp)
+        # The array is indexed (k, j, i)
+        shape = numpy.array(self.labels.shape[::-1])
+        inside = numpy.all((ijk >= 0) & (ijk < shape), axis=1)
+        values = numpy.full(len(points), -1, dtype=numpy.int64)
+        i, j, k = ijk[inside].T
+        values[inside] = self.labels[k, j, i]
+        return values
+
+    def classify(self, points):
+        """
+        Function to get the short and full zone names of each RAS point, as two arrays.
+        """
+        values = self.labelValues(points)
+        known = (values >= 0) & (values < len(self._rows))
+        rows = numpy.zeros(len(values), dtype=numpy.intp)
+        rows[known] = self._rows[values[known]]
+        return self.shortNames[rows], self.fullNames[rows]